@@ -1,4 +1,7 @@
 import streamlit as st
+import time
+from utils.config_loader import show_prompt_validation_report
+from utils.project_store import PROJECT_ID_KEY, SAVED_DIGESTS_KEY, get_project_store, restore_project
 
 # Set wide layout by default
 st.set_page_config(layout="wide", page_title="YouTube 脚本工具")
@@ -6,8 +9,8 @@ st.set_page_config(layout="wide", page_title="YouTube 脚本工具")
 st.sidebar.title("导航")
 
 # --- Function to clear project-specific session state ---
-def clear_project_data():
-    """Clears all project-related data from session_state, preserving API config."""
+def clear_session_project_state():
+    """Deletes all project-related keys from session_state, preserving API config."""
     keys_to_preserve = ["api_config", "user_logged_in"] # Add other global keys if any
     
     # Create a list of keys to delete to avoid issues with modifying dict during iteration
@@ -15,12 +18,61 @@ def clear_project_data():
     
     for key in keys_to_delete:
         del st.session_state[key]
+
+def clear_project_data():
+    """Clears all project-related data from session_state, preserving API config. The saved project stays in the archive."""
+    clear_session_project_state()
     st.success("项目数据已清除！您可以开始一个新任务了。")
     # Optionally, navigate to the first page or refresh
     # st.switch_page("pages/01_📝_大纲生成.py") # This causes issues if called directly in callback sometimes
     # A simple rerun might be enough, or let user navigate.
     st.rerun()
 
+def resume_project(project_id: str):
+    """Replaces the session's project with a saved one."""
+    clear_session_project_state()
+    if restore_project(st.session_state, project_id):
+        st.toast("项目已恢复，可从左侧导航栏继续之前的步骤。")
+    else:
+        st.toast("该项目没有已保存的内容。")
+    st.rerun()
+
+def show_project_picker():
+    """Lists the autosaved projects and resumes or deletes the selected one."""
+    st.subheader("📂 项目存档")
+    st.caption("各步骤的结果（大纲、口播稿、分镜、元数据、提示词、报告及请求记录）会在每次改动后自动保存到本地，服务重启或刷新页面后可在此恢复。")
+    projects = get_project_store().list_projects()
+    if not projects:
+        st.info("尚无已保存的项目。开始生成内容后将自动保存。")
+        return
+
+    current_project_id = st.session_state.get(PROJECT_ID_KEY)
+    labels = {
+        project.project_id: f"{project.name} · {time.strftime('%Y-%m-%d %H:%M', time.localtime(project.updated_at))}"
+                            f" · {project.stored_bytes / 1024:.1f} KB" + ("（当前项目）" if project.project_id == current_project_id else "")
+        for project in projects
+    }
+    project_ids = list(labels)
+    selected_project_id = st.selectbox(
+        "选择项目:", options=project_ids, format_func=labels.get, key="project_picker",
+        index=project_ids.index(current_project_id) if current_project_id in labels else 0
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("▶️ 恢复此项目", key="resume_project_button", use_container_width=True, type="primary",
+                     disabled=selected_project_id == current_project_id):
+            resume_project(selected_project_id)
+    with col2:
+        if st.button("🗑️ 删除此项目", key="delete_project_button", use_container_width=True):
+            get_project_store().delete_project(selected_project_id)
+            if selected_project_id == current_project_id:
+                # The session's data is kept and autosaved into a new project on the next change
+                st.session_state.pop(PROJECT_ID_KEY, None)
+                st.session_state.pop(SAVED_DIGESTS_KEY, None)
+            st.session_state.pop("project_picker", None)
+            st.toast("项目已删除。")
+            st.rerun()
+
 
 # --- Sidebar Navigation ---
 # Using st.page_link for Streamlit 1.30+ style navigation
@@ -35,7 +87,8 @@ PAGES = {
     "分镜脚本": {"path": "pages/03_🎬_分镜脚本.py", "icon": "🎬"},
     "视频元数据": {"path": "pages/04_ℹ️_视频元数据.py", "icon": "ℹ️"},
     "图生视频提示词": {"path": "pages/05_🖼️_图生视频提示词.py", "icon": "🖼️"},
-    "多语言翻译": {"path": "pages/06_🌍_多语言翻译.py", "icon": "🌍"}
+    "多语言翻译": {"path": "pages/06_🌍_多语言翻译.py", "icon": "🌍"},
+    "性能指标": {"path": "pages/07_📊_性能指标.py", "icon": "📊"}
 }
 
 # Display page links in the sidebar
@@ -62,11 +115,15 @@ st.markdown("""
 5.  **ℹ️ 视频元数据**: 为您的视频生成多个备选标题、详细描述、缩略图AI提示词及缩略图文字。
 6.  **🖼️ 图生视频提示词**: (多模态) 上传参考图和画面描述，生成图生视频的英文提示词。
 7.  **🌍 多语言翻译**: 将口播稿、标题、描述等批量翻译成多种语言，并导出MD文件。
+8.  **📊 性能指标**: 查看各任务的调用耗时、首字延迟分位数、Token 用量与错误统计，并导出 Prometheus 指标。
 
 ---
-*您可以在任何时候点击侧边栏底部的“清除项目数据并开始新任务”按钮来重置当前项目的所有中间结果（API配置将保留）。*
+*您可以在任何时候点击侧边栏底部的“清除项目数据并开始新任务”按钮来重置当前项目的所有中间结果（API配置将保留，已保存的项目仍可在下方项目存档中恢复）。*
 """)
 
+st.divider()
+show_project_picker()
+
 # Initialize API config in session state if it doesn't exist
 if "api_config" not in st.session_state:
     st.session_state.api_config = {
@@ -77,6 +134,9 @@ if "api_config" not in st.session_state:
         "configured": False
     }
 
+# Surface prompts.yaml template problems at startup instead of at generation time
+show_prompt_validation_report()
+
 # Simple check to guide user if API is not configured on the main page
 if not st.session_state.api_config.get("configured", False):
     st.warning("提醒：您尚未配置 API。请先前往“API 配置”页面进行设置，以便使用各项 AI 功能。")
@@ -0,0 +1,132 @@
+"""
+Headless batch runner: generates outline, script, storyboard, metadata and multilingual
+MD reports for every topic in a JSONL file, without the Streamlit UI.
+
+Example:
+    python batch_pipeline.py topics.jsonl --provider "OpenAI API" --model gpt-4o \
+        --output-dir output --topic-workers 4
+
+Each input line is a JSON object such as
+    {"id": "black-holes", "topic": "黑洞是如何形成的", "word_count": 1500, "languages": ["English", "Japanese"]}
+Artifacts are written to <output-dir>/<id>/; re-running the same command resumes
+unfinished topics and reuses the stages that already completed.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from utils.async_core import DEFAULT_PROVIDER_CONCURRENCY
+from utils.core import ConfigError, read_yaml_config
+from utils.metrics import write_prometheus_textfile
+from utils.pipeline import ProviderSettings, load_topic_jobs, run_batch
+from utils.prompt_index import SEVERITY_ERROR, PromptIndex, format_issue
+from utils.rate_limiter import configure_rate_limits, register_provider_rate_limits
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批量运行 YouTube 脚本生成流程 (无界面)。")
+    parser.add_argument("topics_file", help="JSONL 文件，每行一个主题。")
+    parser.add_argument("--provider", help="prompts.yaml 中的提供商名称 (默认: 第一个)。")
+    parser.add_argument("--model", help="模型名称 (默认: 该提供商的第一个模型)。")
+    parser.add_argument("--base-url", help="覆盖提供商的 base_url_template。")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", ""),
+                        help="API Key (默认读取环境变量 OPENAI_API_KEY)。")
+    parser.add_argument("--output-dir", default="output", help="产出目录 (默认: output)。")
+    parser.add_argument("--topic-workers", type=int, default=2, help="同时处理的主题数 (默认: 2)。")
+    parser.add_argument("--language-workers", type=int, default=3, help="每个主题同时翻译的语言数 (默认: 3)。")
+    parser.add_argument("--max-concurrent-requests", type=int,
+                        help="所有主题合计同时进行的 API 请求数上限 (默认: 提供商的 max_concurrent_requests)。")
+    parser.add_argument("--with-scoring", action="store_true", help="同时运行大纲/口播稿 AI 评分。")
+    parser.add_argument("--single-request-translation", action="store_true",
+                        help="每种语言用一次请求由 AI 生成完整报告 (默认: 按场景分批并发翻译，本地组装报告)。")
+    parser.add_argument("--no-translation-memory", action="store_true",
+                        help="不复用翻译记忆，重新翻译所有场景 (默认: 原文未改动的场景直接复用已有译文)。")
+    parser.add_argument("--no-structured-output", action="store_true",
+                        help="不使用 JSON Schema 结构化输出，分镜与元数据按 Markdown 解析 (默认: 提供商声明 structured_output 时启用)。")
+    parser.add_argument("--no-resume", action="store_true", help="忽略已有产出，全部重新生成。")
+    return parser.parse_args(argv)
+
+
+def resolve_provider(args, config: dict) -> ProviderSettings:
+    provider_configs = config.get("available_model_providers") or []
+    if not provider_configs:
+        sys.exit("错误：未能加载模型提供商配置。请检查 prompts.yaml 文件。")
+    if args.provider:
+        provider = next((p for p in provider_configs if p["provider_name"] == args.provider), None)
+        if provider is None:
+            names = ", ".join(p["provider_name"] for p in provider_configs)
+            sys.exit(f"错误：未知的提供商 '{args.provider}'。可选: {names}")
+    else:
+        provider = provider_configs[0]
+
+    model = args.model or (provider.get("models") or [None])[0]
+    base_url = args.base_url or provider.get("base_url_template", "")
+    if not args.api_key:
+        sys.exit("错误：请通过 --api-key 或环境变量 OPENAI_API_KEY 提供 API Key。")
+    if not model or not base_url:
+        sys.exit("错误：未能确定模型或 Base URL，请使用 --model / --base-url 指定。")
+    configure_rate_limits(provider_configs)
+    register_provider_rate_limits(base_url, provider) # --base-url keeps the provider's rate limits
+    max_concurrent_requests = args.max_concurrent_requests or provider.get("max_concurrent_requests") or DEFAULT_PROVIDER_CONCURRENCY
+    return ProviderSettings(api_key=args.api_key, base_url=base_url, model=model,
+                            max_concurrent_requests=int(max_concurrent_requests),
+                            structured_output=bool(provider.get("structured_output")) and not args.no_structured_output)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        config = read_yaml_config()
+    except ConfigError as e:
+        sys.exit(str(e))
+    provider = resolve_provider(args, config)
+    prompts_config = PromptIndex(config.get("prompts") or {})
+    if not prompts_config:
+        sys.exit("错误：未能加载 prompts.yaml 中的提示词配置。")
+    prompt_errors = []
+    for issue in prompts_config.validate():
+        if issue.severity == SEVERITY_ERROR:
+            prompt_errors.append(format_issue(issue))
+        else:
+            logging.warning("prompts.yaml: %s", format_issue(issue))
+    if prompt_errors:
+        sys.exit("错误：prompts.yaml 校验失败：\n" + "\n".join(prompt_errors))
+    try:
+        jobs = load_topic_jobs(args.topics_file)
+    except ValueError as e: # Also covers invalid JSON lines
+        sys.exit(f"错误：{e}")
+    logging.info("共 %d 个主题，模型 %s (%s)，最多 %d 个并发请求",
+                 len(jobs), provider.model, provider.base_url, provider.max_concurrent_requests)
+
+    run_started_at = time.time()
+    summaries = run_batch(
+        jobs, provider, prompts_config, args.output_dir,
+        topic_workers=args.topic_workers,
+        language_workers=args.language_workers,
+        with_scoring=args.with_scoring,
+        scene_batched_translation=not args.single_request_translation,
+        use_translation_memory=not args.no_translation_memory,
+        resume=not args.no_resume,
+        on_topic_done=lambda summary: logging.info("主题 %s: %s", summary["id"], summary["status"])
+    )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "run_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summaries, f, ensure_ascii=False, indent=2)
+    # Per-task latency/token metrics of this run, in the Prometheus text format
+    write_prometheus_textfile(os.path.join(args.output_dir, "metrics.prom"), since=run_started_at)
+
+    failed = [summary["id"] for summary in summaries if summary["status"] != "ok"]
+    if failed:
+        logging.warning("%d/%d 个主题未全部完成: %s", len(failed), len(summaries), ", ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+Offline latency and throughput benchmark of the generation stages and the batch pipeline.
+
+Everything runs against `mock_openai_server.MockOpenAIServer` on localhost, so no tokens
+are spent and no network is needed. Each stage (outline, script, storyboard, storyboard
+parsing, metadata, scene-batch translation, image prompts) sends `--requests` requests
+through `utils.async_core.run_chat_completions` with `--concurrency` in flight, the same
+path the pages use; `translation_cached` repeats the translation requests with the
+response cache enabled, and `pipeline` runs `utils.pipeline.run_batch` for `--topics`
+topics end to end.
+
+Per case it reports throughput (requests/s; rows/s for parsing; topics/s for the
+pipeline), p50/p95 latency and the mock server's peak concurrency. Throughput is compared
+with benchmarks/baselines/pipeline.json when it was recorded with the same mock
+settings; the script exits with status 1 if any case is slower than the baseline by
+more than `--tolerance`, or if any request failed without injected errors.
+
+The run uses a temporary working directory, so the response cache, metrics database and
+translation memory in .cache/ are left untouched.
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --concurrency 16 --rate-limit-rate 0.05
+    python benchmarks/bench_pipeline.py --update-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from mock_openai_server import MockOpenAIServer, MockSettings  # noqa: E402
+from utils.async_core import run_chat_completions  # noqa: E402
+from utils.core import PROMPTS_FILE, LLMResult, read_yaml_config, resolve_prompt  # noqa: E402
+from utils.parsing_utils import parse_markdown_table_to_df  # noqa: E402
+from utils.pipeline import ProviderSettings, TopicJob, run_batch  # noqa: E402
+from utils.prompt_index import compile_prompts  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baselines", "pipeline.json")
+DEFAULT_TOLERANCE = 0.3 # Allowed slowdown vs. the baseline before the run fails
+UNGATED_CASES = {"translation_cached"} # Microseconds per request, too noisy to gate; checked for cache hits instead
+MODEL = "mock-model"
+API_KEY = "mock-key"
+
+# 1x1 PNG: image prompts are multimodal requests
+_TINY_PNG_BASE64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+
+_SAMPLE_OUTLINE = "# 视频大纲\n\n" + "\n".join(f"## 第{i}部分\n- 要点 {i}.1\n- 要点 {i}.2" for i in range(1, 7))
+_SAMPLE_SCRIPT = "\n\n".join(
+    "".join(f"这是第{part}部分的第{sentence}句口播文案，内容紧扣主题并保持口语化。" for sentence in range(1, 6))
+    for part in range(1, 7)
+)
+_SAMPLE_SCENES_JSON = json.dumps(
+    [{"scene_number": str(index), "chinese_narration": f"这是第{index}个场景的口播文案，讲述一个关键的发现。"} for index in range(1, 16)],
+    ensure_ascii=False, indent=2
+)
+
+# case name -> (task, variables for request i, extra chat_completion arguments)
+_STAGES: Dict[str, Any] = {
+    "outline": ("outline_generation", lambda i: {"topic": f"基准测试主题 {i}"}, {}),
+    "script": ("script_generation", lambda i: {"outline": _SAMPLE_OUTLINE, "word_count": 1000}, {}),
+    "storyboard": ("storyboard_generation", lambda i: {"script_content": f"{_SAMPLE_SCRIPT}\n\n（版本 {i}）"}, {}),
+    "metadata": ("video_metadata_generation", lambda i: {"storyboard_summary_or_full_script": _SAMPLE_SCRIPT}, {}),
+    "translation": ("translate_scene_batch", lambda i: {"target_language": f"Language {i}", "scenes_json": _SAMPLE_SCENES_JSON}, {}),
+    "image_prompts": ("image_to_video_prompt_generation", lambda i: {"scene_description": f"画面 {i}：黄昏时分的城市天际线"},
+                      {"image_data_base64": _TINY_PNG_BASE64, "image_media_type": "image/png"}),
+}
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def build_requests(prompts, base_url: str, task_name: str, variables: Callable[[int], Dict[str, Any]],
+                   extra: Dict[str, Any], count: int, cache_ttl_hours: Optional[float] = None) -> Dict[int, Dict[str, Any]]:
+    requests = {}
+    for index in range(count):
+        prompt = resolve_prompt(task_name, MODEL, prompts, variables(index))
+        if not prompt.ok:
+            raise SystemExit(f"错误：无法准备任务 {task_name} 的提示词：{prompt.error}")
+        params = prompt.parameters or {}
+        requests[index] = dict(
+            api_key=API_KEY, base_url=base_url, model=MODEL,
+            system_message=prompt.system_message, user_message_text=prompt.user_message_text,
+            temperature=params.get("temperature", 0.7), max_tokens=params.get("max_tokens", 2000),
+            cache_ttl_hours=cache_ttl_hours, task_name=task_name, **extra
+        )
+    return requests
+
+
+def run_requests(server: MockOpenAIServer, requests: Dict[int, Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    """Sends the requests concurrently and returns wall time, latency percentiles and outcome counts."""
+    server.reset_stats()
+    started_at = time.perf_counter()
+    results: Dict[int, LLMResult] = run_chat_completions(requests, max_concurrency=concurrency)
+    seconds = time.perf_counter() - started_at
+    latencies = [result.latency for result in results.values() if result.ok and not result.cache_hit]
+    return {
+        "count": len(requests),
+        "seconds": seconds,
+        "throughput": len(requests) / seconds if seconds else 0.0,
+        "p50_latency": _percentile(latencies, 0.5),
+        "p95_latency": _percentile(latencies, 0.95),
+        "errors": sum(1 for result in results.values() if not result.ok),
+        "retries": sum(result.retries or 0 for result in results.values()),
+        "cache_hits": sum(1 for result in results.values() if result.cache_hit),
+        "peak_in_flight": server.stats()["peak_in_flight"],
+        "contents": [results[index].content for index in sorted(results) if results[index].ok],
+    }
+
+
+def _timed(function: Callable[[], Any]) -> float:
+    started_at = time.perf_counter()
+    function()
+    return time.perf_counter() - started_at
+
+
+def measure_parsing(contents: List[str], repeat: int = 3) -> Dict[str, Any]:
+    """Parses every storyboard response; throughput is rows/s (best of `repeat`)."""
+    rows = sum(len(parse_markdown_table_to_df(content)) for content in contents)
+    best = min(_timed(lambda: [parse_markdown_table_to_df(content) for content in contents]) for _ in range(repeat))
+    return {"count": rows, "seconds": best, "throughput": rows / best if best else 0.0, "errors": 0 if rows else 1}
+
+
+def measure_pipeline(server: MockOpenAIServer, prompts, topics: int, languages: int, concurrency: int, output_dir: str) -> Dict[str, Any]:
+    jobs = [TopicJob(topic_id=f"topic_{index:03d}", topic=f"基准测试主题 {index}", word_count=1000,
+                     languages=[f"Language {n}" for n in range(languages)]) for index in range(topics)]
+    provider = ProviderSettings(api_key=API_KEY, base_url=server.base_url, model=MODEL, max_concurrent_requests=concurrency)
+    server.reset_stats()
+    started_at = time.perf_counter()
+    summaries = run_batch(jobs, provider, prompts, output_dir, topic_workers=topics, language_workers=languages, resume=False)
+    seconds = time.perf_counter() - started_at
+    stage_seconds: Dict[str, List[float]] = {}
+    for summary in summaries:
+        for stage_name, stage in (summary.get("stages") or {}).items():
+            stage_seconds.setdefault(stage_name.split("_")[0], []).append(stage["seconds"])
+    return {
+        "count": topics,
+        "seconds": seconds,
+        "throughput": topics / seconds if seconds else 0.0,
+        "errors": sum(1 for summary in summaries if summary.get("status") != "ok"),
+        "peak_in_flight": server.stats()["peak_in_flight"],
+        "requests": server.stats()["counts"].get("requests", 0),
+        "stage_mean_seconds": {name: statistics.mean(values) for name, values in stage_seconds.items()},
+    }
+
+
+def run_benchmarks(args, prompts) -> Dict[str, Dict[str, Any]]:
+    settings = MockSettings(latency=args.latency, tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+                            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, seed=args.seed)
+    results: Dict[str, Dict[str, Any]] = {}
+    with MockOpenAIServer(settings) as server:
+        for case, (task_name, variables, extra) in _STAGES.items():
+            results[case] = run_requests(server, build_requests(prompts, server.base_url, task_name, variables, extra, args.requests),
+                                         args.concurrency)
+            if case == "storyboard":
+                results["storyboard_parse"] = measure_parsing(results[case]["contents"])
+
+        # The same translation requests twice with the response cache on: the second pass must not reach the server
+        task_name, variables, extra = _STAGES["translation"]
+        cached_requests = build_requests(prompts, server.base_url, task_name, variables, extra, args.requests, cache_ttl_hours=1)
+        run_requests(server, cached_requests, args.concurrency)
+        results["translation_cached"] = run_requests(server, cached_requests, args.concurrency)
+
+        results["pipeline"] = measure_pipeline(server, prompts, args.topics, args.languages, args.concurrency,
+                                               os.path.join(os.getcwd(), "pipeline_output"))
+    for result in results.values():
+        result.pop("contents", None)
+    return results
+
+
+def mock_settings_key(args) -> Dict[str, Any]:
+    """The settings a baseline is only comparable under."""
+    return {name: getattr(args, name) for name in
+            ("requests", "concurrency", "topics", "languages", "latency", "tokens_per_second", "error_rate", "rate_limit_rate")}
+
+
+def compare_with_baseline(results: Dict[str, Dict[str, Any]], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if name not in UNGATED_CASES and reference and result["throughput"] < reference * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput']:,.1f}/s, baseline {reference:,.1f}/s "
+                               f"({result['throughput'] / reference - 1:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="基于本地模拟服务的各阶段与批量流程延迟/吞吐量基准测试 (离线，不消耗 Token)。")
+    parser.add_argument("--requests", type=int, default=24, help="每个阶段发送的请求数 (默认: 24)。")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的请求数上限 (默认: 8)。")
+    parser.add_argument("--topics", type=int, default=3, help="端到端流程的主题数 (默认: 3)。")
+    parser.add_argument("--languages", type=int, default=2, help="每个主题翻译的语言数 (默认: 2)。")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟首字延迟 (秒，默认: 0.05)。")
+    parser.add_argument("--tokens-per-second", type=float, default=4000.0, help="模拟生成速度 (默认: 4000)。")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟 500 错误的概率 (默认: 0)。")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="模拟 429 的概率 (默认: 0)。")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="429 响应的 Retry-After 秒数 (默认: 0.2)。")
+    parser.add_argument("--seed", type=int, default=1, help="错误注入的随机种子 (默认: 1)。")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"相对基线允许的最大性能下降比例 (默认: {DEFAULT_TOLERANCE})。")
+    parser.add_argument("--update-baseline", action="store_true", help="将本次结果写入基线文件。")
+    parser.add_argument("--output", help="将本次结果另存为 JSON 文件。")
+    args = parser.parse_args(argv)
+
+    config = read_yaml_config(os.path.join(REPO_ROOT, PROMPTS_FILE))
+    prompts = compile_prompts(config.get("prompts") or {})
+    output_path = os.path.abspath(args.output) if args.output else None
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    previous_dir = os.getcwd()
+    os.chdir(work_dir) # .cache/ (response cache, metrics, translation memory) is created here
+    try:
+        results = run_benchmarks(args, prompts)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'case':<20}{'n':>6}{'seconds':>10}{'throughput':>13}{'p50 ms':>9}{'p95 ms':>9}{'peak':>6}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<20}{result['count']:>6}{result['seconds']:>10.3f}{result['throughput']:>13,.1f}"
+              f"{result.get('p50_latency', 0) * 1000:>9.0f}{result.get('p95_latency', 0) * 1000:>9.0f}"
+              f"{result.get('peak_in_flight', 0):>6}{result['errors']:>8}")
+    print(f"translation_cached: {results['translation_cached']['cache_hits']}/{results['translation_cached']['count']} 命中缓存；"
+          f"pipeline: {results['pipeline']['requests']} 个请求")
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": mock_settings_key(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+    failures = []
+    if not args.error_rate and not args.rate_limit_rate:
+        failures = [f"{name}: {result['errors']} 个失败" for name, result in results.items() if result["errors"]]
+    if results["translation_cached"]["cache_hits"] != results["translation_cached"]["count"]:
+        failures.append("translation_cached: 第二轮请求未全部命中响应缓存")
+    for failure in failures:
+        print(f"FAIL {failure}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "settings": mock_settings_key(args),
+                "throughput": {name: round(result["throughput"], 2) for name, result in results.items()},
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基线已更新：{BASELINE_PATH}")
+        return 1 if failures else 0
+
+    regressions = []
+    if not os.path.exists(BASELINE_PATH):
+        print("未找到基线文件，使用 --update-baseline 生成。")
+    else:
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != mock_settings_key(args):
+            print("本次参数与基线不同，跳过基线比较。")
+        else:
+            regressions = compare_with_baseline(results, baseline.get("throughput", {}), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,540 @@
+"""
+Multi-session load test of the Streamlit app against the local mock provider.
+
+Starts the app with `streamlit run` (the same server the team uses) and connects
+`--sessions` simulated editors to it over Streamlit's websocket protocol, each walking
+the page flow at the same time, as a browser would:
+
+    00 save the API config -> 01 generate the outline -> 02 generate the script and edit it
+    -> 03 generate the storyboard -> 04 generate the metadata
+    -> 05 upload reference images and batch-generate image prompts -> 06 batch-translate
+
+Every rerun is timed from the client's message to the server's `script_finished`:
+
+* start: until the rerun's first message, i.e. how long the rerun queued before its
+  script thread got going;
+* wait: wall time minus the provider time of that session's requests (each session uses
+  its own API key, so the mock server can attribute it), i.e. script execution plus
+  queueing behind the other sessions (rate limiter, connection pool, GIL); its growth
+  over the 1-session level is the queueing.
+
+Once all sessions of a level have finished, while they are still connected, the server
+process's RSS growth per session is measured: the server memory each editor costs,
+which grows with session-state bloat. Editors rewrite the generated script, so sessions
+do not share translations through the response cache or translation memory.
+
+p95 rerun latency (per level) and RSS per session (at the largest level) are compared
+with benchmarks/baselines/sessions.json when it was recorded with the same settings; the
+script exits with status 1 if either grows by more than `--tolerance`, or if any
+session failed. The server runs in a
+temporary working directory, so .cache/ is left untouched.
+
+    python benchmarks/bench_sessions.py
+    python benchmarks/bench_sessions.py --sessions 1 8 16 --latency 0.5 --tokens-per-second 60
+    python benchmarks/bench_sessions.py --provider "OpenAI API" --model gpt-4o  # with the provider's rate limits
+    python benchmarks/bench_sessions.py --update-baseline
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import requests  # noqa: E402
+from PIL import Image  # noqa: E402
+from streamlit.proto.Alert_pb2 import Alert  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.Common_pb2 import UploadedFileInfo  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from streamlit.proto.WidgetStates_pb2 import WidgetState  # noqa: E402
+from websockets.sync.client import connect  # noqa: E402
+
+from mock_openai_server import MockOpenAIServer, MockSettings  # noqa: E402
+from utils.config_store import PROMPTS_DIR  # noqa: E402
+from utils.core import PROMPTS_FILE  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baselines", "sessions.json")
+DEFAULT_TOLERANCE = 0.5 # Allowed growth of p95 rerun latency / RSS per session before the run fails
+GATED_METRICS = ("p95_rerun_seconds", "rss_per_session_mb")
+APP_SCRIPT = os.path.join(REPO_ROOT, "app.py")
+SERVER_START_TIMEOUT = 60
+# No rate_limits in prompts.yaml, so the numbers are the server's; with e.g. "OpenAI API" they include the client-side rate limiter
+DEFAULT_PROVIDER = "Custom Provider (Example)"
+DEFAULT_MODEL = "llama3"
+
+# url_pathname of each page in the app's navigation
+PAGE_API = "API_Configuration"
+PAGE_OUTLINE = "大纲生成"
+PAGE_SCRIPT = "口播稿生成"
+PAGE_STORYBOARD = "分镜脚本"
+PAGE_METADATA = "视频元数据"
+PAGE_IMAGE_PROMPTS = "图生视频提示词"
+PAGE_TRANSLATION = "多语言翻译"
+
+
+class SessionFailure(Exception):
+    """A simulated session could not complete a step."""
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_rss_bytes(pid: int) -> int:
+    """Resident set size of a process (/proc on Linux, `ps` elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    output = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout
+    return int(output.strip() or 0) * 1024
+
+
+def _reference_image() -> bytes:
+    """A camera-sized JPEG, generated once; noise keeps it from compressing to nothing."""
+    buffer = io.BytesIO()
+    Image.effect_noise((1280, 720), 48).convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class StreamlitServer:
+    """`streamlit run app.py` in a subprocess, working in `work_dir`."""
+
+    def __init__(self, work_dir: str):
+        self.work_dir = work_dir
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._log = None
+        self._process: Optional[subprocess.Popen] = None
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    def start(self) -> "StreamlitServer":
+        self._log = open(os.path.join(self.work_dir, "streamlit.log"), "wb")
+        self._process = subprocess.Popen([
+            sys.executable, "-m", "streamlit", "run", APP_SCRIPT,
+            "--server.headless=true", "--server.address=127.0.0.1", f"--server.port={self.port}",
+            "--server.fileWatcherType=none", "--browser.gatherUsageStats=false",
+            "--server.enableXsrfProtection=false", # The harness uploads files without a browser's XSRF cookie
+            "--server.disconnectedSessionTTL=0", # The warm-up session does not count towards the level's memory
+        ], cwd=self.work_dir, stdout=self._log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise SystemExit(f"错误：Streamlit 服务启动失败，见 {self._log.name}")
+            try:
+                if requests.get(f"{self.url}/_stcore/health", timeout=1).ok:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise SystemExit(f"错误：Streamlit 服务 {SERVER_START_TIMEOUT} 秒内未就绪。")
+
+    def stop(self):
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self._log:
+            self._log.close()
+
+    def __enter__(self) -> "StreamlitServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class SimulatedSession:
+    """One editor driving a server session over the websocket protocol; every rerun is timed."""
+
+    def __init__(self, index: int, args, server: StreamlitServer, mock: MockOpenAIServer, image: bytes):
+        self.index = index
+        self.args = args
+        self.server = server
+        self.mock = mock
+        self.image = image
+        self.api_key = f"mock-key-{index}"
+        self.reruns: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self._ws = None
+        self._session_id = ""
+        self._pages: Dict[str, str] = {} # url_pathname -> page_script_hash
+        self._page_hash = ""
+        self._widgets: List[Any] = [] # Widget protos rendered by the last run
+        self._alerts: List[Any] = []
+        self._exceptions: List[str] = []
+
+    # --- Protocol ---
+
+    def _receive(self) -> ForwardMsg:
+        msg = ForwardMsg()
+        msg.ParseFromString(self._ws.recv(timeout=self.args.timeout))
+        return msg
+
+    def _collect(self, msg: ForwardMsg):
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self._session_id = msg.new_session.initialize.session_id or self._session_id
+        elif kind == "navigation":
+            self._pages = {page.url_pathname: page.page_script_hash for page in msg.navigation.app_pages}
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            element_type = element.WhichOneof("type")
+            proto = getattr(element, element_type)
+            if element_type == "alert":
+                self._alerts.append(proto)
+            elif element_type == "exception":
+                self._exceptions.append(proto.message)
+            elif getattr(proto, "id", ""):
+                self._widgets.append(proto)
+
+    def _rerun(self, step: str, widget_states: List[WidgetState] = ()):
+        msg = BackMsg()
+        msg.rerun_script.page_script_hash = self._page_hash
+        msg.rerun_script.widget_states.widgets.extend(widget_states)
+        self._widgets, self._alerts, self._exceptions = [], [], []
+        provider_before = self.mock.stats()["service_seconds"].get(self.api_key, 0.0)
+        started_at = time.perf_counter()
+        self._ws.send(msg.SerializeToString())
+        first_message_at = None
+        while True:
+            reply = self._receive()
+            first_message_at = first_message_at or time.perf_counter()
+            self._collect(reply)
+            # st.rerun() ends a run early and starts the next one within the same rerun
+            if reply.WhichOneof("type") == "script_finished" and reply.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+        seconds = time.perf_counter() - started_at
+        provider_seconds = self.mock.stats()["service_seconds"].get(self.api_key, 0.0) - provider_before
+        self.reruns.append({"step": step, "seconds": seconds, "start_seconds": first_message_at - started_at,
+                            "provider_seconds": provider_seconds, "wait_seconds": max(0.0, seconds - provider_seconds)})
+        if self._exceptions:
+            raise SessionFailure(f"{step}: {self._exceptions[0]}")
+
+    def _open(self, step: str, page: str):
+        if page not in self._pages:
+            raise SessionFailure(f"{step}: 导航中没有页面 {page}")
+        self._page_hash = self._pages[page]
+        self._rerun(f"{step}:open")
+
+    def _widget(self, step: str, key: str = None, label_prefix: str = None):
+        for widget in self._widgets:
+            if (key and widget.id.endswith(f"-{key}")) or (label_prefix and widget.label.startswith(label_prefix)):
+                return widget
+        raise SessionFailure(f"{step}: 页面上没有控件 {key or label_prefix}")
+
+    def _require(self, step: str, success: str = None):
+        errors = [alert.body for alert in self._alerts if alert.format == Alert.ERROR]
+        if errors:
+            raise SessionFailure(f"{step}: {errors[0]}")
+        if success and not any(success in alert.body for alert in self._alerts if alert.format == Alert.SUCCESS):
+            raise SessionFailure(f"{step}: 未出现“{success}”")
+
+    def _upload(self, step: str, uploader) -> WidgetState:
+        """Uploads the reference image the way the frontend does: file URLs request, then PUT."""
+        msg = BackMsg()
+        msg.file_urls_request.request_id = str(uuid.uuid4())
+        msg.file_urls_request.session_id = self._session_id
+        msg.file_urls_request.file_names.append("scene.jpg")
+        self._ws.send(msg.SerializeToString())
+        while True:
+            reply = self._receive()
+            if reply.WhichOneof("type") == "file_urls_response" and reply.file_urls_response.response_id == msg.file_urls_request.request_id:
+                break
+        if reply.file_urls_response.error_msg:
+            raise SessionFailure(f"{step}: {reply.file_urls_response.error_msg}")
+        file_urls = reply.file_urls_response.file_urls[0]
+        response = requests.put(f"{self.server.url}{file_urls.upload_url}", files={"file": ("scene.jpg", self.image, "image/jpeg")},
+                                timeout=self.args.timeout)
+        if not response.ok:
+            raise SessionFailure(f"{step}: 上传失败 HTTP {response.status_code}")
+        state = WidgetState(id=uploader.id)
+        state.file_uploader_state_value.uploaded_file_info.append(UploadedFileInfo(
+            name="scene.jpg", size=len(self.image), file_id=file_urls.file_id, file_urls=file_urls))
+        return state
+
+    # --- Page flow ---
+
+    def walk(self, finished: threading.Event, release: threading.Event):
+        """Walks the page flow, signals `finished`, and stays connected until `release`."""
+        try:
+            with connect(f"ws://127.0.0.1:{self.server.port}/_stcore/stream", subprotocols=["streamlit"],
+                         max_size=None, open_timeout=self.args.timeout) as self._ws:
+                try:
+                    self._walk()
+                except SessionFailure as e:
+                    self.error = str(e)
+                finally:
+                    finished.set()
+                release.wait()
+        except Exception as e: # Timeouts, dropped connections
+            self.error = self.error or f"{type(e).__name__}: {e}"
+            finished.set()
+
+    def _walk(self):
+        args = self.args
+        self._rerun("app:open")
+
+        self._open("00_api", PAGE_API)
+        provider = self._widget("00_api", key="selected_provider_name_widget_config_page")
+        self._rerun("00_api:provider", [WidgetState(id=provider.id, string_value=args.provider)]) # The model list depends on it
+        states = [
+            WidgetState(id=self._widget("00_api", key="api_key_input_config_page").id, string_value=self.api_key),
+            WidgetState(id=self._widget("00_api", key="base_url_input_config_page").id, string_value=self.mock.base_url),
+            WidgetState(id=self._widget("00_api", key="selected_model_widget_config_page").id, string_value=args.model),
+            WidgetState(id=self._widget("00_api", key="save_api_config_button_config_page").id, trigger_value=True),
+        ]
+        structured_output = self._widget("00_api", key="structured_output_checkbox_config_page")
+        if not structured_output.disabled: # Only offered for providers that support it
+            states.append(WidgetState(id=structured_output.id, bool_value=not args.no_structured_output))
+        self._rerun("00_api:save", states)
+        self._require("00_api:save", "API 配置已保存")
+
+        self._open("01_outline", PAGE_OUTLINE)
+        self._rerun("01_outline:generate", [
+            WidgetState(id=self._widget("01_outline", label_prefix="请输入视频主题").id, string_value=f"负载测试主题：第 {self.index} 位编辑的视频"),
+            WidgetState(id=self._widget("01_outline", label_prefix="🚀 生成大纲").id, trigger_value=True),
+        ])
+        self._require("01_outline:generate")
+        if not self._widget("01_outline:generate", key="outline_edit_area").value:
+            raise SessionFailure("01_outline:generate: 大纲为空")
+
+        self._open("02_script", PAGE_SCRIPT)
+        self._rerun("02_script:generate", [WidgetState(id=self._widget("02_script", label_prefix="🚀 生成口播稿").id, trigger_value=True)])
+        self._require("02_script:generate")
+        script_area = self._widget("02_script:generate", key="script_edit_area")
+        if not script_area.value:
+            raise SessionFailure("02_script:generate: 口播稿为空")
+        # Each editor rewrites the script, so their storyboards and translations differ
+        self._rerun("02_script:edit", [WidgetState(id=script_area.id, string_value=script_area.value.replace("。", f"（编辑 {self.index}）。"))])
+
+        self._open("03_storyboard", PAGE_STORYBOARD)
+        self._rerun("03_storyboard:generate", [
+            WidgetState(id=self._widget("03_storyboard", label_prefix="🚀 生成/重新生成分镜脚本").id, trigger_value=True)])
+        self._require("03_storyboard:generate", "分镜脚本已生成")
+
+        self._open("04_metadata", PAGE_METADATA)
+        self._rerun("04_metadata:generate", [
+            WidgetState(id=self._widget("04_metadata", label_prefix="🚀 生成/重新生成视频元数据").id, trigger_value=True)])
+        self._require("04_metadata:generate", "视频元数据已生成")
+
+        self._open("05_image_prompts", PAGE_IMAGE_PROMPTS)
+        uploaders = [widget for widget in self._widgets if "-uploader_" in widget.id][:args.images]
+        self._rerun("05_image_prompts:upload", [self._upload("05_image_prompts:upload", uploader) for uploader in uploaders])
+        self._rerun("05_image_prompts:generate", [
+            WidgetState(id=self._widget("05_image_prompts", label_prefix="🚀 批量生成提示词").id, trigger_value=True)])
+        self._require("05_image_prompts:generate", f"已为 {len(uploaders)} 个分镜生成提示词")
+
+        self._open("06_translation", PAGE_TRANSLATION)
+        languages = self._widget("06_translation", key="batch_md_report_languages")
+        states = [WidgetState(id=languages.id), WidgetState(id=self._widget("06_translation", key="generate_md_all_selected").id, trigger_value=True)]
+        states[0].string_array_value.data.extend(languages.options[:args.languages])
+        self._rerun("06_translation:generate", states)
+        self._require("06_translation:generate")
+
+
+def run_level(args, server: StreamlitServer, mock: MockOpenAIServer, image: bytes, session_count: int,
+              first_index: int = 0) -> Dict[str, Any]:
+    """
+    Runs `session_count` sessions concurrently and measures the server while they are still
+    connected. Session indices start at `first_index`: they must not repeat across levels, or
+    a session's content would be served from the previous level's caches.
+    """
+    sessions = [SimulatedSession(first_index + index, args, server, mock, image) for index in range(session_count)]
+    finished = [threading.Event() for _ in sessions]
+    release = threading.Event()
+    time.sleep(1) # Let the warm-up session be cleaned up
+    rss_before = process_rss_bytes(server.pid)
+    mock.reset_stats()
+    start = threading.Barrier(session_count)
+
+    def walk(index: int):
+        start.wait() # Everyone starts together: the worst case for queueing
+        sessions[index].walk(finished[index], release)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=session_count) as executor:
+        futures = [executor.submit(walk, index) for index in range(session_count)]
+        for event in finished:
+            event.wait()
+        seconds = time.perf_counter() - started_at
+        rss_after = process_rss_bytes(server.pid)
+        release.set()
+        for future in futures:
+            future.result()
+    mock_stats = mock.stats()
+
+    reruns = [rerun for session in sessions for rerun in session.reruns]
+    generate_reruns = [rerun for rerun in reruns if rerun["provider_seconds"] > 0]
+    steps: Dict[str, List[float]] = {}
+    for rerun in reruns:
+        steps.setdefault(rerun["step"], []).append(rerun["seconds"])
+    return {
+        "sessions": session_count,
+        "seconds": seconds,
+        "reruns": len(reruns),
+        "p50_rerun_seconds": _percentile([rerun["seconds"] for rerun in reruns], 0.5),
+        "p95_rerun_seconds": _percentile([rerun["seconds"] for rerun in reruns], 0.95),
+        "p95_start_seconds": _percentile([rerun["start_seconds"] for rerun in reruns], 0.95),
+        "p95_generate_wait_seconds": _percentile([rerun["wait_seconds"] for rerun in generate_reruns], 0.95),
+        "mean_generate_wait_seconds": statistics.mean(rerun["wait_seconds"] for rerun in generate_reruns) if generate_reruns else 0.0,
+        "server_rss_mb": rss_after / (1024 * 1024),
+        "rss_per_session_mb": (rss_after - rss_before) / session_count / (1024 * 1024),
+        "step_p95_seconds": {step: _percentile(values, 0.95) for step, values in steps.items()},
+        "requests": mock_stats["counts"].get("requests", 0),
+        "peak_in_flight": mock_stats["peak_in_flight"],
+        "errors": [f"会话 {session.index}: {session.error}" for session in sessions if session.error],
+    }
+
+
+def run_benchmarks(args, work_dir: str) -> List[Dict[str, Any]]:
+    settings = MockSettings(latency=args.latency, tokens_per_second=args.tokens_per_second, seed=args.seed)
+    image = _reference_image()
+    levels = []
+    next_index = 0
+    with MockOpenAIServer(settings) as mock:
+        for session_count in args.sessions:
+            # A fresh server per level, so memory freed by the previous level is not reused by this one
+            with StreamlitServer(work_dir) as server:
+                # Warm-up: imports, prompts.yaml parsing and first-run caches are not per-session costs
+                warm_up = run_level(args, server, mock, image, 1, first_index=next_index)
+                if warm_up["errors"]:
+                    raise SystemExit(f"错误：预热会话失败：{warm_up['errors'][0]}")
+                levels.append(run_level(args, server, mock, image, session_count, first_index=next_index + 1))
+            next_index += 1 + session_count
+    return levels
+
+
+def settings_key(args) -> Dict[str, Any]:
+    """The settings a baseline is only comparable under."""
+    return {name: getattr(args, name) for name in
+            ("sessions", "provider", "model", "no_structured_output", "images", "languages", "latency", "tokens_per_second")}
+
+
+def compare_with_baseline(levels: List[Dict[str, Any]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    regressions = []
+    largest = max(level["sessions"] for level in levels)
+    for level in levels:
+        reference = baseline.get(str(level["sessions"])) or {}
+        for metric in GATED_METRICS:
+            if metric == "rss_per_session_mb" and level["sessions"] != largest:
+                continue # Allocator noise dominates the growth of a few sessions
+            if reference.get(metric) and level[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f"{level['sessions']} 个会话 {metric}: {level[metric]:,.2f}，基线 {reference[metric]:,.2f} "
+                                   f"({level[metric] / reference[metric] - 1:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="多会话负载测试：模拟多位编辑同时走完整个页面流程 (离线，不消耗 Token)。")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8], help="依次测试的并发会话数 (默认: 1 4 8)。")
+    parser.add_argument("--provider", default=DEFAULT_PROVIDER,
+                        help=f"API 配置页选择的提供商，决定限速、并发上限与结构化输出 (默认: {DEFAULT_PROVIDER}，不限速)。")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"API 配置页选择的模型 (默认: {DEFAULT_MODEL})。")
+    parser.add_argument("--no-structured-output", action="store_true", help="关闭结构化输出，分镜与元数据按 Markdown 生成。")
+    parser.add_argument("--images", type=int, default=3, help="每个会话在图生视频页上传的参考图片数 (默认: 3)。")
+    parser.add_argument("--languages", type=int, default=2, help="每个会话批量翻译的语言数 (默认: 2)。")
+    parser.add_argument("--latency", type=float, default=0.1, help="模拟首字延迟 (秒，默认: 0.1)。")
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0, help="模拟生成速度 (默认: 1000)。")
+    parser.add_argument("--seed", type=int, default=1, help="模拟服务的随机种子 (默认: 1)。")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单次页面运行的超时秒数 (默认: 120)。")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"相对基线允许的最大增长比例 (默认: {DEFAULT_TOLERANCE})。")
+    parser.add_argument("--update-baseline", action="store_true", help="将本次结果写入基线文件。")
+    parser.add_argument("--output", help="将本次结果另存为 JSON 文件。")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_sessions_")
+    # The app reads prompts.yaml and writes .cache/ relative to its working directory
+    shutil.copy(os.path.join(REPO_ROOT, PROMPTS_FILE), work_dir)
+    if os.path.isdir(os.path.join(REPO_ROOT, PROMPTS_DIR)):
+        shutil.copytree(os.path.join(REPO_ROOT, PROMPTS_DIR), os.path.join(work_dir, PROMPTS_DIR))
+    try:
+        levels = run_benchmarks(args, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'sessions':>8}{'seconds':>9}{'reruns':>8}{'p50 ms':>8}{'p95 ms':>8}{'start p95':>11}{'wait p95':>10}"
+          f"{'RSS MB':>8}{'MB/session':>12}{'requests':>10}{'peak':>6}{'errors':>8}")
+    for level in levels:
+        print(f"{level['sessions']:>8}{level['seconds']:>9.1f}{level['reruns']:>8}{level['p50_rerun_seconds'] * 1000:>8.0f}"
+              f"{level['p95_rerun_seconds'] * 1000:>8.0f}{level['p95_start_seconds'] * 1000:>11.0f}"
+              f"{level['p95_generate_wait_seconds'] * 1000:>10.0f}{level['server_rss_mb']:>8.0f}{level['rss_per_session_mb']:>12.1f}"
+              f"{level['requests']:>10}{level['peak_in_flight']:>6}{len(level['errors']):>8}")
+    last = levels[-1]
+    print(f"\n{last['sessions']} 个会话时各步骤 p95 (ms)：")
+    for step, seconds in last["step_p95_seconds"].items():
+        print(f"  {step:<28}{seconds * 1000:>8.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings_key(args), "levels": levels}, f, ensure_ascii=False, indent=2)
+
+    failures = [error for level in levels for error in level["errors"]]
+    for failure in failures:
+        print(f"FAIL {failure}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "settings": settings_key(args),
+                "levels": {str(level["sessions"]): {metric: round(level[metric], 3) for metric in GATED_METRICS} for level in levels},
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基线已更新：{BASELINE_PATH}")
+        return 1 if failures else 0
+
+    regressions = []
+    if not os.path.exists(BASELINE_PATH):
+        print("未找到基线文件，使用 --update-baseline 生成。")
+    else:
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings_key(args):
+            print("本次参数与基线不同，跳过基线比较。")
+        else:
+            regressions = compare_with_baseline(levels, baseline.get("levels", {}), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Correctness and throughput benchmark for `utils.parsing_utils.parse_markdown_table_to_df`.
+
+The corpus (benchmarks/corpus/*.md) holds LLM storyboard and translation-report outputs
+with the quirks seen in practice: preambles and code fences, escaped pipes, ragged rows,
+tables without outer pipes and headers repeated mid-table. `corpus/manifest.json` lists
+the expected shape and spot-checked cells of each file. Large tables (1,000 and 5,000
+rows) are built from the corpus storyboard rows.
+
+Throughput (rows/s, best of `--repeat` runs) is compared with
+benchmarks/baselines/table_parser.json; the script exits with status 1 if any case is
+slower than the baseline by more than `--tolerance`, or if any corpus file parses wrong.
+
+    python benchmarks/bench_table_parser.py
+    python benchmarks/bench_table_parser.py --update-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.parsing_utils import parse_markdown_table_to_df  # noqa: E402
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCHMARK_DIR, "corpus")
+MANIFEST_PATH = os.path.join(CORPUS_DIR, "manifest.json")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baselines", "table_parser.json")
+LARGE_TABLE_ROWS = (1000, 5000)
+DEFAULT_TOLERANCE = 0.3 # Allowed slowdown vs. the baseline before the run fails
+
+
+def load_corpus() -> Dict[str, str]:
+    corpus = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith(".md"):
+            with open(os.path.join(CORPUS_DIR, name), "r", encoding="utf-8") as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def build_large_table(corpus: Dict[str, str], row_count: int) -> str:
+    """A `row_count`-row storyboard made by cycling the rows of the clean corpus storyboards."""
+    header, body = None, []
+    for name in ("storyboard_clean.md", "storyboard_escaped_pipes.md"):
+        lines = [line for line in corpus[name].splitlines() if line.startswith("|")]
+        header = header or lines[:2]
+        body += lines[2:]
+    rows = []
+    for index in range(row_count):
+        cells = body[index % len(body)].split(" | ", 1)
+        rows.append(f"| {index + 1} | {cells[1]}")
+    return "\n".join(header + rows)
+
+
+def check_corpus(corpus: Dict[str, str]) -> List[str]:
+    """Returns a description of every manifest expectation the parser does not meet."""
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    failures = []
+    for name, expected in manifest.items():
+        if name not in corpus:
+            failures.append(f"{name}: file missing from corpus")
+            continue
+        df = parse_markdown_table_to_df(corpus[name])
+        if df.shape != (expected["rows"], expected["columns"]):
+            failures.append(f"{name}: shape {df.shape}, expected {(expected['rows'], expected['columns'])}")
+            continue
+        for row, column, value in expected.get("checks", []):
+            actual = df.iloc[row][column] if column in df.columns else "<missing column>"
+            if actual != value:
+                failures.append(f"{name}: row {row} {column!r} = {actual!r}, expected {value!r}")
+    return failures
+
+
+def measure(text: str, repeat: int) -> Tuple[int, float]:
+    """Returns (rows parsed, best seconds per parse)."""
+    rows = len(parse_markdown_table_to_df(text))
+    timer = timeit.Timer(lambda: parse_markdown_table_to_df(text))
+    number, _ = timer.autorange() # Enough iterations for >= 0.2 s per measurement
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return rows, best
+
+
+def run_benchmarks(corpus: Dict[str, str], repeat: int) -> Dict[str, Dict[str, float]]:
+    cases = dict(corpus)
+    for row_count in LARGE_TABLE_ROWS:
+        cases[f"generated_{row_count}_rows"] = build_large_table(corpus, row_count)
+    results = {}
+    for name, text in cases.items():
+        rows, seconds = measure(text, repeat)
+        results[name] = {
+            "rows": rows,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds else 0.0,
+            "mb_per_second": len(text.encode("utf-8")) / seconds / 1e6 if seconds else 0.0,
+        }
+    return results
+
+
+def compare_with_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference and result["rows_per_second"] < reference * (1 - tolerance):
+            regressions.append(f"{name}: {result['rows_per_second']:,.0f} rows/s, baseline {reference:,.0f} rows/s "
+                               f"({result['rows_per_second'] / reference - 1:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Markdown 表格解析器的正确性与吞吐量基准测试。")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例的测量次数，取最快一次 (默认: 5)。")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"相对基线允许的最大性能下降比例 (默认: {DEFAULT_TOLERANCE})。")
+    parser.add_argument("--update-baseline", action="store_true", help="将本次结果写入基线文件。")
+    parser.add_argument("--output", help="将本次结果另存为 JSON 文件。")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus()
+    failures = check_corpus(corpus)
+    for failure in failures:
+        print(f"FAIL {failure}")
+
+    results = run_benchmarks(corpus, args.repeat)
+    print(f"{'case':<34}{'rows':>7}{'ms/parse':>11}{'rows/s':>13}{'MB/s':>8}")
+    for name, result in results.items():
+        print(f"{name:<34}{result['rows']:>7}{result['seconds'] * 1000:>11.3f}"
+              f"{result['rows_per_second']:>13,.0f}{result['mb_per_second']:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "rows_per_second": {name: round(result["rows_per_second"]) for name, result in results.items()},
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基线已更新：{BASELINE_PATH}")
+        return 1 if failures else 0
+
+    regressions = []
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f).get("rows_per_second", {}), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    else:
+        print("未找到基线文件，使用 --update-baseline 生成。")
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API, for offline benchmarks.
+
+The server answers `POST /v1/chat/completions` (streaming and non-streaming) and
+`GET /v1/models` with canned but well-formed output for every prompts.yaml task: the
+task is recognised from the start of the request's system message, and outputs are
+derived from the request so the app's parsers see realistic input (one storyboard row
+per script sentence, one translation per scene, JSON when `response_format` asks for
+it). Latency, token rate, 5xx errors and 429s with Retry-After are configurable, and
+`stats()` / `GET /stats` report request counts, the peak number of concurrent requests
+and the time spent serving each API key, so concurrency and caching changes can be
+verified without network access.
+
+    python benchmarks/mock_openai_server.py --port 8765 --latency 0.2 --tokens-per-second 80
+    python batch_pipeline.py topics.jsonl --base-url http://127.0.0.1:8765/v1 --api-key mock --model mock
+
+In tests and benchmarks, use it in-process:
+
+    with MockOpenAIServer(MockSettings(latency=0.05)) as server:
+        ... base_url=server.base_url ...
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.core import PROMPTS_FILE, read_yaml_config  # noqa: E402
+
+SYSTEM_PREFIX_CHARS = 40 # Characters of a task's system message used to recognise it
+UNKNOWN_TASK = "unknown"
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?])")
+
+
+@dataclass
+class MockSettings:
+    latency: float = 0.05 # Seconds before the first token (TTFT)
+    tokens_per_second: float = 0.0 # Generation speed after the first token; 0 = instant
+    error_rate: float = 0.0 # Probability of a 500 response
+    rate_limit_rate: float = 0.0 # Probability of a 429 response
+    retry_after: float = 0.2 # Seconds sent in Retry-After(-ms) with a 429
+    stream_chunk_chars: int = 8 # Characters per streamed delta
+    seed: Optional[int] = None
+
+
+def estimate_tokens(text: str) -> int:
+    """~1 token per CJK character, ~4 characters per token otherwise (as `utils.rate_limiter`)."""
+    cjk_chars = sum(1 for char in text if "\u3000" <= char <= "\u9fff")
+    return max(1, cjk_chars + (len(text) - cjk_chars) // 4)
+
+
+def load_task_fingerprints(prompts_path: str = os.path.join(REPO_ROOT, PROMPTS_FILE)) -> Dict[str, str]:
+    """Maps the start of every prompts.yaml system message (any model key) to its task."""
+    prompts = read_yaml_config(prompts_path).get("prompts") or {}
+    fingerprints = {}
+    for task_name, models in prompts.items():
+        for prompt in (models or {}).values():
+            system_message = (prompt or {}).get("system_message") or ""
+            prefix = system_message.strip().split("{", 1)[0][:SYSTEM_PREFIX_CHARS]
+            if prefix:
+                fingerprints[prefix] = task_name
+    return fingerprints
+
+
+# ---------------------------------------------------------------------------
+# Canned outputs
+# ---------------------------------------------------------------------------
+
+def _section(text: str, label: str) -> str:
+    """The part of a user message after a `**【label】**:` heading, up to the next heading, without code fences."""
+    marker = f"【{label}】**:"
+    if marker not in text:
+        return ""
+    section = text.split(marker, 1)[1].split("**【", 1)[0]
+    return "\n".join(line for line in section.splitlines() if not line.strip().startswith("```")).strip()
+
+
+def _sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def _storyboard_rows(script: str) -> List[Tuple[str, str, str]]:
+    narration = [sentence for sentence in _sentences(script) if not sentence.startswith("#")] or ["（空）"]
+    return [
+        (sentence, f"cinematic still of scene {index}, dramatic lighting, photorealistic --ar 16:9 --v 7.0", f"画面 {index}")
+        for index, sentence in enumerate(narration[:300], start=1)
+    ]
+
+
+def _storyboard(user: str, structured: bool) -> str:
+    rows = _storyboard_rows(_section(user, "口播文案") or user)
+    if structured:
+        return json.dumps({"scenes": [
+            {"scene_number": index, "chinese_narration": narration, "image_prompt": prompt, "scene_description": description}
+            for index, (narration, prompt, description) in enumerate(rows, start=1)
+        ]}, ensure_ascii=False)
+    lines = ["以下是分镜脚本：", "", "| 画面序号 | 中文口播文案 | 文生图提示词 (英文) | 画面描述 |", "|---|---|---|---|"]
+    lines += [f"| {index} | {narration} | {prompt} | {description} |" for index, (narration, prompt, description) in enumerate(rows, start=1)]
+    return "\n".join(lines)
+
+
+def _row_regeneration(user: str) -> str:
+    lines = ["| 画面序号 | 中文口播文案 | 文生图提示词 (英文) | 画面描述 |", "|---|---|---|---|"]
+    for line in _section(user, "需要重新生成的画面").splitlines()[2:]:
+        cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+        if len(cells) >= 2:
+            lines.append(f"| {cells[0]} | {cells[1]} | regenerated shot {cells[0]}, moody atmosphere --ar 16:9 --v 7.0 | 新画面 {cells[0]} |")
+    return "\n".join(lines)
+
+
+def _metadata(structured: bool) -> str:
+    metadata = {
+        "titles": ["你从未听说过的宇宙真相", "科学家也无法解释的现象", "这件事改变了一切"],
+        "description": "一段关于宇宙奥秘的旅程。\n\n00:00 开场\n01:30 第一个谜题\n05:00 结论\n\n订阅频道，获取更多内容。",
+        "tags": ["#宇宙", "#科学", "#科普"],
+        "thumbnail_prompts": ["a lone astronaut facing a giant black hole, vibrant colors, high contrast --ar 16:9"],
+        "thumbnail_texts": ["真相", "无法解释"],
+    }
+    if structured:
+        return json.dumps(metadata, ensure_ascii=False)
+    return (
+        "## 视频标题\n\n" + "\n".join(f"{i}. {t}" for i, t in enumerate(metadata["titles"], start=1))
+        + f"\n\n## 视频描述\n\n{metadata['description']}\n\n## 标签\n\n{' '.join(metadata['tags'])}"
+        + "\n\n## 缩略图提示词\n\n1. " + metadata["thumbnail_prompts"][0]
+        + "\n\n## 缩略图文字\n\n" + "\n".join(f"{i}. {t}" for i, t in enumerate(metadata["thumbnail_texts"], start=1))
+    )
+
+
+def _scene_batch_translation(user: str) -> str:
+    language = _section(user, "目标语言") or "English"
+    try:
+        scenes = json.loads(_section(user, "场景列表") or "[]")
+    except json.JSONDecodeError:
+        scenes = []
+    return json.dumps({"translations": [
+        {"scene_number": str(scene.get("scene_number")), "translation": f"[{language}] {scene.get('chinese_narration', '')}"}
+        for scene in scenes
+    ]}, ensure_ascii=False)
+
+
+def _script() -> str:
+    paragraphs = []
+    for index in range(1, 7):
+        paragraphs.append("".join(f"这是第{index}部分的第{sentence}句口播文案，内容紧扣主题并保持口语化。" for sentence in range(1, 6)))
+    return "\n\n".join(paragraphs)
+
+
+def canned_output(task_name: str, user: str, structured: bool) -> str:
+    if task_name == "outline_generation":
+        return "# 视频大纲\n\n" + "\n".join(f"## 第{i}部分\n- 要点 {i}.1\n- 要点 {i}.2" for i in range(1, 7))
+    if task_name in ("outline_scoring", "script_scoring"):
+        return "## 评分\n\n总分：8/10\n\n- 优点：结构清晰\n- 建议：加强开场钩子"
+    if task_name == "script_generation":
+        return _script()
+    if task_name == "storyboard_generation":
+        return _storyboard(user, structured)
+    if task_name == "storyboard_row_regeneration":
+        return _row_regeneration(user)
+    if task_name == "video_metadata_generation":
+        return _metadata(structured)
+    if task_name == "image_to_video_prompt_generation":
+        return "一个史诗般的广角镜头，镜头缓慢向前推进，傍晚的金色侧光勾勒出轮廓，云层缓慢流淌，画面带有细腻的胶片颗粒感。"
+    if task_name == "translate_scene_batch":
+        return _scene_batch_translation(user)
+    if task_name == "translate_video_metadata":
+        return f"[{_section(user, '目标语言') or 'English'}]\n\n" + (_section(user, "视频元数据") or "metadata")
+    if task_name == "translate_and_format_to_md_zh":
+        language = _section(user, "目标语言") or "English"
+        return f"# 视频脚本内容 ({language})\n\n| 画面序号 | 源中文口播文案 | 翻译后的口播文案 ({language}) |\n|---|---|---|\n| 1 | 示例 | [{language}] example |"
+    return "mock response"
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like real providers
+    server: "_MockHTTPServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.mock.stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        mock = self.server.mock
+        with mock.track_request((self.headers.get("Authorization") or "").removeprefix("Bearer ").strip()):
+            mock.handle_completion(self, request)
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256 # The default backlog (5) drops bursts of new connections, adding 1 s SYN retries
+    mock: "MockOpenAIServer"
+
+
+class MockOpenAIServer:
+    """Runs the mock API on a background thread; `port=0` picks a free port."""
+
+    def __init__(self, settings: Optional[MockSettings] = None, host: str = "127.0.0.1", port: int = 0,
+                 prompts_path: str = os.path.join(REPO_ROOT, PROMPTS_FILE)):
+        self.settings = settings or MockSettings()
+        self._fingerprints = load_task_fingerprints(prompts_path)
+        self._random = random.Random(self.settings.seed)
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._service_seconds: Counter = Counter() # API key -> seconds spent answering its requests
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._httpd = _MockHTTPServer((host, port), _Handler)
+        self._httpd.mock = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-openai-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """Request counts per task and outcome, the peak number of concurrent requests and the service time per API key."""
+        with self._lock:
+            return {"counts": dict(self._counts), "in_flight": self._in_flight, "peak_in_flight": self._peak_in_flight,
+                    "service_seconds": dict(self._service_seconds)}
+
+    def reset_stats(self):
+        with self._lock:
+            self._counts.clear()
+            self._service_seconds.clear()
+            self._peak_in_flight = self._in_flight
+
+    @contextmanager
+    def track_request(self, api_key: str = ""):
+        started_at = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._service_seconds[api_key] += time.perf_counter() - started_at
+
+    def identify_task(self, system_message: str) -> str:
+        system_message = (system_message or "").strip()
+        for prefix, task_name in self._fingerprints.items():
+            if system_message.startswith(prefix):
+                return task_name
+        return UNKNOWN_TASK
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counts[key] += 1
+
+    def _roll(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < probability
+
+    def handle_completion(self, handler: _Handler, request: Dict[str, Any]):
+        messages = request.get("messages") or []
+        system_message = next((m.get("content") for m in messages if m.get("role") == "system"), "") or ""
+        user_content = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "") or ""
+        if isinstance(user_content, list):
+            user_content = "".join(part.get("text", "") for part in user_content if part.get("type") == "text")
+        task_name = self.identify_task(system_message)
+        self._count("requests")
+        self._count(f"task:{task_name}")
+
+        settings = self.settings
+        if self._roll(settings.rate_limit_rate):
+            self._count("injected_429")
+            time.sleep(settings.latency / 4)
+            handler._send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                               {"Retry-After": str(max(1, round(settings.retry_after))),
+                                "retry-after-ms": str(int(settings.retry_after * 1000))})
+            return
+        if self._roll(settings.error_rate):
+            self._count("injected_500")
+            time.sleep(settings.latency / 4)
+            handler._send_json(500, {"error": {"message": "Internal server error (mock)", "type": "server_error"}})
+            return
+
+        structured = (request.get("response_format") or {}).get("type") == "json_schema"
+        content = canned_output(task_name, user_content, structured)
+        max_tokens = request.get("max_tokens")
+        finish_reason = "stop"
+        completion_tokens = estimate_tokens(content)
+        if max_tokens and completion_tokens > max_tokens: # Truncate like a real provider
+            content = content[:max(1, int(len(content) * max_tokens / completion_tokens))]
+            completion_tokens, finish_reason = max_tokens, "length"
+        usage = {
+            "prompt_tokens": estimate_tokens(system_message + user_content),
+            "completion_tokens": completion_tokens,
+            "total_tokens": estimate_tokens(system_message + user_content) + completion_tokens,
+        }
+        model = request.get("model") or "mock"
+        if request.get("stream"):
+            self._stream(handler, model, content, finish_reason, usage, (request.get("stream_options") or {}).get("include_usage"))
+        else:
+            time.sleep(settings.latency + (completion_tokens / settings.tokens_per_second if settings.tokens_per_second else 0))
+            handler._send_json(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+    def _stream(self, handler: _Handler, model: str, content: str, finish_reason: str, usage: Dict[str, int], include_usage: bool):
+        settings = self.settings
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close") # No Content-Length: the body ends when the connection closes
+        handler.end_headers()
+        handler.close_connection = True
+
+        def send(choices: List[Dict[str, Any]], extra: Optional[Dict[str, Any]] = None):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": choices}
+            chunk.update(extra or {})
+            handler.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            handler.wfile.flush()
+
+        time.sleep(settings.latency)
+        step = max(1, settings.stream_chunk_chars)
+        for start in range(0, len(content), step):
+            piece = content[start:start + step]
+            send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            if settings.tokens_per_second:
+                time.sleep(estimate_tokens(piece) / settings.tokens_per_second)
+        send([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        if include_usage:
+            send([], {"usage": usage})
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务，用于离线基准测试 (不消耗 Token)。")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="首字延迟 (秒，默认: 0.2)。")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="生成速度 (0 为立即返回，默认: 80)。")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率 (默认: 0)。")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率 (默认: 0)。")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After 秒数 (默认: 1)。")
+    parser.add_argument("--seed", type=int, help="错误注入的随机种子。")
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(latency=args.latency, tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+                            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, seed=args.seed)
+    server = MockOpenAIServer(settings, host=args.host, port=args.port)
+    print(f"模拟服务已启动：{server.base_url}  (Ctrl+C 停止，GET /v1/stats 查看请求统计)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
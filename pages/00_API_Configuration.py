@@ -1,5 +1,9 @@
+import time
 import streamlit as st
-from utils.config_loader import get_provider_configs # Assuming utils is in parent directory or PYTHONPATH
+from utils.config_loader import get_provider_configs, load_config_snapshot, show_prompt_validation_report # Assuming utils is in parent directory or PYTHONPATH
+from utils.config_store import get_config_store
+from utils.rate_limiter import register_provider_rate_limits
+from utils.response_cache import get_response_cache
 
 def api_configuration_ui():
     """Displays UI for API configuration and stores it in session_state."""
@@ -77,6 +81,17 @@ def api_configuration_ui():
             st.warning(f"提供商 '{selected_provider_name}' 没有可用的模型列表。")
             st.session_state.api_config["selected_model"] = None
 
+        # Only offered for providers that declare JSON schema support in prompts.yaml
+        supports_structured_output = bool(selected_provider_details.get("structured_output"))
+        use_structured_output = st.checkbox(
+            "结构化输出（JSON Schema）",
+            value=st.session_state.api_config.get("structured_output", supports_structured_output),
+            disabled=not supports_structured_output,
+            help="分镜脚本与视频元数据以 JSON 返回并在本地校验，避免 Markdown 解析失败导致的重新生成；校验失败时自动按 Markdown 解析。"
+                 if supports_structured_output else "该提供商未在 prompts.yaml 中声明 `structured_output: true`。",
+            key="structured_output_checkbox_config_page"
+        )
+
         if st.button("保存 API 配置", key="save_api_config_button_config_page"):
             if not st.session_state.api_config["api_key"]:
                 st.warning("请输入 API Key。")
@@ -86,6 +101,9 @@ def api_configuration_ui():
                 st.warning("请选择一个模型。")
             else:
                 st.session_state.api_config["configured"] = True
+                st.session_state.api_config["structured_output"] = supports_structured_output and use_structured_output
+                # A user-edited Base URL keeps the provider's rate limits from prompts.yaml
+                register_provider_rate_limits(st.session_state.api_config["base_url"], selected_provider_details)
                 st.success(f"API 配置已保存！提供商: {selected_provider_name}, 模型: {st.session_state.api_config['selected_model']}")
                 # st.experimental_rerun() # Consider if rerun is needed or if flow naturally updates
     else:
@@ -99,9 +117,42 @@ def api_configuration_ui():
         st.info("请完成并保存 API 配置以启用其他功能。")
     return False
 
+def response_cache_ui():
+    """Shows hit/miss statistics for the local LLM response cache and allows clearing it."""
+    with st.expander("🗄️ 本地响应缓存", expanded=False):
+        st.caption("在 prompts.yaml 中为任务设置 `cache_ttl_hours` 后，相同请求（模型、提示词、参数、图片均一致）将直接复用缓存结果，不再消耗 Token。")
+        response_cache = get_response_cache()
+        cache_stats = response_cache.stats()
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("缓存条目", cache_stats["entries"])
+        col2.metric("占用空间", f"{cache_stats['bytes'] / (1024 * 1024):.1f} MB")
+        col3.metric("命中 / 未命中", f"{cache_stats['hits']} / {cache_stats['misses']}")
+        col4.metric("命中率", f"{cache_stats['hits'] / lookups:.0%}" if lookups else "-")
+        if st.button("🧹 清空响应缓存", key="clear_response_cache_button"):
+            response_cache.clear()
+            st.success("响应缓存已清空。")
+
+def prompts_config_ui():
+    """Shows which prompts.yaml version is live; edits are picked up automatically, the button forces a reload."""
+    snapshot = load_config_snapshot()
+    if snapshot is None:
+        return
+    col_info, col_button = st.columns([4, 1])
+    col_info.caption(
+        f"📄 prompts.yaml 版本 {snapshot.version}（加载于 {time.strftime('%H:%M:%S', time.localtime(snapshot.loaded_at))}）。"
+        "保存文件后下一次页面交互即会生效，无需重启服务。"
+    )
+    if col_button.button("🔄 重新加载", key="reload_prompts_config_button"):
+        get_config_store().get(force=True)
+        st.rerun()
+    show_prompt_validation_report()
+
 # Page title and main execution
 st.set_page_config(page_title="API 配置", layout="wide", initial_sidebar_state="expanded")
 st.sidebar.success("在此配置您的AI模型API。") # Example sidebar message for this page
 
 if __name__ == "__main__":
-    api_configuration_ui()
\ No newline at end of file
+    api_configuration_ui()
+    response_cache_ui()
+    prompts_config_ui()
\ No newline at end of file
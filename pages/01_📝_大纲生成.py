@@ -1,6 +1,7 @@
 import streamlit as st
-from utils.api_utils import call_openai_api, get_prompt_content
+from utils.api_utils import stream_openai_api, write_stream_with_stats, get_prompt_content
 from utils.config_loader import get_prompts # To load all prompts once
+from utils.project_store import autosave_project
 
 # Page Configuration
 st.set_page_config(page_title="大纲生成", layout="wide", initial_sidebar_state="expanded")
@@ -51,7 +52,7 @@ def outline_generation_page():
             if not st.session_state.topic_input.strip():
                 st.warning("请输入视频主题。")
             else:
-                with st.spinner("AI 正在生成大纲中，请稍候..."):
+                with st.container(border=True): # Streamed output renders here as it arrives
                     api_conf = st.session_state.api_config
                     system_msg, user_msg_text_template, params = get_prompt_content( # Renamed user_msg_template to user_msg_text_template for clarity
                         "outline_generation", 
@@ -62,17 +63,21 @@ def outline_generation_page():
                     st.session_state.last_outline_request = {"system": system_msg, "user": user_msg_text_template, "params": params}
 
                     if user_msg_text_template is not None: # Check if prompt text was successfully prepared
-                        generated_outline = call_openai_api(
+                        generated_outline = write_stream_with_stats(stream_openai_api(
                             api_key=api_conf["api_key"],
                             base_url=api_conf["base_url"],
                             model=api_conf["selected_model"],
                             system_message=system_msg,
                             user_message_text=user_msg_text_template, # Changed from user_message
                             temperature=params.get("temperature", 0.7), 
-                            max_tokens=params.get("max_tokens", 1500)
-                        )
+                            max_tokens=params.get("max_tokens", 1500),
+                            timeout=params.get("timeout"),
+                            cache_ttl_hours=params.get("cache_ttl_hours"),
+                            task_name="outline_generation"
+                        ))
                         if generated_outline:
                             st.session_state.outline_content = generated_outline
+                            st.session_state.outline_edit_area = generated_outline
                             st.session_state.outline_score_feedback = "" # Clear previous score
                         else:
                             st.error("未能生成大纲。请检查 API 配置或稍后再试。")
@@ -82,16 +87,18 @@ def outline_generation_page():
 
     st.divider()
     st.subheader("AI 生成的大纲")
+    # The keyed text area is seeded through its key: it ignores `value` once rendered
+    if "outline_edit_area" not in st.session_state:
+        st.session_state.outline_edit_area = st.session_state.outline_content
     st.session_state.outline_content = st.text_area(
-        "预览和编辑大纲:", 
-        value=st.session_state.outline_content, 
+        "预览和编辑大纲:",
         height=300,
         key="outline_edit_area"
     )
 
     if st.session_state.outline_content:
         if st.button("🧐 AI 评分大纲", use_container_width=True):
-            with st.spinner("AI 正在对大纲进行评分，请稍候..."):
+            with st.container(border=True): # Streamed output renders here as it arrives
                 api_conf = st.session_state.api_config
                 system_msg, user_msg_text_template, params = get_prompt_content( # Renamed for clarity
                     "outline_scoring",
@@ -102,15 +109,18 @@ def outline_generation_page():
                 st.session_state.last_score_request = {"system": system_msg, "user": user_msg_text_template, "params": params}
 
                 if user_msg_text_template is not None: # Check if prompt text was successfully prepared
-                    score_feedback = call_openai_api(
+                    score_feedback = write_stream_with_stats(stream_openai_api(
                         api_key=api_conf["api_key"],
                         base_url=api_conf["base_url"],
                         model=api_conf["selected_model"], 
                         system_message=system_msg,
                         user_message_text=user_msg_text_template, # Changed from user_message
                         temperature=params.get("temperature", 0.5),
-                        max_tokens=params.get("max_tokens", 1000)
-                    )
+                        max_tokens=params.get("max_tokens", 1000),
+                        timeout=params.get("timeout"),
+                        cache_ttl_hours=params.get("cache_ttl_hours"),
+                        task_name="outline_scoring"
+                    ))
                     if score_feedback:
                         st.session_state.outline_score_feedback = score_feedback
                     else:
@@ -141,4 +151,5 @@ def outline_generation_page():
 
 
 if __name__ == "__main__":
-    outline_generation_page()
\ No newline at end of file
+    outline_generation_page()
+    autosave_project(st.session_state) # Writes only the artifacts this run changed
@@ -1,6 +1,7 @@
 import streamlit as st
-from utils.api_utils import call_openai_api, get_prompt_content
+from utils.api_utils import stream_openai_api, write_stream_with_stats, get_prompt_content
 from utils.config_loader import get_prompts
+from utils.project_store import autosave_project
 
 # Page Configuration
 st.set_page_config(page_title="口播稿生成", layout="wide", initial_sidebar_state="expanded")
@@ -56,7 +57,7 @@ def script_generation_page():
     )
 
     if st.button("🚀 生成口播稿", type="primary", use_container_width=True):
-        with st.spinner("AI 正在生成口播稿中，请稍候..."):
+        with st.container(border=True): # Streamed output renders here as it arrives
             api_conf = st.session_state.api_config
             system_msg, user_msg_text_template, params = get_prompt_content( # Renamed for clarity
                 "script_generation",
@@ -70,17 +71,21 @@ def script_generation_page():
             st.session_state.last_script_request = {"system": system_msg, "user": user_msg_text_template, "params": params}
 
             if user_msg_text_template is not None: # Check if prompt text was successfully prepared
-                generated_script = call_openai_api(
+                generated_script = write_stream_with_stats(stream_openai_api(
                     api_key=api_conf["api_key"],
                     base_url=api_conf["base_url"],
                     model=api_conf["selected_model"],
                     system_message=system_msg,
                     user_message_text=user_msg_text_template, # Changed from user_message
                     temperature=params.get("temperature", 0.7),
-                    max_tokens=params.get("max_tokens", 3000) 
-                )
+                    max_tokens=params.get("max_tokens", 3000),
+                    timeout=params.get("timeout"),
+                    cache_ttl_hours=params.get("cache_ttl_hours"),
+                    task_name="script_generation"
+                ))
                 if generated_script:
                     st.session_state.script_content = generated_script
+                    st.session_state.script_edit_area = generated_script
                     st.session_state.script_score_feedback = "" # Clear previous score
                 else:
                     st.error("未能生成口播稿。请检查 API 配置或稍后再试。")
@@ -89,16 +94,18 @@ def script_generation_page():
     
     st.divider()
     st.subheader("AI 生成的口播稿")
+    # The keyed text area is seeded through its key: it ignores `value` once rendered
+    if "script_edit_area" not in st.session_state:
+        st.session_state.script_edit_area = st.session_state.script_content
     st.session_state.script_content = st.text_area(
         "预览和编辑口播稿:",
-        value=st.session_state.script_content,
         height=400,
         key="script_edit_area"
     )
 
     if st.session_state.script_content:
         if st.button("🧐 AI 评分口播稿", use_container_width=True):
-            with st.spinner("AI 正在对口播稿进行评分，请稍候..."):
+            with st.container(border=True): # Streamed output renders here as it arrives
                 api_conf = st.session_state.api_config
                 system_msg, user_msg_text_template, params = get_prompt_content( # Renamed for clarity
                     "script_scoring",
@@ -109,15 +116,18 @@ def script_generation_page():
                 st.session_state.last_script_score_request = {"system": system_msg, "user": user_msg_text_template, "params": params}
 
                 if user_msg_text_template is not None: # Check if prompt text was successfully prepared
-                    score_feedback = call_openai_api(
+                    score_feedback = write_stream_with_stats(stream_openai_api(
                         api_key=api_conf["api_key"],
                         base_url=api_conf["base_url"],
                         model=api_conf["selected_model"],
                         system_message=system_msg,
                         user_message_text=user_msg_text_template, # Changed from user_message
                         temperature=params.get("temperature", 0.5),
-                        max_tokens=params.get("max_tokens", 1000)
-                    )
+                        max_tokens=params.get("max_tokens", 1000),
+                        timeout=params.get("timeout"),
+                        cache_ttl_hours=params.get("cache_ttl_hours"),
+                        task_name="script_scoring"
+                    ))
                     if score_feedback:
                         st.session_state.script_score_feedback = score_feedback
                     else:
@@ -146,4 +156,5 @@ def script_generation_page():
             st.page_link("pages/03_🎬_分镜脚本.py", label="前往分镜脚本生成", icon="🎬")
 
 if __name__ == "__main__":
-    script_generation_page()
\ No newline at end of file
+    script_generation_page()
+    autosave_project(st.session_state) # Writes only the artifacts this run changed
@@ -1,9 +1,17 @@
 import streamlit as st
 import pandas as pd
 import json
-from utils.api_utils import call_openai_api, get_prompt_content
-from utils.config_loader import get_prompts
+from utils.api_utils import call_openai_api, stream_openai_api, write_table_stream_with_stats, get_prompt_content
+from utils.async_core import run_chat_completions
+from utils.config_loader import get_prompts, get_provider_concurrency_limit
 from utils.parsing_utils import parse_markdown_table_to_df
+from utils.project_store import autosave_project
+from utils.storyboard_model import session_storyboard_model, storyboard_to_json
+from utils.storyboard_utils import (
+    DEFAULT_CONTEXT_ROWS, DEFAULT_MAX_ROWS_PER_REQUEST, DEFAULT_SEGMENT_MAX_CHARS, NO_CONTEXT, SCENE_NUMBER_COLUMN,
+    merge_regenerated_rows, merge_storyboard_segments, plan_row_regeneration, rows_to_markdown, split_script_into_segments
+)
+from utils.structured_output import parse_storyboard_response, response_format_for, with_structured_output_instruction
 
 # Page Configuration
 st.set_page_config(page_title="分镜脚本生成", layout="wide", initial_sidebar_state="expanded")
@@ -11,6 +19,19 @@ st.sidebar.header("分镜脚本生成")
 
 PROMPTS_CONFIG = get_prompts()
 
+DEFAULT_MAX_CONCURRENT_SEGMENTS = 4 # Used when the provider declares no max_concurrent_requests
+STORYBOARD_TASK = "storyboard_generation"
+ROW_REGENERATION_TASK = "storyboard_row_regeneration"
+SELECT_COLUMN = "重新生成" # Checkbox column shown in the editor only, never stored in storyboard_data
+EDITOR_KEY = "storyboard_editor"
+SYNCED_EDITOR_STATE_KEY = "storyboard_editor_synced" # (storyboard version, editor state) of the last structural edit applied
+
+def with_select_column(storyboard_df: pd.DataFrame) -> pd.DataFrame:
+    """The editor's input frame: the storyboard plus an unchecked SELECT_COLUMN (built once per storyboard version)."""
+    editor_df = storyboard_df.copy()
+    editor_df.insert(0, SELECT_COLUMN, False)
+    return editor_df
+
 def check_prerequisites():
     """Checks if API is configured and script content exists."""
     if "api_config" not in st.session_state or not st.session_state.api_config.get("configured", False):
@@ -24,6 +45,139 @@ def check_prerequisites():
         return False
     return True
 
+def generate_storyboard_in_segments(segments: list, params: dict):
+    """
+    Generates the storyboard for a long script segment by segment, concurrently, and
+    merges the tables (renumbering 画面序号). Returns the merged DataFrame, or None if
+    any segment failed (a partial storyboard would silently drop narration).
+    """
+    api_conf = st.session_state.api_config
+    structured = api_conf.get("structured_output", False)
+    requests = {}
+    for segment_index, segment in enumerate(segments):
+        system_msg, user_msg_text, _ = get_prompt_content(
+            STORYBOARD_TASK, api_conf["selected_model"], PROMPTS_CONFIG, {"script_content": segment}
+        )
+        if user_msg_text is None:
+            return None
+        requests[segment_index] = dict(
+            api_key=api_conf["api_key"],
+            base_url=api_conf["base_url"],
+            model=api_conf["selected_model"],
+            system_message=with_structured_output_instruction(system_msg, STORYBOARD_TASK) if structured else system_msg,
+            user_message_text=user_msg_text,
+            temperature=params.get("temperature", 0.6),
+            max_tokens=params.get("max_tokens", 2500),
+            timeout=params.get("timeout"),
+            cache_ttl_hours=params.get("cache_ttl_hours"),
+            task_name=STORYBOARD_TASK,
+            response_format=response_format_for(STORYBOARD_TASK) if structured else None
+        )
+
+    progress_bar = st.progress(0.0, text=f"已完成 0/{len(requests)} 段")
+    segment_status = st.empty()
+    completed = []
+    failed = {}
+
+    def on_result(segment_index, result):
+        completed.append(segment_index)
+        if not result.ok:
+            failed[segment_index] = result.error_message
+        elif parse_storyboard_response(result.content, structured).empty:
+            failed[segment_index] = "未能从 AI 返回内容中解析出分镜表格"
+        elif result.truncated:
+            failed[segment_index] = "输出已达到 max_tokens 上限，表格可能被截断"
+        status = "✅" if segment_index not in failed else "❌"
+        segment_status.caption(f"{status} 第 {segment_index + 1} 段 ({result.latency:.1f}s)")
+        progress_bar.progress(len(completed) / len(requests), text=f"已完成 {len(completed)}/{len(requests)} 段")
+
+    results = run_chat_completions(
+        requests,
+        max_concurrency=get_provider_concurrency_limit(api_conf.get("selected_provider_name"), DEFAULT_MAX_CONCURRENT_SEGMENTS),
+        on_result=on_result
+    )
+    if failed:
+        for segment_index, error_message in sorted(failed.items()):
+            st.error(f"第 {segment_index + 1} 段生成失败：{error_message}")
+            if results[segment_index].content:
+                st.text_area(f"第 {segment_index + 1} 段 AI 原始返回内容（供调试）：", value=results[segment_index].content,
+                             height=200, key=f"storyboard_segment_raw_{segment_index}")
+        return None
+    return merge_storyboard_segments([
+        parse_storyboard_response(results[segment_index].content, structured) for segment_index in range(len(segments))
+    ])
+
+def regenerate_selected_rows(storyboard_df: pd.DataFrame, positions: list, revision_notes: str):
+    """
+    Regenerates the prompt and description of the selected rows, one concurrent request per
+    run of consecutive rows (with neighbouring rows as context), and merges the replies in
+    place. Returns (updated DataFrame, number of rows regenerated, error messages); rows
+    that failed keep their previous content.
+    """
+    api_conf = st.session_state.api_config
+    _, _, params = get_prompt_content(ROW_REGENERATION_TASK, api_conf["selected_model"], PROMPTS_CONFIG)
+    if params is None:
+        return storyboard_df, 0, ["未能准备重新生成画面的提示词。"]
+    groups = plan_row_regeneration(
+        len(storyboard_df), positions,
+        int(params.get("context_rows", DEFAULT_CONTEXT_ROWS)),
+        int(params.get("max_rows_per_request", DEFAULT_MAX_ROWS_PER_REQUEST))
+    )
+
+    requests = {}
+    for group_index, group in enumerate(groups):
+        system_msg, user_msg_text, params = get_prompt_content(
+            ROW_REGENERATION_TASK, api_conf["selected_model"], PROMPTS_CONFIG, {
+                "context_before": rows_to_markdown(storyboard_df, group.context_before),
+                "target_rows": rows_to_markdown(storyboard_df, group.positions),
+                "context_after": rows_to_markdown(storyboard_df, group.context_after),
+                "revision_notes": revision_notes.strip() or NO_CONTEXT,
+            }
+        )
+        if user_msg_text is None:
+            return storyboard_df, 0, ["未能准备重新生成画面的提示词。"]
+        requests[group_index] = dict(
+            api_key=api_conf["api_key"],
+            base_url=api_conf["base_url"],
+            model=api_conf["selected_model"],
+            system_message=system_msg,
+            user_message_text=user_msg_text,
+            temperature=params.get("temperature", 0.6),
+            max_tokens=params.get("max_tokens", 8192),
+            timeout=params.get("timeout"),
+            cache_ttl_hours=params.get("cache_ttl_hours"),
+            task_name=ROW_REGENERATION_TASK
+        )
+
+    progress_bar = st.progress(0.0, text=f"已完成 0/{len(requests)} 组")
+    completed = []
+
+    def on_result(group_index, result):
+        completed.append(group_index)
+        progress_bar.progress(len(completed) / len(requests), text=f"已完成 {len(completed)}/{len(requests)} 组")
+
+    results = run_chat_completions(
+        requests,
+        max_concurrency=get_provider_concurrency_limit(api_conf.get("selected_provider_name"), DEFAULT_MAX_CONCURRENT_SEGMENTS),
+        on_result=on_result
+    )
+
+    updated_df = storyboard_df
+    regenerated_count = 0
+    errors = []
+    for group_index, group in enumerate(groups):
+        result = results[group_index]
+        if not result.ok:
+            scene_numbers = "、".join(str(storyboard_df.iloc[position][SCENE_NUMBER_COLUMN]) for position in group.positions)
+            errors.append(f"画面 {scene_numbers} 重新生成失败：{result.error_message}")
+            continue
+        updated_df, missing = merge_regenerated_rows(updated_df, group.positions, parse_markdown_table_to_df(result.content))
+        regenerated_count += len(group.positions) - len(missing)
+        if missing:
+            missing_numbers = "、".join(str(storyboard_df.iloc[position][SCENE_NUMBER_COLUMN]) for position in missing)
+            errors.append(f"AI 返回内容中缺少画面 {missing_numbers}，这些画面保持不变。")
+    return updated_df, regenerated_count, errors
+
 def storyboard_generation_page():
     st.title("步骤 3: 🎬 分镜脚本生成")
     st.markdown("根据已确认的口播稿，AI 将为您生成分镜脚本。")
@@ -44,34 +198,67 @@ def storyboard_generation_page():
     st.divider()
 
     if st.button("🚀 生成/重新生成分镜脚本", type="primary", use_container_width=True):
-        with st.spinner("AI 正在生成分镜脚本中，请稍候..."):
+        with st.container(border=True): # Streamed output renders here as it arrives
             api_conf = st.session_state.api_config
             system_msg, user_msg_text_template, params = get_prompt_content( # Renamed for clarity
-                "storyboard_generation",
+                STORYBOARD_TASK,
                 api_conf["selected_model"],
                 PROMPTS_CONFIG,
                 {"script_content": st.session_state.script_content}
             )
             st.session_state.last_storyboard_request = {"system": system_msg, "user": user_msg_text_template, "params": params}
 
-            if user_msg_text_template is not None: # Check if prompt text was successfully prepared
-                markdown_table_output = call_openai_api(
-                    api_key=api_conf["api_key"],
-                    base_url=api_conf["base_url"],
-                    model=api_conf["selected_model"],
-                    system_message=system_msg,
-                    user_message_text=user_msg_text_template, # Changed from user_message
-                    temperature=params.get("temperature", 0.6), 
-                    max_tokens=params.get("max_tokens", 2500) 
-                )
-                if markdown_table_output:
-                    parsed_df = parse_markdown_table_to_df(markdown_table_output)
+            # Long scripts are split on paragraph boundaries and the segments generated concurrently,
+            # so no single response outgrows max_tokens
+            segments = split_script_into_segments(
+                st.session_state.script_content, int((params or {}).get("segment_max_chars", DEFAULT_SEGMENT_MAX_CHARS))
+            )
+            if user_msg_text_template is not None and len(segments) > 1:
+                st.info(f"口播稿较长，已按段落拆分为 {len(segments)} 段并发生成分镜。")
+                merged_df = generate_storyboard_in_segments(segments, params)
+                if merged_df is not None and not merged_df.empty:
+                    st.session_state.storyboard_data = merged_df
+                    st.success(f"分镜脚本已生成！共 {len(merged_df)} 个画面。")
+                else:
+                    st.error("未能生成完整的分镜脚本，现有分镜未被替换。请检查上方错误后重试。")
+            elif user_msg_text_template is not None: # Check if prompt text was successfully prepared
+                if api_conf.get("structured_output", False):
+                    # JSON schema output is validated locally; it cannot be shown row by row, so it is not streamed
+                    raw_storyboard_output = call_openai_api(
+                        api_key=api_conf["api_key"],
+                        base_url=api_conf["base_url"],
+                        model=api_conf["selected_model"],
+                        system_message=with_structured_output_instruction(system_msg, STORYBOARD_TASK),
+                        user_message_text=user_msg_text_template,
+                        temperature=params.get("temperature", 0.6),
+                        max_tokens=params.get("max_tokens", 2500),
+                        timeout=params.get("timeout"),
+                        cache_ttl_hours=params.get("cache_ttl_hours"),
+                        task_name=STORYBOARD_TASK,
+                        response_format=response_format_for(STORYBOARD_TASK)
+                    )
+                    parsed_df = parse_storyboard_response(raw_storyboard_output, structured=True) if raw_storyboard_output else None
+                else:
+                    # Rows are parsed and shown as soon as each line of the table arrives
+                    raw_storyboard_output, parsed_df = write_table_stream_with_stats(stream_openai_api(
+                        api_key=api_conf["api_key"],
+                        base_url=api_conf["base_url"],
+                        model=api_conf["selected_model"],
+                        system_message=system_msg,
+                        user_message_text=user_msg_text_template, # Changed from user_message
+                        temperature=params.get("temperature", 0.6), 
+                        max_tokens=params.get("max_tokens", 2500),
+                        timeout=params.get("timeout"),
+                        cache_ttl_hours=params.get("cache_ttl_hours"),
+                        task_name=STORYBOARD_TASK
+                    ), row_label="个画面")
+                if raw_storyboard_output:
                     if not parsed_df.empty:
                         st.session_state.storyboard_data = parsed_df
-                        st.success("分镜脚本已生成！")
+                        st.success(f"分镜脚本已生成！共 {len(parsed_df)} 个画面。")
                     else:
                         st.error("未能从 AI 返回内容中解析出有效的分镜表格数据。请检查 AI 返回或提示词。")
-                        st.text_area("AI原始返回内容（供调试）：", value=markdown_table_output, height=200)
+                        st.text_area("AI原始返回内容（供调试）：", value=raw_storyboard_output, height=200)
                 else:
                     st.error("未能生成分镜脚本。请检查 API 配置或稍后再试。")
             else:
@@ -81,24 +268,66 @@ def storyboard_generation_page():
     st.subheader("分镜脚本表格 (可编辑)")
 
     if isinstance(st.session_state.storyboard_data, pd.DataFrame) and not st.session_state.storyboard_data.empty:
-        edited_df = st.data_editor(
-            st.session_state.storyboard_data, 
+        model = session_storyboard_model(st.session_state)
+        edited_with_selection = st.data_editor(
+            model.view("editor_frame", with_select_column),
             num_rows="dynamic", 
             use_container_width=True,
-            key="storyboard_editor"
+            key=EDITOR_KEY,
+            column_config={SELECT_COLUMN: st.column_config.CheckboxColumn(SELECT_COLUMN, help="勾选需要单独重新生成的画面", default=False)}
         )
-        if edited_df is not None: 
-            if not st.session_state.storyboard_data.equals(edited_df):
-                 st.session_state.storyboard_data = edited_df
-                 st.caption("更改已在编辑器中反映。")
+        selected_positions = [
+            position for position, selected in enumerate(edited_with_selection[SELECT_COLUMN].tolist()) if selected is True
+        ]
+        # The editor state lists the edited cells, so unchanged reruns skip the comparison and
+        # cell edits rehash only their rows; added/deleted rows rehash the whole table once,
+        # after which reruns with the same editor state are recognised and skipped
+        editor_state = st.session_state.get(EDITOR_KEY) or {}
+        edited_positions = [
+            position for position, changes in editor_state.get("edited_rows", {}).items() if set(changes) - {SELECT_COLUMN}
+        ]
+        structural_edit = bool(editor_state.get("added_rows") or editor_state.get("deleted_rows"))
+        editor_state_signature = json.dumps(dict(editor_state), sort_keys=True, default=str) if structural_edit else None
+        already_synced = structural_edit and st.session_state.get(SYNCED_EDITOR_STATE_KEY) == (model.version, editor_state_signature)
+        if (structural_edit or edited_positions) and not already_synced:
+            version = model.version
+            changed_positions = model.sync(
+                edited_with_selection.drop(columns=[SELECT_COLUMN]),
+                positions=None if structural_edit else edited_positions
+            )
+            if structural_edit:
+                st.session_state[SYNCED_EDITOR_STATE_KEY] = (model.version, editor_state_signature)
+            if model.version != version:
+                st.session_state.storyboard_data = model.df
+                st.caption(f"更改已在编辑器中反映（{len(changed_positions)} 个画面有改动）。" if changed_positions else "更改已在编辑器中反映。")
+        if not structural_edit:
+            st.session_state.pop(SYNCED_EDITOR_STATE_KEY, None) # An identical edit made later is a new edit
+        edited_df = model.df
+
+        # Regenerate only the checked rows; narration is kept, prompts and descriptions are replaced in place
+        for error_message in st.session_state.pop("storyboard_row_regeneration_errors", []):
+            st.error(error_message)
+        if selected_positions:
+            revision_notes = st.text_input(
+                "修改意见（可选）:", key="storyboard_row_revision_notes",
+                placeholder="例如：画面更偏向宏大的宇宙远景，避免出现人物特写"
+            )
+            if st.button(f"🔁 重新生成选中的 {len(selected_positions)} 个画面", key="regenerate_selected_rows_button", use_container_width=True):
+                with st.container(border=True):
+                    updated_df, regenerated_count, errors = regenerate_selected_rows(edited_df, selected_positions, revision_notes)
+                st.session_state.storyboard_row_regeneration_errors = errors # Shown after the rerun below
+                if regenerated_count:
+                    st.session_state.storyboard_data = updated_df
+                    st.session_state.pop(EDITOR_KEY, None) # Clears the checkboxes; edits are already in storyboard_data
+                    st.toast(f"已重新生成 {regenerated_count} 个画面。")
+                st.rerun()
 
 
-        # Export to JSON
+        # Export to JSON; serialized only when the button is clicked, at most once per storyboard version
         if not edited_df.empty: 
-            storyboard_json = edited_df.to_json(orient="records", indent=4, force_ascii=False)
             st.download_button(
                 label="📥 下载分镜脚本 (JSON)",
-                data=storyboard_json,
+                data=lambda: model.view("export_json", storyboard_to_json),
                 file_name="storyboard_script.json",
                 mime="application/json",
                 use_container_width=True
@@ -122,4 +351,5 @@ def storyboard_generation_page():
 
 
 if __name__ == "__main__":
-    storyboard_generation_page()
\ No newline at end of file
+    storyboard_generation_page()
+    autosave_project(st.session_state) # Writes only the artifacts this run changed
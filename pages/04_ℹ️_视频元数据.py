@@ -2,6 +2,11 @@ import streamlit as st
 import pandas as pd
 from utils.api_utils import call_openai_api, get_prompt_content
 from utils.config_loader import get_prompts
+from utils.project_store import autosave_project
+from utils.structured_output import (
+    VIDEO_METADATA_TASK, format_video_metadata, parse_video_metadata_response, response_format_for,
+    with_structured_output_instruction
+)
 import json # For potential display or processing if AI returns JSON string
 import re # For more robust parsing if needed
 
@@ -65,6 +70,8 @@ def metadata_generation_page():
         st.session_state.last_metadata_request = {}
     if "raw_ai_metadata_output_for_debug" not in st.session_state:
         st.session_state.raw_ai_metadata_output_for_debug = ""
+    if "video_metadata_fields" not in st.session_state: # Validated structured output, None in Markdown mode
+        st.session_state.video_metadata_fields = None
 
     script_content_for_metadata = st.session_state.get("script_content", "口播稿内容尚未生成。") # Get script content
 
@@ -80,11 +87,12 @@ def metadata_generation_page():
         else:
             with st.spinner("AI 正在生成视频元数据中，请稍候..."):
                 api_conf = st.session_state.api_config
+                structured = api_conf.get("structured_output", False)
                 system_msg, user_msg_text_template, params = get_prompt_content(
-                    "video_metadata_generation",
+                    VIDEO_METADATA_TASK,
                     api_conf["selected_model"],
                     PROMPTS_CONFIG,
-                    {"storyboard_summary_or_full_script": script_content_for_metadata, "target_audience_or_style": ""} # Use script_content
+                    {"storyboard_summary_or_full_script": script_content_for_metadata} # Use script_content
                 )
                 st.session_state.last_metadata_request = {"system": system_msg, "user": user_msg_text_template, "params": params}
 
@@ -93,19 +101,30 @@ def metadata_generation_page():
                         api_key=api_conf["api_key"],
                         base_url=api_conf["base_url"],
                         model=api_conf["selected_model"],
-                        system_message=system_msg,
+                        system_message=with_structured_output_instruction(system_msg, VIDEO_METADATA_TASK) if structured else system_msg,
                         user_message_text=user_msg_text_template, # Changed from user_message
                         temperature=params.get("temperature", 0.7),
-                        max_tokens=params.get("max_tokens", 1500) 
+                        max_tokens=params.get("max_tokens", 1500),
+                        timeout=params.get("timeout"),
+                        cache_ttl_hours=params.get("cache_ttl_hours"),
+                        task_name=VIDEO_METADATA_TASK,
+                        response_format=response_format_for(VIDEO_METADATA_TASK) if structured else None
                     )
                     st.session_state.raw_ai_metadata_output_for_debug = raw_metadata_output # Store for debugging
                     
                     if raw_metadata_output:
-                        st.session_state.unified_metadata_text = raw_metadata_output # Store as single text
+                        # Structured output is rendered to the same editable text; a reply that fails validation is kept as-is
+                        metadata_text, st.session_state.video_metadata_fields = parse_video_metadata_response(raw_metadata_output, structured)
+                        st.session_state.unified_metadata_text = metadata_text # Store as single text
+                        st.session_state.unified_metadata_edit_area = metadata_text
                         st.success("视频元数据已生成/更新！")
+                        if structured and st.session_state.video_metadata_fields is None:
+                            st.warning("AI 返回内容未通过 JSON 校验，已按原文保存。")
                     else:
                         st.error("未能生成视频元数据。请检查 API 配置或稍后再试。")
                         st.session_state.unified_metadata_text = "AI未能返回元数据。" # Placeholder on error
+                        st.session_state.unified_metadata_edit_area = st.session_state.unified_metadata_text
+                        st.session_state.video_metadata_fields = None
                 else:
                     st.error("未能准备生成视频元数据的提示词。")
     
@@ -114,12 +133,18 @@ def metadata_generation_page():
 
     # Unified Metadata Text Area
     st.markdown("**统一视频元数据 (标题、描述、关键词等):**")
+    # The keyed text area is seeded through its key: it ignores `value` once rendered
+    if "unified_metadata_edit_area" not in st.session_state:
+        st.session_state.unified_metadata_edit_area = st.session_state.get("unified_metadata_text", "")
     st.session_state.unified_metadata_text = st.text_area(
         "编辑AI生成的元数据:",
-        value=st.session_state.get("unified_metadata_text", ""),
         height=300,
         key="unified_metadata_edit_area"
     )
+    # Hand edits make the structured fields stale; the text is what later steps use
+    if st.session_state.video_metadata_fields is not None and \
+            st.session_state.unified_metadata_text != format_video_metadata(st.session_state.video_metadata_fields):
+        st.session_state.video_metadata_fields = None
 
 
     # --- Optional: View AI Request & Raw Output ---
@@ -149,4 +174,5 @@ def metadata_generation_page():
 
 
 if __name__ == "__main__":
-    metadata_generation_page()
\ No newline at end of file
+    metadata_generation_page()
+    autosave_project(st.session_state) # Writes only the artifacts this run changed
@@ -1,15 +1,21 @@
 import streamlit as st
 import pandas as pd
 from utils.api_utils import call_openai_api, get_prompt_content
-from utils.config_loader import get_prompts
-import base64 # For encoding image data
-import io # For image handling
+from utils.async_core import run_chat_completions
+from utils.config_loader import get_prompts, get_provider_concurrency_limit, get_image_preprocessing_settings
+from utils.image_utils import prepare_uploaded_image
+from utils.project_store import autosave_project
+from utils.storyboard_model import scene_rows, session_storyboard_model
 
 # Page Configuration
 st.set_page_config(page_title="图生视频提示词", layout="wide", initial_sidebar_state="expanded")
 st.sidebar.header("图生视频提示词")
 
 PROMPTS_CONFIG = get_prompts()
+IMAGE_SETTINGS = get_image_preprocessing_settings()
+
+DEFAULT_MAX_CONCURRENT_SCENES = 4 # Used when the provider declares no max_concurrent_requests
+MAX_CONCURRENT_SCENES_LIMIT = 16
 
 def check_prerequisites():
     """Checks if API is configured and storyboard_data exists."""
@@ -24,6 +30,76 @@ def check_prerequisites():
         return False
     return True
 
+def encode_uploaded_image(uploaded_file):
+    """Returns (base64 data, media type) for an uploaded image, downsized and memoized per upload."""
+    return prepare_uploaded_image(uploaded_file, IMAGE_SETTINGS)
+
+def generate_image_prompts_concurrently(scene_inputs: dict, max_concurrency: int):
+    """
+    Generates image-to-video prompts for many scenes in parallel.
+
+    Args:
+        scene_inputs (dict): {scene_id: (scene_description, uploaded_file)}
+        max_concurrency (int): Maximum number of requests in flight at once.
+    """
+    api_conf = st.session_state.api_config
+    requests = {}
+    failed_scene_ids = []
+    for scene_id, (scene_description, uploaded_file) in scene_inputs.items():
+        system_msg, user_msg_text_template, params = get_prompt_content(
+            "image_to_video_prompt_generation",
+            api_conf["selected_model"],
+            PROMPTS_CONFIG,
+            {"scene_description": scene_description}
+        )
+        if user_msg_text_template is None:
+            failed_scene_ids.append(scene_id)
+            continue
+        try:
+            image_base64_data, image_media_type = encode_uploaded_image(uploaded_file)
+        except Exception as e:
+            st.error(f"处理分镜 {scene_id} 上传的图片时出错: {e}")
+            failed_scene_ids.append(scene_id)
+            continue
+        requests[scene_id] = dict(
+            api_key=api_conf["api_key"],
+            base_url=api_conf["base_url"],
+            model=api_conf["selected_model"],
+            system_message=system_msg,
+            user_message_text=user_msg_text_template,
+            image_data_base64=image_base64_data,
+            image_media_type=image_media_type,
+            temperature=params.get("temperature", 0.7),
+            max_tokens=params.get("max_tokens", 300),
+            timeout=params.get("timeout"),
+            cache_ttl_hours=params.get("cache_ttl_hours"),
+            task_name="image_to_video_prompt_generation"
+        )
+
+    if requests:
+        progress_bar = st.progress(0.0, text=f"已完成 0/{len(requests)}")
+        latest_status = st.empty()
+        completed_scene_ids = []
+
+        def on_result(scene_id, result):
+            completed_scene_ids.append(scene_id)
+            if result.ok:
+                # Fill results in as they land; also reset the (not yet rendered) editor widget for this scene
+                st.session_state.image_to_video_prompts[scene_id] = result.content
+                st.session_state[f"prompt_edit_{scene_id}"] = result.content
+                latest_status.caption(f"✅ 分镜 {scene_id} 已完成 ({result.latency:.1f}s)")
+            else:
+                failed_scene_ids.append(scene_id)
+                latest_status.caption(f"❌ 分镜 {scene_id}: {result.error_message}")
+            progress_bar.progress(len(completed_scene_ids) / len(requests), text=f"已完成 {len(completed_scene_ids)}/{len(requests)}")
+
+        run_chat_completions(requests, max_concurrency=max_concurrency, on_result=on_result)
+
+    if failed_scene_ids:
+        st.warning(f"以下分镜未能生成提示词，可单独重试: {', '.join(failed_scene_ids)}")
+    else:
+        st.success(f"已为 {len(scene_inputs)} 个分镜生成提示词！")
+
 def image_to_video_prompt_page():
     st.title("步骤 4: 🖼️ 图生视频提示词生成")
     st.markdown("为每个分镜上传参考图片，并结合画面描述生成图生视频的 AI 提示词。")
@@ -44,10 +120,47 @@ def image_to_video_prompt_page():
         st.error("分镜脚本中缺少 '画面序号' 列。无法继续。")
         st.stop()
 
-    for idx, row in storyboard_df.iterrows():
-        scene_id = str(row['画面序号']) 
-        scene_description = row.get('画面描述', '无画面描述')
-        scene_narration = row.get('中文口播文案', '无口播文案') # 新增获取口播文案
+    # --- Batch mode: all scenes with an uploaded reference image ---
+    # File uploaders keep their files in session_state under their widget keys, so the
+    # batch can read uploads before the per-scene widgets below are rendered.
+    batch_scene_inputs = {}
+    # Scene fields are extracted once per storyboard version, not with iterrows() on every rerun
+    scenes = session_storyboard_model(st.session_state).view("scene_rows", scene_rows)
+    for scene in scenes:
+        uploaded_file = st.session_state.get(f"uploader_{scene['scene_id']}")
+        if uploaded_file is not None:
+            batch_scene_inputs[scene["scene_id"]] = (scene["description"], uploaded_file)
+
+    with st.container(border=True):
+        st.markdown(f"**批量生成**：并发为所有已上传参考图片的分镜生成提示词（当前 {len(batch_scene_inputs)} 个）。")
+        batch_col1, batch_col2 = st.columns([0.6, 0.4])
+        with batch_col1:
+            only_missing_prompts = st.checkbox("跳过已有提示词的分镜", value=True, key="batch_i2v_only_missing")
+        with batch_col2:
+            max_concurrency = st.number_input(
+                "最大并发请求数:",
+                min_value=1,
+                max_value=MAX_CONCURRENT_SCENES_LIMIT,
+                value=min(
+                    get_provider_concurrency_limit(st.session_state.api_config.get("selected_provider_name"), DEFAULT_MAX_CONCURRENT_SCENES),
+                    MAX_CONCURRENT_SCENES_LIMIT
+                ),
+                key="batch_i2v_max_concurrency",
+                help="同时发往 API 的请求数上限，默认取自 prompts.yaml 中该提供商的 max_concurrent_requests。如遇频率限制 (429)，请调低此值。"
+            )
+        if only_missing_prompts:
+            batch_scene_inputs = {
+                scene_id: scene_input for scene_id, scene_input in batch_scene_inputs.items()
+                if not st.session_state.image_to_video_prompts.get(scene_id)
+            }
+        if st.button(f"🚀 批量生成提示词 ({len(batch_scene_inputs)} 个分镜)", key="batch_generate_i2v_prompts",
+                     type="primary", use_container_width=True, disabled=not batch_scene_inputs):
+            generate_image_prompts_concurrently(batch_scene_inputs, int(max_concurrency))
+
+    for scene in scenes:
+        scene_id = scene["scene_id"]
+        scene_description = scene["description"]
+        scene_narration = scene["narration"] # 新增获取口播文案
 
         with st.container(border=True):
             st.subheader(f"分镜 {scene_id}")
@@ -64,29 +177,27 @@ def image_to_video_prompt_page():
                     key=f"uploader_{scene_id}" # Unique key for each uploader
                 )
 
-                image_base64_data = None
-                image_media_type = None
-
                 if uploaded_file is not None:
                     st.session_state.uploaded_files_info[scene_id] = uploaded_file.name
                     st.image(uploaded_file, caption=f"参考图: {uploaded_file.name}", width=200)
-                    try:
-                        image_bytes = uploaded_file.getvalue()
-                        image_base64_data = base64.b64encode(image_bytes).decode("utf-8")
-                        image_media_type = uploaded_file.type
-                    except Exception as e:
-                        st.error(f"处理上传的图片时出错: {e}")
-                        image_base64_data = None # Ensure it's None if error
                 
                 elif scene_id in st.session_state.uploaded_files_info and uploaded_file is None: 
                     # File was previously uploaded but now removed by user
                     del st.session_state.uploaded_files_info[scene_id]
-                    # image_base64_data and image_media_type remain None
 
 
                 if st.button(f"🤖 为分镜 {scene_id} 生成提示词", key=f"generate_btn_{scene_id}", use_container_width=True):
                     with st.spinner(f"AI 正在为分镜 {scene_id} 生成提示词..."):
                         api_conf = st.session_state.api_config
+
+                        # Images are only downsized/encoded when actually sent (and memoized per upload)
+                        image_base64_data = None
+                        image_media_type = None
+                        if uploaded_file is not None:
+                            try:
+                                image_base64_data, image_media_type = encode_uploaded_image(uploaded_file)
+                            except Exception as e:
+                                st.error(f"处理上传的图片时出错: {e}")
                         
                         prompt_vars = {"scene_description": scene_description}
                         system_msg, user_msg_text_template, params = get_prompt_content(
@@ -107,7 +218,10 @@ def image_to_video_prompt_page():
                                 image_data_base64=image_base64_data,     # Base64 image data
                                 image_media_type=image_media_type,       # Media type of the image
                                 temperature=params.get("temperature", 0.7),
-                                max_tokens=params.get("max_tokens", 300) 
+                                max_tokens=params.get("max_tokens", 300),
+                                timeout=params.get("timeout"),
+                                cache_ttl_hours=params.get("cache_ttl_hours"),
+                                task_name="image_to_video_prompt_generation"
                             )
                             if generated_prompt:
                                 st.session_state.image_to_video_prompts[scene_id] = generated_prompt
@@ -145,4 +259,5 @@ def image_to_video_prompt_page():
             st.page_link("pages/06_🌍_多语言翻译.py", label="前往多语言翻译", icon="🌍")
 
 if __name__ == "__main__":
-    image_to_video_prompt_page()
\ No newline at end of file
+    image_to_video_prompt_page()
+    autosave_project(st.session_state) # Writes only the artifacts this run changed
@@ -1,7 +1,15 @@
 import streamlit as st
-from utils.api_utils import call_openai_api, get_prompt_content
-from utils.config_loader import get_prompts
-import pandas as pd
+from utils.api_utils import stream_openai_api, write_stream_with_stats, get_prompt_content
+from utils.async_core import run_chat_completions
+from utils.config_loader import get_prompts, get_provider_concurrency_limit
+from utils.project_store import autosave_project
+from utils.storyboard_model import session_storyboard_model
+from utils.structured_output import format_video_metadata
+from utils.translation_memory import get_translation_memory, plan_with_memory, prompt_version, remember_response
+from utils.translation_utils import (
+    DEFAULT_SCENE_BATCH_SIZE, METADATA_TASK, SCENE_BATCH_TASK, LanguageTranslation, build_scenes, describe_request,
+    normalize_scenes, scenes_to_json
+)
 import time
 import json
 
@@ -22,7 +30,31 @@ SUPPORTED_LANGUAGES = {
 }
 DEFAULT_SOURCE_LANGUAGE = "Simplified Chinese" # Implicitly the source
 TARGET_LANGUAGES_FOR_MD_REPORT = {k: v for k, v in SUPPORTED_LANGUAGES.items() if v != DEFAULT_SOURCE_LANGUAGE}
+LANGUAGE_DISPLAY_NAMES_BY_CODE = {v: k for k, v in TARGET_LANGUAGES_FOR_MD_REPORT.items()}
 
+MD_REPORT_PROMPT_NAME = "translate_and_format_to_md_zh" # Using the Chinese version of the prompt
+DEFAULT_MAX_CONCURRENT_LANGUAGES = 3 # Used when the provider declares no max_concurrent_requests
+MAX_CONCURRENT_REQUESTS_LIMIT = 16
+
+PARSED_STORYBOARD_KEY = "editable_storyboard_parsed" # (scenes JSON text, scenes or None, error or None) of the last parse
+
+MODE_SCENE_BATCHED = "分场景并发翻译（推荐）"
+MODE_SINGLE_REQUEST = "单次请求生成完整报告"
+TRANSLATION_MODES = {
+    MODE_SCENE_BATCHED: "口播文案按场景分批、元数据单独并发翻译，报告由程序本地组装；请求小、速度快，失败的部分可单独重试。",
+    MODE_SINGLE_REQUEST: "每种语言一次请求，由 AI 直接输出包含翻译和格式的完整报告（原有方式，长脚本可能被截断）。",
+}
+
+
+def source_metadata_text() -> str:
+    """
+    The metadata to translate: rendered from the validated structured fields when page 04
+    produced them (they are cleared there once the text is edited), else the metadata text.
+    """
+    metadata_fields = st.session_state.get("video_metadata_fields")
+    if isinstance(metadata_fields, dict) and metadata_fields:
+        return format_video_metadata(metadata_fields)
+    return st.session_state.get("unified_metadata_text") or ""
 
 def check_prerequisites():
     if "api_config" not in st.session_state or not st.session_state.api_config.get("configured", False):
@@ -33,41 +65,287 @@ def check_prerequisites():
         st.warning("分镜脚本数据不存在。请先前往 🎬 分镜脚本页面生成。")
         st.page_link("pages/03_🎬_分镜脚本.py", label="前往分镜脚本生成", icon="🎬")
         return False
-    # Check for the new unified_metadata_text
-    if "unified_metadata_text" not in st.session_state or not st.session_state.unified_metadata_text.strip():
+    if not source_metadata_text().strip():
         st.warning("统一视频元数据不存在或为空。请先前往 ℹ️ 视频元数据页面生成并确认。")
         st.page_link("pages/04_ℹ️_视频元数据.py", label="前往视频元数据生成", icon="ℹ️")
         return False
     return True
 
+def parse_edited_storyboard_json(storyboard_scenes_json: str):
+    """
+    Returns (scenes, error message) for the edited scenes JSON. The result is kept next to
+    the text it was parsed from, so each edit is parsed once however often it is used.
+    """
+    parsed = st.session_state.get(PARSED_STORYBOARD_KEY)
+    if parsed is None or parsed[0] != storyboard_scenes_json:
+        try:
+            payload = json.loads(storyboard_scenes_json)
+            # It's okay if the 'scenes' list is empty, the prompt might handle it or it's intended.
+            if isinstance(payload, dict) and isinstance(payload.get("scenes"), list) and all(isinstance(scene, dict) for scene in payload["scenes"]):
+                parsed = (storyboard_scenes_json, normalize_scenes(payload["scenes"]), None)
+            else:
+                parsed = (storyboard_scenes_json, None, "编辑后的分镜脚本数据格式不正确。顶层应为包含 'scenes' 列表的JSON对象。请修正后重试。")
+        except json.JSONDecodeError:
+            parsed = (storyboard_scenes_json, None, "编辑后的分镜脚本数据不是有效的JSON格式。请检查并修正后重试。")
+        st.session_state[PARSED_STORYBOARD_KEY] = parsed
+    return parsed[1], parsed[2]
+
+def get_validated_translation_inputs():
+    """Returns the edited (storyboard scenes JSON, its parsed scenes, metadata text), stopping the page with an error if invalid."""
+    # Get edited data from session state
+    storyboard_scenes_json_edited = st.session_state.get("editable_storyboard_json", "")
+    video_metadata_text_edited = st.session_state.get("editable_metadata_text", "")
+
+    # Input validation for the edited data
+    scenes, error_message = parse_edited_storyboard_json(storyboard_scenes_json_edited)
+    if error_message:
+        st.error(error_message)
+        st.stop()
+    
+    if not video_metadata_text_edited.strip():
+        st.error("编辑后的元数据不能为空。请检查并修正后重试。")
+        st.stop()
+
+    return storyboard_scenes_json_edited, scenes, video_metadata_text_edited
+
+def build_md_report_request(lang_code: str, storyboard_scenes_json: str, video_metadata_text: str):
+    """
+    Prepares the MD report prompt for one target language.
+
+    Returns:
+        tuple: (system_message, formatted_user_message or None, parameters, request_log_for_debug)
+    """
+    api_conf = st.session_state.api_config
+    prompt_vars = {
+        "target_language": lang_code,
+        "storyboard_scenes_json": storyboard_scenes_json,
+        "video_metadata_text": video_metadata_text
+    }
+    # Get the raw template first for debugging log
+    _, raw_user_template_for_log, _ = get_prompt_content(
+        MD_REPORT_PROMPT_NAME, api_conf["selected_model"], PROMPTS_CONFIG # No vars passed here
+    )
+
+    # Now get the formatted message by passing prompt_vars
+    system_msg, formatted_user_msg, params = get_prompt_content(
+        MD_REPORT_PROMPT_NAME, api_conf["selected_model"], PROMPTS_CONFIG, prompt_vars
+    )
+    
+    request_log = {
+        "prompt_name": MD_REPORT_PROMPT_NAME, "target_language": lang_code,
+        "system_message": system_msg,
+        "user_message_template": raw_user_template_for_log,
+        "storyboard_scenes_json_input": storyboard_scenes_json,
+        "video_metadata_text_input": video_metadata_text,
+        "final_user_message": formatted_user_msg if formatted_user_msg is not None else "Error in template formatting",
+        "params": params
+    }
+    return system_msg, formatted_user_msg, params, request_log
+
+def generate_md_reports_concurrently(lang_codes: list, max_concurrency: int):
+    """Generates MD reports for several languages in parallel, showing per-language progress and keeping partial results."""
+    storyboard_scenes_json_to_use, _, video_metadata_text_to_use = get_validated_translation_inputs()
+    api_conf = st.session_state.api_config
+
+    requests = {}
+    status_placeholders = {}
+    for lang_code in lang_codes:
+        lang_display_name = LANGUAGE_DISPLAY_NAMES_BY_CODE[lang_code]
+        system_msg, formatted_user_msg, params, request_log = build_md_report_request(
+            lang_code, storyboard_scenes_json_to_use, video_metadata_text_to_use
+        )
+        st.session_state.last_md_generation_request = request_log
+        status_placeholders[lang_code] = st.empty()
+
+        if formatted_user_msg is None:
+            status_placeholders[lang_code].error(f"❌ {lang_display_name}: 未能准备提示词。")
+            st.session_state.generated_md_reports[lang_code] = f"## 生成失败\n\n未能为 {lang_display_name} 准备提示词。"
+            continue
+
+        status_placeholders[lang_code].info(f"⏳ {lang_display_name}: 排队/生成中...")
+        requests[lang_code] = dict(
+            api_key=api_conf["api_key"], base_url=api_conf["base_url"],
+            model=api_conf["selected_model"], system_message=system_msg,
+            user_message_text=formatted_user_msg,
+            temperature=params.get("temperature", 0.4),
+            max_tokens=params.get("max_tokens", 65536),
+            timeout=params.get("timeout"),
+            cache_ttl_hours=params.get("cache_ttl_hours"),
+            task_name=MD_REPORT_PROMPT_NAME
+        )
+
+    if not requests:
+        return
+
+    progress_bar = st.progress(0.0, text=f"已完成 0/{len(requests)}")
+    completed_lang_codes = []
+    succeeded_lang_codes = []
+
+    def on_result(lang_code, result):
+        completed_lang_codes.append(lang_code)
+        lang_display_name = LANGUAGE_DISPLAY_NAMES_BY_CODE[lang_code]
+        if result.ok:
+            # Store each report as soon as it lands so a later failure cannot lose it
+            st.session_state.generated_md_reports[lang_code] = result.content
+            status_placeholders[lang_code].success(f"✅ {lang_display_name}: 已生成 ({result.latency:.1f}s)")
+            succeeded_lang_codes.append(lang_code)
+        else:
+            error_message = result.error_message
+            st.session_state.generated_md_reports[lang_code] = f"## 生成失败\n\n{lang_display_name}: {error_message}"
+            status_placeholders[lang_code].error(f"❌ {lang_display_name}: {error_message}")
+        progress_bar.progress(len(completed_lang_codes) / len(requests), text=f"已完成 {len(completed_lang_codes)}/{len(requests)}")
+
+    run_chat_completions(requests, max_concurrency=max_concurrency, on_result=on_result)
+
+    if succeeded_lang_codes:
+        st.session_state.current_target_lang_for_preview = succeeded_lang_codes[0]
+    if len(succeeded_lang_codes) == len(lang_codes):
+        st.success(f"全部 {len(succeeded_lang_codes)} 种语言的MD报告已生成！")
+    else:
+        st.warning(f"已生成 {len(succeeded_lang_codes)}/{len(lang_codes)} 种语言的MD报告，失败的语言可单独重新生成。")
+
+def get_translation_prompt_versions() -> dict:
+    model = st.session_state.api_config["selected_model"]
+    return {task_name: prompt_version(PROMPTS_CONFIG.lookup(task_name, model)[0]) for task_name in (SCENE_BATCH_TASK, METADATA_TASK)}
+
+def get_language_translation(lang_code: str, storyboard_scenes_json: str, scenes: list, video_metadata_text: str, batch_size: int,
+                             use_translation_memory: bool, prompt_versions: dict) -> LanguageTranslation:
+    """
+    Returns the scene-batched translation state for a language. Partial results are kept
+    in session_state, so regenerating after a failure only resends the failed requests,
+    as long as the inputs, model and batch size are unchanged. When the inputs change,
+    scenes found in the translation memory are reused and only the rest is translated.
+    """
+    signature = (storyboard_scenes_json, video_metadata_text, batch_size, st.session_state.api_config["selected_model"],
+                 use_translation_memory, tuple(sorted(prompt_versions.items())))
+    saved = st.session_state.scene_batched_translations.get(lang_code)
+    if saved and saved[0] == signature:
+        return saved[1]
+    translation = plan_with_memory(
+        get_translation_memory() if use_translation_memory else None, lang_code,
+        scenes, video_metadata_text, prompt_versions, batch_size
+    )
+    st.session_state.scene_batched_translations[lang_code] = (signature, translation)
+    return translation
+
+def generate_md_reports_scene_batched(lang_codes: list, max_concurrency: int):
+    """
+    Translates scene batches and metadata for several languages concurrently and assembles
+    each language's MD report locally once all of its parts have been translated.
+    """
+    storyboard_scenes_json_to_use, scenes_to_use, video_metadata_text_to_use = get_validated_translation_inputs()
+    api_conf = st.session_state.api_config
+    _, _, batch_params = get_prompt_content(SCENE_BATCH_TASK, api_conf["selected_model"], PROMPTS_CONFIG)
+    batch_size = int((batch_params or {}).get("scene_batch_size", DEFAULT_SCENE_BATCH_SIZE))
+    use_translation_memory = st.session_state.get("use_translation_memory", True)
+    prompt_versions = get_translation_prompt_versions()
+
+    translations = {}
+    requests = {}
+    pending_requests = {}
+    status_placeholders = {}
+    for lang_code in lang_codes:
+        translation = get_language_translation(lang_code, storyboard_scenes_json_to_use, scenes_to_use, video_metadata_text_to_use, batch_size,
+                                               use_translation_memory, prompt_versions)
+        translations[lang_code] = translation
+        status_placeholders[lang_code] = st.empty()
+        for translation_request in translation.pending():
+            system_msg, formatted_user_msg, params = get_prompt_content(
+                translation_request.task_name, api_conf["selected_model"], PROMPTS_CONFIG, translation_request.variables
+            )
+            if formatted_user_msg is None:
+                st.error(f"未能准备任务 '{translation_request.task_name}' 的提示词，请检查 prompts.yaml。")
+                return
+            key = (lang_code, LanguageTranslation.request_key(translation_request))
+            pending_requests[key] = translation_request
+            requests[key] = dict(
+                api_key=api_conf["api_key"], base_url=api_conf["base_url"],
+                model=api_conf["selected_model"], system_message=system_msg,
+                user_message_text=formatted_user_msg,
+                temperature=params.get("temperature", 0.3),
+                max_tokens=params.get("max_tokens", 8192),
+                timeout=params.get("timeout"),
+                # A retried part skips the response cache, which would return the same unusable reply
+                cache_ttl_hours=None if LanguageTranslation.request_key(translation_request) in translation.errors else params.get("cache_ttl_hours"),
+                task_name=translation_request.task_name
+            )
+
+    def show_language_status(lang_code):
+        translation = translations[lang_code]
+        lang_display_name = LANGUAGE_DISPLAY_NAMES_BY_CODE[lang_code]
+        done = len(translation.requests) - len(translation.pending())
+        progress_text = f"已完成 {done}/{len(translation.requests)} 个部分"
+        reused_scenes = sum(1 for text in translation.reused_translations.values() if text)
+        if reused_scenes or translation.metadata_reused:
+            progress_text += f"（翻译记忆复用 {reused_scenes} 个场景" + ("及元数据）" if translation.metadata_reused else "）")
+        if translation.complete:
+            status_placeholders[lang_code].success(f"✅ {lang_display_name}: {progress_text}")
+        elif translation.errors:
+            status_placeholders[lang_code].warning(f"⚠️ {lang_display_name}: {progress_text}，{len(translation.errors)} 个失败")
+        else:
+            status_placeholders[lang_code].info(f"⏳ {lang_display_name}: {progress_text}")
+
+    for lang_code in lang_codes:
+        show_language_status(lang_code)
+
+    if requests:
+        progress_bar = st.progress(0.0, text=f"已完成 0/{len(requests)} 个请求")
+        completed_keys = []
+
+        def on_result(key, result):
+            completed_keys.append(key)
+            lang_code = key[0]
+            if translations[lang_code].add_response(pending_requests[key], result.content, None if result.ok else result.error_message) \
+                    and use_translation_memory:
+                remember_response(get_translation_memory(), translations[lang_code], pending_requests[key], prompt_versions)
+            show_language_status(lang_code)
+            progress_bar.progress(len(completed_keys) / len(requests), text=f"已完成 {len(completed_keys)}/{len(requests)} 个请求")
+
+        run_chat_completions(requests, max_concurrency=max_concurrency, on_result=on_result)
+
+    succeeded_lang_codes = []
+    for lang_code in lang_codes:
+        translation = translations[lang_code]
+        lang_display_name = LANGUAGE_DISPLAY_NAMES_BY_CODE[lang_code]
+        if translation.complete:
+            st.session_state.generated_md_reports[lang_code] = translation.report()
+            succeeded_lang_codes.append(lang_code)
+        else:
+            failed_parts = [
+                f"- {describe_request(translation_request)}: {translation.errors.get(LanguageTranslation.request_key(translation_request), '未完成')}"
+                for translation_request in translation.pending()
+            ]
+            st.session_state.generated_md_reports[lang_code] = (
+                f"## 生成失败\n\n{lang_display_name}: 以下部分未能翻译，再次生成将只重试这些部分。\n\n" + "\n".join(failed_parts)
+            )
+
+    if succeeded_lang_codes:
+        st.session_state.current_target_lang_for_preview = succeeded_lang_codes[0]
+    if len(succeeded_lang_codes) == len(lang_codes):
+        st.success(f"全部 {len(succeeded_lang_codes)} 种语言的MD报告已生成！")
+    else:
+        st.warning(f"已生成 {len(succeeded_lang_codes)}/{len(lang_codes)} 种语言的MD报告，再次生成将只重试失败的部分。")
+
 def translation_md_report_page():
     st.title("步骤 5: 🌍 多语言MD报告生成")
     st.markdown("""
-    AI 将根据您的分镜脚本和视频元数据，直接生成包含翻译和格式的完整MD报告。
-    **注意：** 此过程将一次性完成翻译和格式化。精细的逐项编辑和评分功能在此模式下不可用。 
-    最终输出的质量高度依赖于AI的理解和提示词的精确性。
+    AI 将根据您的分镜脚本和视频元数据，生成包含翻译和格式的完整MD报告。
+    默认按场景分批并发翻译、由程序组装报告；也可切换为由 AI 一次性完成翻译和格式化的原有方式。
+    精细的逐项编辑和评分功能在此页面不可用。
     """)
 
     if not check_prerequisites():
         st.stop()
 
-    # Prepare original data for initial population of text areas
-    storyboard_df_initial = st.session_state.get("storyboard_data", pd.DataFrame())
-    scenes_data_initial = []
-    if not storyboard_df_initial.empty and "中文口播文案" in storyboard_df_initial.columns:
-        for index, row in storyboard_df_initial.iterrows():
-            scenes_data_initial.append({
-                "scene_number": str(row.get('画面序号', index + 1)),
-                "chinese_narration": str(row["中文口播文案"])
-            })
-    storyboard_scenes_json_initial = json.dumps({"scenes": scenes_data_initial}, ensure_ascii=False, indent=2)
-    video_metadata_text_initial = st.session_state.get("unified_metadata_text", "")
-
-    # Initialize session state for editable data if not already present
+    # Initialize session state for editable data if not already present. The scenes are built
+    # once per storyboard version; the parsed form is stored with the text so it need not be parsed
     if "editable_storyboard_json" not in st.session_state:
-        st.session_state.editable_storyboard_json = storyboard_scenes_json_initial
+        model = session_storyboard_model(st.session_state)
+        scenes_initial = model.view("translation_scenes", build_scenes)
+        st.session_state.editable_storyboard_json = model.view("translation_scenes_json", lambda _: scenes_to_json(scenes_initial))
+        st.session_state[PARSED_STORYBOARD_KEY] = (st.session_state.editable_storyboard_json, scenes_initial, None)
     if "editable_metadata_text" not in st.session_state:
-        st.session_state.editable_metadata_text = video_metadata_text_initial
+        st.session_state.editable_metadata_text = source_metadata_text()
 
     st.subheader("1. 预览和编辑翻译数据源")
     st.markdown("您可以在下方编辑分镜脚本和视频元数据，编辑后的内容将用于翻译。")
@@ -100,85 +378,63 @@ def translation_md_report_page():
         st.session_state.last_md_generation_request = {}
     if "current_target_lang_for_preview" not in st.session_state:
         st.session_state.current_target_lang_for_preview = None
+    if "scene_batched_translations" not in st.session_state:
+        st.session_state.scene_batched_translations = {} # {lang_code: (input signature, LanguageTranslation)}
 
     st.subheader("2. 选择目标语言生成MD报告") # Changed subheader to reflect step
+
+    translation_mode = st.radio(
+        "生成方式:", options=list(TRANSLATION_MODES.keys()), horizontal=True, key="md_report_translation_mode"
+    )
+    st.caption(TRANSLATION_MODES[translation_mode])
+    if translation_mode == MODE_SCENE_BATCHED:
+        memory_col1, memory_col2 = st.columns([0.75, 0.25])
+        memory_col1.checkbox(
+            "使用翻译记忆（只翻译新增或修改过的场景和元数据）", value=True, key="use_translation_memory",
+            help="已翻译过的口播文案按原文、目标语言和翻译提示词版本保存在本地，修改少量场景后重新生成时，未改动的部分直接复用。"
+        )
+        if memory_col2.button("🧹 清空翻译记忆", key="clear_translation_memory", use_container_width=True):
+            get_translation_memory().clear()
+            st.session_state.scene_batched_translations = {}
+            st.toast("翻译记忆已清空。")
     
     cols = st.columns(3) # Adjust number of columns as needed
     col_idx = 0
 
     for lang_display_name, lang_code in TARGET_LANGUAGES_FOR_MD_REPORT.items():
         with cols[col_idx % len(cols)]:
-            if st.button(f"🚀 生成 {lang_display_name} MD报告", key=f"generate_md_{lang_code}", use_container_width=True):
+            generate_clicked = st.button(f"🚀 生成 {lang_display_name} MD报告", key=f"generate_md_{lang_code}", use_container_width=True)
+            if generate_clicked and translation_mode == MODE_SCENE_BATCHED:
+                st.session_state.current_target_lang_for_preview = lang_code
+                with st.container(border=True):
+                    generate_md_reports_scene_batched([lang_code], int(st.session_state.get(
+                        "batch_md_report_max_concurrency", DEFAULT_MAX_CONCURRENT_LANGUAGES)))
+            elif generate_clicked:
                 st.session_state.current_target_lang_for_preview = lang_code
                 st.session_state.generated_md_reports[lang_code] = None # Clear previous for this lang
                 
-                # Get edited data from session state
-                storyboard_scenes_json_edited = st.session_state.get("editable_storyboard_json", "")
-                video_metadata_text_edited = st.session_state.get("editable_metadata_text", "")
-
-                # Input validation for the edited data
-                scenes_data_from_json = []
-                try:
-                    parsed_storyboard = json.loads(storyboard_scenes_json_edited)
-                    if isinstance(parsed_storyboard, dict) and "scenes" in parsed_storyboard and isinstance(parsed_storyboard["scenes"], list):
-                        scenes_data_from_json = parsed_storyboard["scenes"]
-                        # It's okay if scenes_data_from_json is empty, the prompt might handle it or it's intended.
-                        # if not scenes_data_from_json:
-                        #     st.warning("编辑后的分镜脚本数据中 'scenes' 列表为空。翻译可能不完整。")
-                    else:
-                        st.error("编辑后的分镜脚本数据格式不正确。顶层应为包含 'scenes' 列表的JSON对象。请修正后重试。")
-                        st.stop()
-                except json.JSONDecodeError:
-                    st.error("编辑后的分镜脚本数据不是有效的JSON格式。请检查并修正后重试。")
-                    st.stop()
-                
-                if not video_metadata_text_edited.strip():
-                    st.error("编辑后的元数据不能为空。请检查并修正后重试。")
-                    st.stop()
-
-                # Use the edited (and validated) data for the API call
-                storyboard_scenes_json_to_use = storyboard_scenes_json_edited
-                video_metadata_text_to_use = video_metadata_text_edited
+                storyboard_scenes_json_to_use, _, video_metadata_text_to_use = get_validated_translation_inputs()
 
-                with st.spinner(f"AI 正在为 {lang_display_name} 生成MD报告，请稍候... (这可能需要一些时间)"):
+                with st.container(border=True): # Streamed output renders here as it arrives
                     api_conf = st.session_state.api_config
-                    prompt_name = "translate_and_format_to_md_zh" # Using the Chinese version of the prompt
-
-                    prompt_vars = {
-                        "target_language": lang_code,
-                        "storyboard_scenes_json": storyboard_scenes_json_to_use,
-                        "video_metadata_text": video_metadata_text_to_use
-                    }
-                    # Get the raw template first for debugging log
-                    _, raw_user_template_for_log, _ = get_prompt_content(
-                        prompt_name, api_conf["selected_model"], PROMPTS_CONFIG # No vars passed here
-                    )
-
-                    # Now get the formatted message by passing prompt_vars
-                    system_msg, formatted_user_msg, params = get_prompt_content(
-                        prompt_name, api_conf["selected_model"], PROMPTS_CONFIG, prompt_vars
+                    system_msg, formatted_user_msg, params, request_log = build_md_report_request(
+                        lang_code, storyboard_scenes_json_to_use, video_metadata_text_to_use
                     )
-                    
-                    st.session_state.last_md_generation_request = {
-                        "prompt_name": prompt_name, "target_language": lang_code,
-                        "system_message": system_msg,
-                        "user_message_template": raw_user_template_for_log,
-                        "storyboard_scenes_json_input": storyboard_scenes_json_to_use,
-                        "video_metadata_text_input": video_metadata_text_to_use,
-                        "final_user_message": formatted_user_msg if formatted_user_msg is not None else "Error in template formatting",
-                        "params": params
-                    }
+                    st.session_state.last_md_generation_request = request_log
 
                     if formatted_user_msg is not None:
                         final_user_message = formatted_user_msg
 
-                        md_output = call_openai_api(
+                        md_output = write_stream_with_stats(stream_openai_api(
                             api_key=api_conf["api_key"], base_url=api_conf["base_url"],
                             model=api_conf["selected_model"], system_message=system_msg,
                             user_message_text=final_user_message,
                             temperature=params.get("temperature", 0.4), # Slightly lower for more deterministic formatting
-                            max_tokens=params.get("max_tokens", 65536) 
-                        )
+                            max_tokens=params.get("max_tokens", 65536),
+                            timeout=params.get("timeout"),
+                            cache_ttl_hours=params.get("cache_ttl_hours"),
+                            task_name=MD_REPORT_PROMPT_NAME
+                        ), stop_button_key=f"stop_md_{lang_code}")
                         if md_output:
                             st.session_state.generated_md_reports[lang_code] = md_output
                             st.success(f"{lang_display_name} MD报告已生成！")
@@ -190,15 +446,55 @@ def translation_md_report_page():
                         st.session_state.generated_md_reports[lang_code] = f"## 生成失败\n\n未能为 {lang_display_name} 准备提示词。"
                 st.rerun() # To update preview
         col_idx += 1
+
+    st.markdown("**批量生成**：并发请求所有选中的语言；单个语言（或单个场景批次）失败不影响其他结果。")
+    batch_col1, batch_col2 = st.columns([0.75, 0.25])
+    with batch_col1:
+        batch_lang_display_names = st.multiselect(
+            "选择要批量生成的目标语言:",
+            options=list(TARGET_LANGUAGES_FOR_MD_REPORT.keys()),
+            default=list(TARGET_LANGUAGES_FOR_MD_REPORT.keys()),
+            key="batch_md_report_languages"
+        )
+    with batch_col2:
+        max_concurrency = st.number_input(
+            "最大并发请求数:",
+            min_value=1,
+            max_value=MAX_CONCURRENT_REQUESTS_LIMIT,
+            value=min(
+                get_provider_concurrency_limit(st.session_state.api_config.get("selected_provider_name"), DEFAULT_MAX_CONCURRENT_LANGUAGES),
+                MAX_CONCURRENT_REQUESTS_LIMIT
+            ),
+            key="batch_md_report_max_concurrency",
+            help="同时发往 API 的请求数上限。如遇频率限制 (429)，请调低此值。"
+        )
+    if st.button("🚀 并发生成所选语言 MD报告", key="generate_md_all_selected", type="primary",
+                 use_container_width=True, disabled=not batch_lang_display_names):
+        generate_reports = generate_md_reports_scene_batched if translation_mode == MODE_SCENE_BATCHED else generate_md_reports_concurrently
+        generate_reports(
+            [TARGET_LANGUAGES_FOR_MD_REPORT[name] for name in batch_lang_display_names],
+            int(max_concurrency)
+        )
     
     st.divider()
     st.subheader("3. MD报告预览与下载") # Changed subheader to reflect step
 
+    available_report_lang_codes = [code for code, content in st.session_state.generated_md_reports.items() if content]
+    if len(available_report_lang_codes) > 1:
+        current_preview = st.session_state.current_target_lang_for_preview
+        st.session_state.current_target_lang_for_preview = st.radio(
+            "选择要预览的语言:",
+            options=available_report_lang_codes,
+            index=available_report_lang_codes.index(current_preview) if current_preview in available_report_lang_codes else 0,
+            format_func=lambda code: LANGUAGE_DISPLAY_NAMES_BY_CODE.get(code, code),
+            horizontal=True
+        )
+
     if st.session_state.current_target_lang_for_preview and \
        st.session_state.current_target_lang_for_preview in st.session_state.generated_md_reports:
         
         lang_code_to_preview = st.session_state.current_target_lang_for_preview
-        lang_display_name_preview = [k for k, v in TARGET_LANGUAGES_FOR_MD_REPORT.items() if v == lang_code_to_preview][0]
+        lang_display_name_preview = LANGUAGE_DISPLAY_NAMES_BY_CODE[lang_code_to_preview]
         
         md_content_to_preview = st.session_state.generated_md_reports[lang_code_to_preview]
 
@@ -225,4 +521,5 @@ def translation_md_report_page():
 
 
 if __name__ == "__main__":
-    translation_md_report_page()
\ No newline at end of file
+    translation_md_report_page()
+    autosave_project(st.session_state) # Writes only the artifacts this run changed
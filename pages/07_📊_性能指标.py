@@ -0,0 +1,96 @@
+import time
+import streamlit as st
+import pandas as pd
+from utils.metrics import PERCENTILES, get_metrics_store, render_prometheus, summarize, write_prometheus_textfile
+
+# Page Configuration
+st.set_page_config(page_title="性能指标", layout="wide", initial_sidebar_state="expanded")
+st.sidebar.header("性能指标")
+
+TIME_WINDOWS = {
+    "最近 1 小时": 3600,
+    "最近 24 小时": 24 * 3600,
+    "最近 7 天": 7 * 24 * 3600,
+    "全部": None,
+}
+
+TASK_COLUMNS = {
+    "calls": "调用次数",
+    "errors": "失败",
+    "cache_hits": "缓存命中",
+    "retries": "重试",
+    "prompt_tokens": "Prompt Tokens",
+    "completion_tokens": "Completion Tokens",
+}
+
+def summary_dataframe(records, group_by: str, group_label: str) -> pd.DataFrame:
+    """Builds a display table (latencies in seconds) from `utils.metrics.summarize`."""
+    summary_df = pd.DataFrame(summarize(records, group_by=group_by))
+    if summary_df.empty:
+        return summary_df
+    columns = {group_by: group_label, **TASK_COLUMNS}
+    for q in PERCENTILES:
+        columns[f"latency_p{int(q * 100)}"] = f"延迟 P{int(q * 100)} (s)"
+    for q in PERCENTILES:
+        columns[f"ttft_p{int(q * 100)}"] = f"首字延迟 P{int(q * 100)} (s)"
+    return summary_df[list(columns)].rename(columns=columns).round(2)
+
+def metrics_dashboard():
+    st.header("📊 性能指标")
+    st.caption("记录每次模型调用的耗时、首字延迟、Token 用量、缓存命中与错误（包括批量流水线）。延迟分位数仅统计实际调用 API 且成功的请求。")
+
+    window_label = st.selectbox("时间范围", list(TIME_WINDOWS.keys()), index=1, key="metrics_time_window")
+    window_seconds = TIME_WINDOWS[window_label]
+    since = time.time() - window_seconds if window_seconds else None
+
+    metrics_store = get_metrics_store()
+    records = metrics_store.records(since=since)
+    if not records:
+        st.info("所选时间范围内还没有调用记录。生成内容后再回到此页面查看。")
+        return
+
+    total_calls = len(records)
+    error_count = sum(1 for r in records if r["error_kind"])
+    cache_hits = sum(1 for r in records if r["cache_hit"])
+    total_tokens = sum((r["prompt_tokens"] or 0) + (r["completion_tokens"] or 0) for r in records)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("调用次数", total_calls)
+    col2.metric("失败率", f"{error_count / total_calls:.1%}")
+    col3.metric("缓存命中率", f"{cache_hits / total_calls:.1%}")
+    col4.metric("Token 总量", f"{total_tokens:,}")
+
+    st.subheader("按任务")
+    st.dataframe(summary_dataframe(records, "task", "任务"), use_container_width=True, hide_index=True)
+
+    st.subheader("按模型")
+    st.dataframe(summary_dataframe(records, "model", "模型"), use_container_width=True, hide_index=True)
+
+    errors = [r for r in records if r["error_kind"]]
+    if errors:
+        st.subheader("错误分布")
+        error_df = pd.DataFrame(errors).groupby(["task", "error_kind"]).size().reset_index(name="次数")
+        st.dataframe(error_df.rename(columns={"task": "任务", "error_kind": "错误类型"}), use_container_width=True, hide_index=True)
+
+    with st.expander("最近调用", expanded=False):
+        recent_df = pd.DataFrame(records[-200:][::-1])
+        recent_df["timestamp"] = pd.to_datetime(recent_df["timestamp"], unit="s")
+        st.dataframe(recent_df, use_container_width=True, hide_index=True)
+
+    with st.expander("Prometheus 导出", expanded=False):
+        prometheus_text = render_prometheus(records)
+        st.code(prometheus_text, language="text")
+        col_download, col_write = st.columns(2)
+        col_download.download_button(
+            "📥 下载 .prom 文件", data=prometheus_text.encode("utf-8"),
+            file_name="llm_metrics.prom", mime="text/plain", key="download_prometheus_metrics"
+        )
+        if col_write.button("💾 写入 textfile collector 文件", key="write_prometheus_textfile_button",
+                            help="写入全部调用记录，供 node_exporter 的 textfile collector 采集。"):
+            st.success(f"已写入 {write_prometheus_textfile()}")
+
+    if st.button("🧹 清空性能记录", key="clear_metrics_button"):
+        metrics_store.clear()
+        st.rerun()
+
+if __name__ == "__main__":
+    metrics_dashboard()
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from utils import config_store
+from utils.config_store import ConfigStore
+from utils.core import ConfigError
+
+PROMPTS_YAML = """
+prompts:
+  outline_generation:
+    default:
+      system_message: 你是编剧
+      user_message_template: "主题：{topic}"
+"""
+
+
+@pytest.fixture
+def paths(tmp_path):
+    prompts_path = tmp_path / "prompts.yaml"
+    prompts_path.write_text(PROMPTS_YAML, encoding="utf-8")
+    return prompts_path, tmp_path / "prompts", tmp_path / "config.json"
+
+
+def make_store(paths):
+    prompts_path, prompts_dir, cache_path = paths
+    return ConfigStore(str(prompts_path), str(prompts_dir), str(cache_path))
+
+
+def test_loads_and_caches_the_parsed_config(paths):
+    snapshot = make_store(paths).get()
+    assert snapshot.version == 1
+    assert "outline_generation" in snapshot.config["prompts"]
+    assert json.loads(paths[2].read_text(encoding="utf-8"))["content_hash"] == snapshot.content_hash
+    assert make_store(paths).get().content_hash == snapshot.content_hash
+
+
+@pytest.mark.parametrize("cached", ['["not", "a", "dict"]', '{"format": 1, "content_hash": "other", "config": {}}', "null", "\x80\x04 not json"])
+def test_unusable_cache_files_fall_back_to_parsing(paths, cached):
+    paths[2].write_text(cached, encoding="utf-8")
+    assert "outline_generation" in make_store(paths).get().config["prompts"]
+
+
+def test_configs_json_cannot_hold_are_not_cached(paths):
+    paths[0].write_text(PROMPTS_YAML + "updated: 2024-01-01\nmodels: {1: a}\n", encoding="utf-8")
+    assert make_store(paths).get().config["models"] == {1: "a"}
+    assert not os.path.exists(paths[2])
+    paths[0].write_text(PROMPTS_YAML + "models: {1: a}\n", encoding="utf-8")
+    make_store(paths).get()
+    assert not os.path.exists(paths[2])
+
+
+def test_reloads_changed_files_and_keeps_the_last_good_version(paths, monkeypatch):
+    monkeypatch.setattr(config_store, "CHECK_INTERVAL_SECONDS", 0.0)
+    store = make_store(paths)
+    store.get()
+    prompts_path = paths[0]
+    prompts_path.write_text(PROMPTS_YAML.replace("你是编剧", "你是导演"), encoding="utf-8")
+    os.utime(prompts_path, ns=(1, 1))
+    assert store.get().version == 2
+
+    prompts_path.write_text("prompts: [unclosed", encoding="utf-8")
+    os.utime(prompts_path, ns=(2, 2))
+    snapshot = store.get()
+    assert snapshot.version == 2 and "你是导演" in str(snapshot.config)
+    assert store.last_error
+
+
+def test_per_task_files_replace_tasks(paths):
+    prompts_dir = paths[1]
+    prompts_dir.mkdir()
+    (prompts_dir / "outline_generation.yaml").write_text("default:\n  system_message: 来自单独文件\n", encoding="utf-8")
+    assert make_store(paths).get().config["prompts"]["outline_generation"]["default"]["system_message"] == "来自单独文件"
+
+
+def test_missing_file_raises_config_error(tmp_path):
+    with pytest.raises(ConfigError):
+        ConfigStore(str(tmp_path / "missing.yaml"), cache_path=None).get()
@@ -0,0 +1,86 @@
+import pytest
+
+from utils import metrics
+from utils.core import LLMResult
+from utils.metrics import (
+    ABORTED_KIND, CallRecord, MetricsStore, percentile, provider_label, record_llm_call, render_prometheus, summarize
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MetricsStore(str(tmp_path / "metrics.sqlite3"), max_records=3)
+
+
+def call(task="storyboard_generation", latency=1.0, ttft=None, cache_hit=False, error_kind=None, model="gpt-4o",
+         provider="api.openai.com", retries=0, prompt_tokens=10, completion_tokens=20):
+    return CallRecord(0.0, task, model, provider, latency, ttft, prompt_tokens, completion_tokens, cache_hit, error_kind, retries)
+
+
+def test_percentile_interpolates_between_values():
+    assert percentile([], 0.5) is None
+    assert percentile([4.0], 0.99) == 4.0
+    assert percentile([3.0, 1.0, 2.0, 4.0], 0.5) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.9) == pytest.approx(3.7)
+    assert percentile([1.0, 2.0], 0.0) == 1.0 and percentile([1.0, 2.0], 1.0) == 2.0
+
+
+def test_store_round_trips_and_prunes(store, monkeypatch):
+    monkeypatch.setattr(metrics, "_PRUNE_EVERY", 2)
+    for latency in (1.0, 2.0, 3.0, 4.0):
+        store.record(call(latency=latency, cache_hit=latency == 2.0))
+    records = store.records()
+    assert [r["latency"] for r in records] == [2.0, 3.0, 4.0] # The oldest call beyond max_records is pruned
+    assert records[0]["cache_hit"] is True and records[1]["cache_hit"] is False
+    store.clear()
+    assert store.records() == []
+
+
+def test_summary_quantiles_exclude_cache_hits_and_errors(store):
+    for record in (call(latency=1.0, ttft=0.1), call(latency=3.0, ttft=0.3, retries=2), call(latency=0.0, cache_hit=True),
+                   call(latency=60.0, error_kind="timeout"), call(task="outline_generation", latency=5.0)):
+        store.record(record)
+    summaries = {s["task"]: s for s in summarize(store.records())}
+    storyboard = summaries["storyboard_generation"]
+    assert (storyboard["calls"], storyboard["errors"], storyboard["cache_hits"], storyboard["retries"]) == (4, 1, 1, 2)
+    assert storyboard["prompt_tokens"] == 40 and storyboard["latency_sum"] == 4.0
+    assert storyboard["latency_p50"] == 2.0 and storyboard["latency_p99"] == pytest.approx(2.98)
+    assert storyboard["ttft_p50"] == pytest.approx(0.2)
+    assert summaries["outline_generation"]["ttft_p50"] is None
+    assert [s["model"] for s in summarize(store.records(), group_by="model")] == ["gpt-4o"]
+
+
+def test_prometheus_export(store):
+    store.record(call(latency=1.0, ttft=0.5))
+    store.record(call(latency=3.0, ttft=1.5))
+    store.record(call(latency=9.0, error_kind="rate_limit", retries=4))
+    store.record(call(task='say "hi"\\\n', latency=0.0, cache_hit=True))
+    text = render_prometheus(store.records())
+    labels = 'task="storyboard_generation",model="gpt-4o",provider="api.openai.com"'
+    assert "# TYPE llm_request_latency_seconds summary" in text.splitlines()
+    assert f"llm_requests_total{{{labels}}} 3" in text
+    assert f'llm_request_errors_total{{{labels},error_kind="rate_limit"}} 1' in text
+    assert f"llm_retries_total{{{labels}}} 4" in text
+    assert f'llm_request_latency_seconds{{{labels},quantile="0.5"}} 2.000000' in text
+    assert f"llm_request_latency_seconds_sum{{{labels}}} 4.000000" in text
+    assert f"llm_request_latency_seconds_count{{{labels}}} 2" in text
+    assert f"llm_time_to_first_token_seconds_sum{{{labels}}} 2.000000" in text
+    escaped = 'task="say \\"hi\\"\\\\\\n",model="gpt-4o",provider="api.openai.com"'
+    assert f"llm_cache_hits_total{{{escaped}}} 1" in text
+    assert f"llm_request_latency_seconds_count{{{escaped}}} 0" in text
+    assert f'llm_request_latency_seconds{{{escaped},quantile="0.5"}}' not in text # No API calls, no quantiles
+
+
+def test_record_llm_call_labels_and_never_raises(store, monkeypatch):
+    monkeypatch.setattr(metrics, "get_metrics_store", lambda: store)
+    result = LLMResult(model="gpt-4o", latency=2.0, retries=1, aborted=True)
+    record_llm_call(result, "https://api.openai.com/v1")
+    (record,) = store.records()
+    assert (record["task"], record["provider"], record["error_kind"]) == (metrics.UNKNOWN_TASK, "api.openai.com", ABORTED_KIND)
+    assert provider_label("") == "unknown"
+
+    def unavailable():
+        raise PermissionError("cannot create .cache")
+
+    monkeypatch.setattr(metrics, "get_metrics_store", unavailable)
+    record_llm_call(result, "https://api.openai.com/v1")
@@ -0,0 +1,67 @@
+import pandas as pd
+
+from utils.parsing_utils import IncrementalTableParser, parse_markdown_table_to_df, split_table_row
+
+STORYBOARD_TABLE = """以下是分镜脚本：
+| 画面序号 | 中文口播文案 | 画面描述 |
+|---|---|---|
+| 1 | 大家好 | 开场 |
+| 2 | 欢迎回来 | 主播挥手 |
+"""
+
+
+def test_split_table_row_keeps_escaped_pipes():
+    assert split_table_row("| a \\| b | c |") == ["a | b", "c"]
+    assert split_table_row("a | b") == ["a", "b"]
+    assert split_table_row("| ends with \\|") == ["ends with |"]
+
+
+def test_parses_table_surrounded_by_prose():
+    df = parse_markdown_table_to_df(STORYBOARD_TABLE + "\n以上。")
+    assert list(df.columns) == ["画面序号", "中文口播文案", "画面描述"]
+    assert df.values.tolist() == [["1", "大家好", "开场"], ["2", "欢迎回来", "主播挥手"]]
+
+
+def test_ragged_rows_are_padded_or_joined_into_last_column():
+    df = parse_markdown_table_to_df("| A | B | C |\n|---|---|---|\n| 1 | 2 |\n| 3 | 4 | 5 | 6 |\n")
+    assert df.values.tolist() == [["1", "2", ""], ["3", "4", "5 | 6"]]
+
+
+def test_escaped_pipes_without_outer_pipes():
+    df = parse_markdown_table_to_df("```markdown\nA | B\n---|---\n1 | x \\| y\n```")
+    assert df.values.tolist() == [["1", "x | y"]]
+
+
+def test_repeated_header_rows_are_skipped():
+    text = "| A | B |\n|---|---|\n| 1 | 2 |\n\n继续：\n\n| A | B |\n|---|---|\n| 3 | 4 |\n"
+    assert parse_markdown_table_to_df(text).values.tolist() == [["1", "2"], ["3", "4"]]
+
+
+def test_line_without_outer_pipes_needs_a_separator_to_start_a_table():
+    assert parse_markdown_table_to_df("注意 | 这不是表格\n普通文字").empty
+
+
+def test_duplicate_header_names_are_suffixed():
+    df = parse_markdown_table_to_df("| A | A |\n|---|---|\n| 1 | 2 |")
+    assert list(df.columns) == ["A", "A.1"]
+
+
+def test_header_only_and_empty_input():
+    assert list(parse_markdown_table_to_df("| H1 | H2 |\n|----|----|").columns) == ["H1", "H2"]
+    assert parse_markdown_table_to_df("   ").equals(pd.DataFrame())
+
+
+def test_feed_returns_rows_as_their_lines_complete():
+    parser = IncrementalTableParser()
+    completed = []
+    for start in range(0, len(STORYBOARD_TABLE), 7): # Arbitrary chunk boundaries, as in a stream
+        completed.extend(parser.feed(STORYBOARD_TABLE[start:start + 7]))
+    completed.extend(parser.close())
+    assert completed == [["1", "大家好", "开场"], ["2", "欢迎回来", "主播挥手"]]
+    assert parser.to_dataframe().equals(parse_markdown_table_to_df(STORYBOARD_TABLE))
+
+
+def test_close_flushes_the_unterminated_last_row():
+    parser = IncrementalTableParser()
+    assert parser.feed("| A | B |\n|---|---|\n| 1 | 2 |") == []
+    assert parser.close() == [["1", "2"]]
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+
+from utils import pipeline
+from utils.pipeline import PipelineError, ProviderSettings, TopicJob, TopicPipeline, load_topic_jobs, slugify
+
+
+def write_jsonl(tmp_path, *records):
+    path = tmp_path / "topics.jsonl"
+    path.write_text("\n".join(json.dumps(record, ensure_ascii=False) if record else "" for record in records), encoding="utf-8")
+    return str(path)
+
+
+def test_slugify_keeps_cjk_and_limits_length():
+    assert slugify(" 咖啡/的 历史? ") == "咖啡_的_历史"
+    assert slugify("???") == "topic"
+    assert slugify("a" * 100, 10) == "a" * 10
+
+
+def test_loads_jobs_with_generated_and_explicit_ids(tmp_path):
+    jobs = load_topic_jobs(write_jsonl(
+        tmp_path, {"topic": "咖啡的历史"}, None, {"title": "茶", "id": "tea 01", "word_count": 800, "languages": ["French"]}
+    ))
+    assert [job.topic_id for job in jobs] == ["0001_咖啡的历史", "tea_01"]
+    assert jobs[1].word_count == 800 and jobs[1].languages == ["French"]
+
+
+def test_ids_that_slugify_to_the_same_directory_are_rejected(tmp_path):
+    path = write_jsonl(tmp_path, {"topic": "甲", "id": "a/b"}, {"topic": "乙", "id": "a b"})
+    with pytest.raises(ValueError, match="第 1 行"):
+        load_topic_jobs(path)
+
+
+def test_lines_without_a_topic_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match=":1:"):
+        load_topic_jobs(write_jsonl(tmp_path, {"id": "x"}))
+
+
+@pytest.mark.parametrize("line", ['"foo"', "[1]", "42", "{not json"])
+def test_lines_that_are_not_objects_are_rejected(tmp_path, line):
+    path = tmp_path / "topics.jsonl"
+    path.write_text(json.dumps({"topic": "茶"}) + "\n" + line + "\n", encoding="utf-8")
+    with pytest.raises(ValueError, match=":2:"):
+        load_topic_jobs(str(path))
+
+
+def test_a_failed_storyboard_segment_cancels_the_others(tmp_path, monkeypatch):
+    cancelled = []
+
+    async def segment(index):
+        if index == 1:
+            raise PipelineError("第 2 段失败")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+
+    provider = ProviderSettings(api_key="key", base_url="https://api.example.com/v1", model="gpt-4o")
+    prompts_config = {"storyboard_generation": {"default": {"user_message_template": "{script_content}"}}}
+    topic_pipeline = TopicPipeline(TopicJob("t", "茶"), provider, prompts_config, str(tmp_path), session=None)
+    indexes = iter(range(3))
+    monkeypatch.setattr(topic_pipeline, "_task", lambda task_name, variables, use_cache=True: lambda: segment(next(indexes)))
+    monkeypatch.setattr(pipeline, "split_script_into_segments", lambda script, max_chars: ["一", "二", "三"])
+
+    async def scenario():
+        with pytest.raises(PipelineError):
+            await topic_pipeline._generate_storyboard("口播稿")
+        return sorted(cancelled) # Before asyncio.run would cancel leftover tasks itself
+
+    assert asyncio.run(scenario()) == [0, 2]
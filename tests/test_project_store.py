@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+
+from utils.project_store import (
+    DEFAULT_PROJECT_NAME, PROJECT_ID_KEY, SAVED_DIGESTS_KEY, ProjectStore, autosave_project, restore_project,
+    serialize_artifacts
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProjectStore(str(tmp_path / "projects.sqlite3"))
+
+
+def project_session():
+    return {
+        "topic_input": "咖啡的历史\n第二行",
+        "outline_content": "大纲",
+        "script_content": "口播稿",
+        "storyboard_data": pd.DataFrame({"画面序号": ["1", "2"], "中文口播文案": ["你好 | 世界", "再见"]}),
+        "video_metadata_fields": {"title": "标题", "tags": ["a", "b"]},
+        "generated_md_reports": {"English": "# Report"},
+        "selected_model_widget_config_page": "not a project value",
+    }
+
+
+def test_serialize_groups_values_into_artifacts():
+    artifacts = serialize_artifacts(project_session())
+    assert set(artifacts) == {"outline", "script", "storyboard", "metadata", "reports"}
+    assert b"selected_model_widget_config_page" not in b"".join(artifacts.values())
+
+
+def test_round_trip_restores_values_and_dataframes(store):
+    session = project_session()
+    assert autosave_project(session, store)
+    project_id = session[PROJECT_ID_KEY]
+
+    restored = {}
+    assert restore_project(restored, project_id, store)
+    assert restored[PROJECT_ID_KEY] == project_id
+    for key in ["topic_input", "outline_content", "script_content", "video_metadata_fields", "generated_md_reports"]:
+        assert restored[key] == session[key]
+    pd.testing.assert_frame_equal(restored["storyboard_data"], session["storyboard_data"])
+    assert "selected_model_widget_config_page" not in restored
+    # Restored values are already saved
+    assert autosave_project(restored, store) == []
+
+
+def test_autosave_writes_only_changed_artifacts(store):
+    session = project_session()
+    autosave_project(session, store)
+    assert autosave_project(session, store) == []
+    session["script_content"] = "改过的口播稿"
+    session["storyboard_data"] = session["storyboard_data"].copy() # Same content, new frame
+    assert autosave_project(session, store) == ["script"]
+    assert store.artifact_digests(session[PROJECT_ID_KEY]) == session[SAVED_DIGESTS_KEY]
+
+
+def test_empty_session_creates_no_project(store):
+    session = {"topic_input": "  ", "storyboard_data": pd.DataFrame()}
+    assert autosave_project(session, store) == []
+    assert store.list_projects() == []
+
+
+def test_manifest_lists_and_deletes_projects(store):
+    session = project_session()
+    autosave_project(session, store)
+    [summary] = store.list_projects()
+    assert summary.project_id == session[PROJECT_ID_KEY]
+    assert summary.name == "咖啡的历史"
+    assert summary.artifact_count == 5 and summary.stored_bytes > 0
+
+    untitled = store.create_project()
+    assert {project.name for project in store.list_projects()} == {DEFAULT_PROJECT_NAME, "咖啡的历史"}
+    store.delete_project(summary.project_id)
+    assert [project.project_id for project in store.list_projects()] == [untitled]
+    assert not restore_project({}, summary.project_id, store)
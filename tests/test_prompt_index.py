@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from utils import config_store
+from utils.config_store import ConfigStore
+from utils.core import resolve_prompt
+from utils.prompt_index import (
+    SEVERITY_ERROR, SEVERITY_WARNING, PromptIndex, compile_prompts, format_issue, parse_template_fields
+)
+
+PROMPTS = {
+    "outline_generation": {
+        "default": {"system_message": "默认", "user_message_template": "主题：{topic}"},
+        "gpt-4o": {"system_message": "专用", "user_message_template": "主题：{topic}", "parameters": {"temperature": 0.5}},
+    },
+    "image_to_video_prompt_generation": {
+        "gpt-4o": {"system_message": "视觉", "user_message_template": "{scene_description}"},
+    },
+}
+
+
+def test_lookup_falls_back_from_model_to_default_to_first_prompt():
+    index = PromptIndex(PROMPTS)
+    prompt, notice, error = index.lookup("outline_generation", "gpt-4o")
+    assert prompt.system_message == "专用" and prompt.parameters == {"temperature": 0.5} and notice is error is None
+    prompt, notice, error = index.lookup("outline_generation", "other-model")
+    assert prompt.model_key == "default" and notice is error is None
+    prompt, notice, error = index.lookup("image_to_video_prompt_generation", "other-model")
+    assert prompt.model_key == "gpt-4o" and "gpt-4o" in notice and error is None
+    prompt, notice, error = index.lookup("missing_task", "gpt-4o")
+    assert prompt is None and "missing_task" in error
+
+
+def test_lookups_are_memoized_per_index():
+    index = PromptIndex(PROMPTS)
+    assert index.lookup("outline_generation", "other-model") is index.lookup("outline_generation", "other-model")
+    assert compile_prompts(index) is index
+    assert compile_prompts(PROMPTS).lookup("outline_generation", "gpt-4o")[0].system_message == "专用"
+
+
+def test_reloaded_config_is_not_served_from_the_old_memo(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_store, "CHECK_INTERVAL_SECONDS", 0.0)
+    prompts_path = tmp_path / "prompts.yaml"
+    prompts_path.write_text("prompts:\n  outline_generation:\n    default:\n      system_message: 旧\n", encoding="utf-8")
+    store = ConfigStore(str(prompts_path), str(tmp_path / "prompts"), cache_path=None)
+    old_prompts = store.get().prompts
+    assert resolve_prompt("outline_generation", "gpt-4o", old_prompts).system_message == "旧"
+
+    prompts_path.write_text("prompts:\n  outline_generation:\n    default:\n      system_message: 新\n", encoding="utf-8")
+    os.utime(prompts_path, ns=(1, 1))
+    new_prompts = store.get().prompts
+    assert new_prompts is not old_prompts
+    assert resolve_prompt("outline_generation", "gpt-4o", new_prompts).system_message == "新"
+    assert resolve_prompt("outline_generation", "gpt-4o", old_prompts).system_message == "旧" # Snapshots stay consistent
+
+
+def test_template_fields():
+    assert parse_template_fields("{a} {b.attr} {c[0]} {d:{width}} {{literal}}") == {"a", "b", "c", "d", "width"}
+    for template in ("{0}", "{}", "{unclosed"):
+        with pytest.raises(ValueError):
+            parse_template_fields(template)
+
+
+def test_validate_reports_errors_and_warnings():
+    index = PromptIndex({
+        "outline_generation": {
+            "default": {"user_message_template": "{topic} {tone}"},
+            "gpt-4o": {"user_message_template": "固定文本"},
+            "broken": {"user_message_template": "{topic"},
+            "empty": {"system_message": "只有系统消息"},
+        },
+        "script_generation": {},
+    })
+    issues = {(issue.task, issue.model_key, issue.severity) for issue in index.validate({
+        "outline_generation": frozenset({"topic"}),
+        "script_generation": frozenset({"outline"}),
+        "script_scoring": frozenset({"script_content"}),
+    })}
+    assert issues == {
+        ("outline_generation", "default", SEVERITY_ERROR), # {tone} is never passed
+        ("outline_generation", "gpt-4o", SEVERITY_WARNING), # topic is passed but unused
+        ("outline_generation", "broken", SEVERITY_ERROR),
+        ("script_generation", None, SEVERITY_ERROR), # Empty task
+        ("script_scoring", None, SEVERITY_ERROR), # Missing task
+    }
+    messages = [format_issue(issue) for issue in index.validate({"outline_generation": frozenset({"topic"})})]
+    assert "[outline_generation / default] 模板使用了代码未提供的变量：tone" in messages
+    assert index.validate() is not index.validate() and index.validate() == index.validate()
+
+
+def test_shipped_prompts_validate_cleanly():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    snapshot = ConfigStore(os.path.join(root, "prompts.yaml"), os.path.join(root, "prompts"), cache_path=None).get()
+    assert [format_issue(issue) for issue in snapshot.prompts.validate()] == []
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from openai import APIConnectionError, AuthenticationError, BadRequestError, InternalServerError, RateLimitError
+
+from utils import rate_limiter
+from utils.core import ERROR_API, ERROR_AUTH, ERROR_CONNECTION, ERROR_RATE_LIMIT, classify_error
+from utils.rate_limiter import (
+    ModelRateLimiter, RateLimiterRegistry, RateLimits, RetryPolicy, TokenBucket, async_call_with_retries,
+    call_with_retries, estimate_request_tokens, is_retryable, retry_after_seconds
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", fake.sleep)
+    return fake
+
+
+def status_error(error_class, status_code, headers=None, body=None):
+    response = SimpleNamespace(status_code=status_code, headers=headers or {}, request=None)
+    return error_class(f"HTTP {status_code}", response=response, body=body)
+
+
+def test_token_bucket_reports_wait_without_taking(clock):
+    bucket = TokenBucket(per_minute=60) # One unit per second
+    assert bucket.wait_time(60, clock.now) == 0.0
+    bucket.take(58, clock.now)
+    assert bucket.wait_time(4, clock.now) == pytest.approx(2.0)
+    assert bucket.wait_time(4, clock.now) == pytest.approx(2.0) # Asking again took nothing
+    clock.now += 2.0
+    assert bucket.wait_time(4, clock.now) == 0.0
+
+
+def test_token_bucket_caps_oversized_requests_and_refunds(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(500, clock.now) == 0.0 # Capped to the capacity, so it can still run
+    bucket.take(500, clock.now)
+    bucket.refund(30, clock.now)
+    assert bucket.wait_time(30, clock.now) == 0.0
+    bucket.refund(-60, clock.now) # Usage beyond the estimate is charged, so the level goes below zero
+    assert bucket.wait_time(30, clock.now) == pytest.approx(60.0)
+
+
+def test_model_limiter_takes_capacity_only_when_available(clock):
+    limiter = ModelRateLimiter(RateLimits(requests_per_minute=600, tokens_per_minute=600))
+    assert limiter.try_acquire(600) == 0.0
+    assert limiter.try_acquire(100) == pytest.approx(10.0)
+    limiter.settle(600, 100) # 500 over-estimated tokens come back
+    assert limiter.try_acquire(500) == 0.0
+    limiter.block_for(5)
+    assert limiter.try_acquire(0) == pytest.approx(5.0)
+
+
+def test_refunds_wake_waiting_requests():
+    limiter = ModelRateLimiter(RateLimits(tokens_per_minute=60)) # Refills far too slowly to matter here
+    limiter.acquire(60)
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (limiter.acquire(50), acquired.set()))
+    waiter.start()
+    assert not acquired.wait(0.1)
+    started_at = time.monotonic()
+    limiter.settle(60, 5)
+    assert acquired.wait(5)
+    assert time.monotonic() - started_at < rate_limiter.WAIT_RECHECK_SECONDS
+    waiter.join()
+
+
+def test_async_slot_is_not_held_while_waiting_for_capacity():
+    limiter = ModelRateLimiter(RateLimits(tokens_per_minute=60))
+    limiter.try_acquire(60)
+    slot = asyncio.Semaphore(1)
+
+    async def scenario():
+        waiting = asyncio.create_task(async_call_with_retries(lambda: asyncio.sleep(0, "late"), limiter, 30, RetryPolicy(), slot))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        # The slot is free for requests that have capacity (e.g. to another model sharing the provider)
+        assert await async_call_with_retries(lambda: asyncio.sleep(0, "other"), ModelRateLimiter(RateLimits()), 30,
+                                             RetryPolicy(), slot) == ("other", 0)
+        limiter.release_tokens(30)
+        return await asyncio.wait_for(waiting, 5)
+
+    assert asyncio.run(scenario()) == ("late", 0)
+
+
+def test_request_estimate_caps_the_completion_size():
+    messages = [{"role": "user", "content": "a" * 400}]
+    assert estimate_request_tokens(messages, 100) == 200
+    assert estimate_request_tokens(messages, 65535) == 100 + rate_limiter.COMPLETION_TOKEN_ESTIMATE_CAP
+
+
+def test_concurrent_large_requests_share_a_small_token_quota(clock):
+    limiter = ModelRateLimiter(RateLimits(tokens_per_minute=30000))
+    estimate = estimate_request_tokens([{"role": "user", "content": "场景" * 500}], 65535)
+    assert [limiter.try_acquire(estimate) for _ in range(5)] == [0.0] * 5
+
+
+def test_registry_applies_per_model_overrides():
+    registry = RateLimiterRegistry()
+    registry.register_provider("https://api.example.com/v1/", {
+        "rate_limits": {"requests_per_minute": 60, "max_retries": 2, "models": {"big": {"tokens_per_minute": 1000}}}
+    })
+    assert registry.limiter("https://api.example.com/v1", "small").limits == RateLimits(requests_per_minute=60)
+    assert registry.limiter("https://api.example.com/v1", "big").limits == RateLimits(tokens_per_minute=1000)
+    assert registry.retry_policy("https://api.example.com/v1").max_retries == 2
+    assert registry.limiter("https://other.example.com", "m").limits == RateLimits()
+
+
+def test_backoff_delay_is_bounded(monkeypatch):
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    assert [policy.backoff_delay(attempt) for attempt in range(5)] == [1.0, 2.0, 4.0, 8.0, 10.0]
+
+
+def test_error_classification():
+    assert is_retryable(status_error(RateLimitError, 429))
+    assert is_retryable(status_error(InternalServerError, 503))
+    assert is_retryable(APIConnectionError(request=None))
+    assert not is_retryable(status_error(BadRequestError, 400))
+    assert not is_retryable(status_error(AuthenticationError, 401))
+    assert not is_retryable(status_error(RateLimitError, 429, body={"code": "insufficient_quota"}))
+    assert not is_retryable(ValueError("not an API error"))
+
+    assert classify_error(status_error(AuthenticationError, 401))[0] == ERROR_AUTH
+    assert classify_error(APIConnectionError(request=None))[0] == ERROR_CONNECTION
+    assert classify_error(status_error(RateLimitError, 429, body={"code": "insufficient_quota"}))[0] == ERROR_RATE_LIMIT
+    assert classify_error(status_error(BadRequestError, 400))[0] == ERROR_API
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(status_error(RateLimitError, 429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(status_error(RateLimitError, 429, {"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(status_error(RateLimitError, 429)) is None
+
+
+def test_call_with_retries_retries_transient_errors(clock):
+    limiter = ModelRateLimiter(RateLimits())
+    errors = [status_error(RateLimitError, 429, {"retry-after": "2"}), status_error(InternalServerError, 500)]
+
+    def send():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert call_with_retries(send, limiter, 10, RetryPolicy(base_delay=0.0)) == ("ok", 2)
+    assert 2.0 in clock.slept # Retry-After was honoured
+
+
+def test_call_with_retries_raises_fatal_and_exhausted_errors(clock):
+    limiter = ModelRateLimiter(RateLimits())
+    calls = []
+
+    def fatal():
+        calls.append(1)
+        raise status_error(AuthenticationError, 401)
+
+    with pytest.raises(AuthenticationError):
+        call_with_retries(fatal, limiter, 10, RetryPolicy())
+    assert len(calls) == 1
+
+    def always_busy():
+        calls.append(1)
+        raise status_error(InternalServerError, 502)
+
+    with pytest.raises(InternalServerError):
+        call_with_retries(always_busy, limiter, 10, RetryPolicy(max_retries=2, base_delay=0.0))
+    assert len(calls) == 1 + 3
@@ -0,0 +1,86 @@
+import pytest
+
+from utils import core, response_cache
+from utils.response_cache import ResponseCache, make_cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "responses.sqlite3"), max_entries=3)
+
+
+def total_changes(cache):
+    return cache._conn.total_changes
+
+
+def test_cache_key_depends_on_every_input():
+    key = make_cache_key("https://api.example.com/v1/", "m", "sys", "user", None, {"temperature": 1})
+    assert key == make_cache_key("https://api.example.com/v1", "m", "sys", "user", None, {"temperature": 1})
+    assert key != make_cache_key("https://api.example.com/v1", "m", "sys", "user", None, {"temperature": 0})
+    assert key != make_cache_key("https://api.example.com/v1", "m", "sys", "user", "aW1hZ2U=", {"temperature": 1})
+
+
+def test_hits_misses_and_expiry(cache, monkeypatch):
+    cache.set("a", "response", ttl_seconds=60)
+    assert cache.get("a") == "response"
+    assert cache.get("b") is None
+    now = response_cache.time.time()
+    monkeypatch.setattr(response_cache.time, "time", lambda: now + 61)
+    assert cache.get("a") is None
+    assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_lookups_do_not_write_until_the_counters_are_due(cache, monkeypatch):
+    cache.set("a", "response", ttl_seconds=60)
+    writes = total_changes(cache)
+    for _ in range(10):
+        assert cache.get("a") == "response"
+        assert cache.get("missing") is None
+    assert total_changes(cache) == writes # last_access is recent and the counters are in memory
+    assert cache.stats()["hits"] == 10 and cache.stats()["misses"] == 10
+
+    monkeypatch.setattr(response_cache, "COUNTER_FLUSH_SECONDS", 0.0)
+    cache.get("a")
+    assert total_changes(cache) > writes
+    assert dict(cache._conn.execute("SELECT name, value FROM counters").fetchall()) == {"hits": 11, "misses": 10}
+
+
+def test_stale_last_access_is_refreshed(cache, monkeypatch):
+    cache.set("a", "response", ttl_seconds=3600)
+    now = response_cache.time.time()
+    monkeypatch.setattr(response_cache.time, "time", lambda: now + response_cache.LAST_ACCESS_RESOLUTION_SECONDS + 1)
+    cache.get("a")
+    last_access = cache._conn.execute("SELECT last_access FROM responses WHERE key = 'a'").fetchone()[0]
+    assert last_access == pytest.approx(now + response_cache.LAST_ACCESS_RESOLUTION_SECONDS + 1)
+
+
+def test_least_recently_used_entries_are_evicted(cache, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: clock[0])
+    for key in "abc":
+        cache.set(key, key, ttl_seconds=3600)
+        clock[0] += 1
+    clock[0] += response_cache.LAST_ACCESS_RESOLUTION_SECONDS
+    cache.get("a") # Old enough to be refreshed, so "b" is now the least recently used
+    cache.set("d", "d", ttl_seconds=3600)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_flush_and_clear(cache):
+    cache.get("missing")
+    cache.flush()
+    assert dict(cache._conn.execute("SELECT name, value FROM counters").fetchall()) == {"misses": 1}
+    cache.get("missing")
+    cache.clear()
+    assert cache.stats()["misses"] == 0
+
+
+def test_an_unavailable_cache_never_blocks_generation(monkeypatch):
+    def unavailable():
+        raise PermissionError("cannot create .cache")
+
+    monkeypatch.setattr(core, "get_response_cache", unavailable)
+    assert core._read_cached_response("key") is None
+    core._store_cached_response("key", "response", 1)
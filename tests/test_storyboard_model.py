@@ -0,0 +1,85 @@
+import pandas as pd
+
+from utils.storyboard_model import StoryboardModel, scene_rows, session_storyboard_model
+
+
+def storyboard(*narrations):
+    return pd.DataFrame({
+        "画面序号": [str(number) for number in range(1, len(narrations) + 1)],
+        "中文口播文案": list(narrations),
+        "画面描述": [f"描述 {narration}" for narration in narrations],
+    })
+
+
+def test_first_sync_reports_every_row():
+    model = StoryboardModel()
+    assert model.sync(storyboard("a", "b")) == [0, 1]
+    assert model.version == 1
+
+
+def test_same_frame_and_equal_copy_keep_the_version():
+    model = StoryboardModel()
+    df = storyboard("a", "b")
+    model.sync(df)
+    assert model.sync(df) == []
+    assert model.sync(df.copy()) == []
+    assert model.version == 1
+
+
+def test_cell_edit_reports_only_the_edited_row():
+    model = StoryboardModel()
+    model.sync(storyboard("a", "b", "c"))
+    edited = storyboard("a", "B", "c")
+    assert model.sync(edited) == [1]
+    assert model.version == 2
+    assert model.df is edited
+
+
+def test_known_positions_limit_rehashing():
+    model = StoryboardModel()
+    model.sync(storyboard("a", "b", "c"))
+    assert model.sync(storyboard("a", "B", "c"), positions=[1, 7]) == [1]
+    # Only the given positions are rehashed, so a change elsewhere is not seen
+    assert model.sync(storyboard("X", "B", "c"), positions=[2]) == []
+    assert model.version == 2
+
+
+def test_row_changes_report_new_content_and_bump_the_version():
+    model = StoryboardModel()
+    model.sync(storyboard("a", "b", "c"))
+    deleted = storyboard("a", "b")
+    deleted["画面序号"] = ["1", "2"]
+    assert model.sync(deleted) == [] # A pure deletion changes the content but adds no row
+    assert model.version == 2
+    assert model.sync(storyboard("a", "b", "new")) == [2]
+    assert model.version == 3
+
+
+def test_views_are_built_once_per_version():
+    model = StoryboardModel()
+    model.sync(storyboard("a"))
+    builds = []
+
+    def builder(df):
+        builds.append(len(df))
+        return len(df)
+
+    assert model.view("count", builder) == 1
+    assert model.view("count", builder) == 1
+    model.sync(storyboard("a", "b"))
+    assert model.view("count", builder) == 2
+    assert builds == [1, 2]
+
+
+def test_session_model_follows_the_storyboard_data():
+    session_state = {}
+    assert session_storyboard_model(session_state).df.empty
+    session_state["storyboard_data"] = storyboard("a")
+    model = session_storyboard_model(session_state)
+    assert model is session_state["storyboard_model"]
+    assert model.df is session_state["storyboard_data"] and model.version == 1
+
+
+def test_scene_rows_fall_back_to_placeholders():
+    df = storyboard("a").drop(columns="画面描述")
+    assert scene_rows(df) == [{"scene_id": "1", "description": "无画面描述", "narration": "a"}]
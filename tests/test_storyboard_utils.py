@@ -0,0 +1,79 @@
+import pandas as pd
+
+from utils.storyboard_utils import (
+    NO_CONTEXT, STORYBOARD_COLUMNS, merge_regenerated_rows, merge_storyboard_segments, plan_row_regeneration,
+    rows_to_markdown, split_script_into_segments
+)
+
+
+def storyboard(*narrations):
+    return pd.DataFrame(
+        [[str(number), narration, f"prompt {narration}", f"描述 {narration}"] for number, narration in enumerate(narrations, 1)],
+        columns=STORYBOARD_COLUMNS
+    )
+
+
+def test_short_and_empty_scripts_are_not_split():
+    assert split_script_into_segments("  \n ") == []
+    assert split_script_into_segments("第一段。\n\n第二段。", max_chars=100) == ["第一段。\n\n第二段。"]
+
+
+def test_segments_are_cut_between_paragraphs():
+    paragraphs = ["甲" * 40, "乙" * 40, "丙" * 40]
+    segments = split_script_into_segments("\n\n".join(paragraphs), max_chars=90)
+    assert segments == ["\n\n".join(paragraphs[:2]), paragraphs[2]]
+
+
+def test_long_paragraph_is_cut_between_sentences_without_losing_text():
+    sentences = ["这是第一句话。", "这是第二句话！", "第三句？", "最后一句。"]
+    paragraph = "".join(sentences)
+    segments = split_script_into_segments(paragraph, max_chars=15)
+    assert all(len(segment) <= 15 for segment in segments)
+    assert "".join(segments) == paragraph
+    assert all(segment.endswith(("。", "！", "？")) for segment in segments)
+
+
+def test_a_single_sentence_longer_than_the_limit_stays_whole():
+    sentence = "没有标点的一整句话" * 5
+    assert split_script_into_segments(sentence + "。\n\n短段。", max_chars=10) == [sentence + "。", "短段。"]
+
+
+def test_merge_renumbers_scenes_across_segments_in_order():
+    merged = merge_storyboard_segments([storyboard("a", "b"), None, pd.DataFrame(), storyboard("c")])
+    assert merged["画面序号"].tolist() == ["1", "2", "3"]
+    assert merged["中文口播文案"].tolist() == ["a", "b", "c"]
+
+
+def test_merge_of_no_segments_keeps_the_columns():
+    merged = merge_storyboard_segments([None, pd.DataFrame()])
+    assert merged.empty and list(merged.columns) == STORYBOARD_COLUMNS
+
+
+def test_row_regeneration_groups_consecutive_rows_with_context():
+    groups = plan_row_regeneration(10, [9, 2, 3, 4, 3, 42], context_rows=1, max_rows_per_request=2)
+    assert [(g.positions, g.context_before, g.context_after) for g in groups] == [
+        ([2, 3], [1], [4]), ([4], [3], [5]), ([9], [8], [])
+    ]
+
+
+def test_rows_to_markdown_escapes_cells():
+    df = storyboard("a | b")
+    assert "a \\| b" in rows_to_markdown(df, [0])
+    assert rows_to_markdown(df, []) == NO_CONTEXT
+
+
+def test_merge_regenerated_rows_replaces_only_prompt_and_description():
+    df = storyboard("a", "b", "c")
+    reply = pd.DataFrame([["3", "changed", "new prompt", "新描述"]], columns=STORYBOARD_COLUMNS)
+    updated, missing = merge_regenerated_rows(df, [1, 2], reply)
+    assert missing == [1]
+    assert updated.iloc[2].tolist() == ["3", "c", "new prompt", "新描述"] # Narration stays verbatim
+    assert updated.iloc[1].tolist() == df.iloc[1].tolist()
+    assert df.iloc[2, 2] == "prompt c" # The input frame is not modified
+
+
+def test_merge_regenerated_rows_matches_in_order_without_scene_numbers():
+    reply = pd.DataFrame({"文生图提示词 (英文)": ["p1", "p2"], "画面描述": ["d1", "d2"]})
+    updated, missing = merge_regenerated_rows(storyboard("a", "b", "c"), [0, 2], reply)
+    assert missing == []
+    assert updated["画面描述"].tolist() == ["d1", "描述 b", "d2"]
@@ -0,0 +1,147 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from openai import BadRequestError
+
+from utils import async_core, core
+from utils.async_core import AsyncLLMSession
+from utils.storyboard_utils import STORYBOARD_COLUMNS
+from utils.structured_output import (
+    StructuredOutputError, format_video_metadata, parse_storyboard_json, parse_storyboard_response,
+    parse_video_metadata_json, parse_video_metadata_response, response_format_for, with_structured_output_instruction
+)
+
+SCENE = {"scene_number": 1, "chinese_narration": "口播", "image_prompt": "a cat", "scene_description": "猫"}
+METADATA = {
+    "titles": ["标题一", " 标题二 "],
+    "description": "描述",
+    "tags": ["#a", "#b"],
+    "thumbnail_prompts": ["prompt"],
+    "thumbnail_texts": [],
+}
+MARKDOWN_TABLE = "| 画面序号 | 中文口播文案 | 文生图提示词 (英文) | 画面描述 |\n|---|---|---|---|\n| 1 | 口播 | a cat | 猫 |"
+
+
+def test_storyboard_json_is_validated_into_storyboard_rows():
+    df = parse_storyboard_json("```json\n" + json.dumps({"scenes": [SCENE]}) + "\n```")
+    assert list(df.columns) == STORYBOARD_COLUMNS
+    assert df.iloc[0].tolist() == ["1", "口播", "a cat", "猫"]
+    for content in ("not json", "[]", json.dumps({"scenes": []}), json.dumps({"scenes": [dict(SCENE, image_prompt="")]})):
+        with pytest.raises(StructuredOutputError):
+            parse_storyboard_json(content)
+
+
+def test_video_metadata_json_is_validated_and_rendered():
+    metadata = parse_video_metadata_json(json.dumps(METADATA))
+    assert metadata["titles"] == ["标题一", "标题二"]
+    text = format_video_metadata(metadata)
+    assert "## 视频标题\n\n1. 标题一\n2. 标题二" in text
+    assert "## 标签\n\n#a #b" in text
+    assert "缩略图文字" not in text # Empty fields are left out
+    for broken in (dict(METADATA, titles=[]), dict(METADATA, description=" "), dict(METADATA, tags="#a")):
+        with pytest.raises(StructuredOutputError):
+            parse_video_metadata_json(json.dumps(broken))
+
+
+def test_responses_fall_back_to_markdown():
+    assert parse_storyboard_response(json.dumps({"scenes": [SCENE]}), structured=True).shape == (1, 4)
+    assert parse_storyboard_response(MARKDOWN_TABLE, structured=True).iloc[0].tolist() == ["1", "口播", "a cat", "猫"]
+    assert parse_video_metadata_response("## 视频标题\n\n纯文本", structured=True) == ("## 视频标题\n\n纯文本", None)
+    text, metadata = parse_video_metadata_response(json.dumps(METADATA), structured=True)
+    assert metadata["description"] == "描述" and text == format_video_metadata(metadata)
+    assert parse_video_metadata_response(json.dumps(METADATA), structured=False) == (json.dumps(METADATA), None)
+
+
+def test_request_format_and_instruction():
+    response_format = response_format_for("storyboard_generation")
+    assert response_format["type"] == "json_schema" and response_format["json_schema"]["strict"] is True
+    assert response_format_for("topic_generation") is None
+    assert with_structured_output_instruction("系统", "topic_generation") == "系统"
+    assert with_structured_output_instruction("系统\n", "storyboard_generation").startswith("系统\n\n【输出格式")
+
+
+def rejection():
+    response = SimpleNamespace(status_code=400, headers={}, request=None)
+    return BadRequestError("Invalid parameter: 'response_format' of type 'json_schema' is not supported with this model.",
+                           response=response, body=None)
+
+
+def completion(content):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+
+class FakeCompletions:
+    """Rejects any request with a `response_format`, like gpt-3.5-turbo given a strict JSON schema."""
+
+    def __init__(self):
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if "response_format" in kwargs:
+            raise rejection()
+        return completion(MARKDOWN_TABLE)
+
+
+class FakeAsyncCompletions(FakeCompletions):
+    async def create(self, **kwargs):
+        return FakeCompletions.create(self, **kwargs)
+
+
+@pytest.fixture
+def isolated(monkeypatch):
+    monkeypatch.setattr(core, "_RESPONSE_FORMAT_UNSUPPORTED", set())
+    monkeypatch.setattr(core, "record_llm_call", lambda result, base_url: None)
+    monkeypatch.setattr(async_core, "finish_result", lambda *args: None)
+
+
+def test_rejected_response_format_is_retried_without_it_and_remembered(isolated, monkeypatch):
+    completions = FakeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(core, "get_openai_client", lambda api_key, base_url: client)
+    response_format = response_format_for("storyboard_generation")
+
+    def call():
+        return core.chat_completion("key", "https://api.example.com/v1", "gpt-3.5-turbo", "系统", "用户",
+                                    response_format=response_format)
+
+    result = call()
+    assert result.ok and result.content == MARKDOWN_TABLE
+    assert ["response_format" in request for request in completions.requests] == [True, False]
+    assert parse_storyboard_response(result.content, structured=True).shape == (1, 4)
+
+    assert call().ok
+    assert "response_format" not in completions.requests[-1] and len(completions.requests) == 3 # Not tried again
+    assert core._supported_response_format("https://api.example.com/v1", "gpt-4o", response_format) == response_format
+
+
+def test_other_bad_requests_are_not_retried(isolated, monkeypatch):
+    def create(**kwargs):
+        raise BadRequestError("context length exceeded", response=SimpleNamespace(status_code=400, headers={}, request=None),
+                              body=None)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(core, "get_openai_client", lambda api_key, base_url: client)
+    result = core.chat_completion("key", "https://api.example.com/v1", "gpt-4o", "系统", "用户",
+                                  response_format=response_format_for("storyboard_generation"))
+    assert not result.ok and result.error_kind == core.ERROR_API
+    assert not core._RESPONSE_FORMAT_UNSUPPORTED
+
+
+def test_async_session_retries_without_rejected_response_format(isolated, monkeypatch):
+    completions = FakeAsyncCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    async def scenario():
+        session = AsyncLLMSession()
+        monkeypatch.setattr(session, "client", lambda api_key, base_url: client)
+        return await session.chat_completion("key", "https://api.example.com/v1", "gpt-4-turbo", "系统", "用户",
+                                             response_format=response_format_for("video_metadata_generation"))
+
+    result = asyncio.run(scenario())
+    assert result.ok and result.content == MARKDOWN_TABLE
+    assert ["response_format" in request for request in completions.requests] == [True, False]
+    assert ("https://api.example.com/v1", "gpt-4-turbo") in core._RESPONSE_FORMAT_UNSUPPORTED
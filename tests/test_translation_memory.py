@@ -0,0 +1,77 @@
+import json
+from dataclasses import replace
+
+import pytest
+
+from utils.prompt_index import CompiledPrompt
+from utils.translation_memory import TranslationMemory, plan_with_memory, prompt_version, remember_response, source_hash
+from utils.translation_utils import METADATA_TASK, PART_SCENES, SCENE_BATCH_TASK
+
+VERSIONS = {SCENE_BATCH_TASK: "scenes-v1", METADATA_TASK: "metadata-v1"}
+
+
+@pytest.fixture
+def memory(tmp_path):
+    return TranslationMemory(str(tmp_path / "translation_memory.sqlite3"))
+
+
+def scenes(*narrations, numbers=None):
+    numbers = numbers or [str(index + 1) for index in range(len(narrations))]
+    return [{"scene_number": number, "chinese_narration": narration} for number, narration in zip(numbers, narrations)]
+
+
+def reply_for(request, prefix="EN"):
+    """A `translate_scene_batch` reply that echoes the scene numbers the request was sent with."""
+    batch = json.loads(request.variables["scenes_json"])
+    return json.dumps({"translations": [
+        {"scene_number": scene["scene_number"], "translation": f"{prefix} {scene['chinese_narration']}"} for scene in batch
+    ]}, ensure_ascii=False)
+
+
+def test_lookups_are_per_language_and_prompt_version(memory):
+    memory.put_many([("你好", "Hello"), ("  ", "ignored"), ("空", "")], "English", "v1")
+    assert memory.get_many(["你好", " 你好 ", "再见"], "English", "v1") == {source_hash("你好"): "Hello"}
+    assert memory.get_many(["你好"], "French", "v1") == {}
+    assert memory.get_many(["你好"], "English", "v2") == {}
+    assert memory.count() == 1
+    memory.put_many([("你好", "Hi")], "English", "v1")
+    assert memory.get_many(["你好"], "English", "v1") == {source_hash("你好"): "Hi"}
+
+
+def test_prompt_version_changes_with_the_prompt():
+    prompt = CompiledPrompt(SCENE_BATCH_TASK, "default", "system", "{scenes_json}", {"temperature": 0.3}, frozenset({"scenes_json"}))
+    assert prompt_version(prompt) == prompt_version(replace(prompt, parameters={"temperature": 1}))
+    assert prompt_version(prompt) != prompt_version(replace(prompt, system_message="edited"))
+    assert prompt_version(None) == ""
+
+
+def test_only_unknown_scenes_are_requested(memory):
+    memory.put_many([("第一句", "First")], "English", VERSIONS[SCENE_BATCH_TASK])
+    memory.put_many([("元数据", "Metadata")], "English", VERSIONS[METADATA_TASK])
+    translation = plan_with_memory(memory, "English", scenes("第一句", "  ", "第三句"), "元数据", VERSIONS)
+    assert translation.reused_translations == {0: "First", 1: ""}
+    assert [request.scene_positions for request in translation.requests if request.part == PART_SCENES] == [[2]]
+    assert translation.metadata_reused and len(translation.pending()) == 1
+
+
+def test_repeated_and_blank_scene_numbers_do_not_collide(memory):
+    translation = plan_with_memory(memory, "English", scenes("甲", "乙", "丙", "丁", numbers=["1", "1", "", ""]),
+                                   "元数据", VERSIONS, batch_size=2)
+    for request in translation.pending():
+        content = reply_for(request) if request.part == PART_SCENES else "Metadata"
+        assert translation.add_response(request, content)
+        remember_response(memory, translation, request, VERSIONS)
+    assert translation.complete
+    report = translation.report()
+    for number, narration in [("1", "甲"), ("1", "乙"), ("", "丙"), ("", "丁")]:
+        assert f"| {number} | {narration} | EN {narration} |" in report
+
+    replanned = plan_with_memory(memory, "English", translation.scenes, "元数据", VERSIONS)
+    assert replanned.reused_translations == {0: "EN 甲", 1: "EN 乙", 2: "EN 丙", 3: "EN 丁"}
+    assert replanned.pending() == []
+
+
+def test_without_memory_everything_is_requested():
+    translation = plan_with_memory(None, "English", scenes("甲", "乙"), "元数据", VERSIONS)
+    assert translation.reused_translations == {}
+    assert len(translation.pending()) == 2 # One scene batch and the metadata
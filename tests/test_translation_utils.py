@@ -0,0 +1,80 @@
+import json
+
+import pandas as pd
+import pytest
+
+from utils.translation_utils import (
+    PART_METADATA, PART_SCENES, LanguageTranslation, TranslationError, build_md_report, build_scenes,
+    parse_scene_batch_translation, parse_scenes_json, plan_translation_requests, strip_code_fence
+)
+
+
+def test_parses_translations_in_batch_order():
+    content = json.dumps({"translations": [
+        {"scene_number": 2, "translation": " Two "}, {"scene_number": "1", "translation": "One"}
+    ]})
+    assert parse_scene_batch_translation(content, ["1", "2"]) == {"1": "One", "2": "Two"}
+
+
+def test_tolerates_code_fences_and_stray_text():
+    fenced = '```json\n{"translations": [{"scene_number": "1", "translation": "One"}]}\n```'
+    assert parse_scene_batch_translation(fenced, ["1"]) == {"1": "One"}
+    chatty = '好的，翻译如下：{"translations": [{"scene_number": "1", "translation": "One"}]} 希望有帮助'
+    assert parse_scene_batch_translation(chatty, ["1"]) == {"1": "One"}
+
+
+@pytest.mark.parametrize("content", ["not json", '{"result": []}', '{"translations": "One"}'])
+def test_rejects_responses_without_a_translations_list(content):
+    with pytest.raises(TranslationError):
+        parse_scene_batch_translation(content, ["1"])
+
+
+def test_rejects_missing_and_empty_scenes():
+    content = json.dumps({"translations": [{"scene_number": "1", "translation": "One"}, {"scene_number": "2", "translation": ""}]})
+    with pytest.raises(TranslationError, match="2, 3"):
+        parse_scene_batch_translation(content, ["1", "2", "3"])
+
+
+def test_strip_code_fence_leaves_plain_text():
+    assert strip_code_fence("  plain  ") == "plain"
+    assert strip_code_fence("```\nfenced\n```") == "fenced"
+
+
+def test_build_scenes_and_parse_scenes_json():
+    df = pd.DataFrame({"画面序号": [1, 1], "中文口播文案": ["甲", "乙"]})
+    assert build_scenes(df) == [{"scene_number": "1", "chinese_narration": "甲"}, {"scene_number": "1", "chinese_narration": "乙"}]
+    assert build_scenes(df.drop(columns="画面序号"))[1]["scene_number"] == "2"
+    assert parse_scenes_json(json.dumps({"scenes": [{"chinese_narration": "乙"}]})) == [
+        {"scene_number": "1", "chinese_narration": "乙"}
+    ]
+
+
+def test_plans_scene_batches_and_one_metadata_request():
+    scenes = [{"scene_number": "7", "chinese_narration": str(index)} for index in range(5)]
+    requests = plan_translation_requests(scenes, "元数据", "English", batch_size=2)
+    assert [(request.part, request.scene_positions) for request in requests] == [
+        (PART_SCENES, [0, 1]), (PART_SCENES, [2, 3]), (PART_SCENES, [4]), (PART_METADATA, [])
+    ]
+    sent = json.loads(requests[1].variables["scenes_json"])
+    assert [scene["scene_number"] for scene in sent] == ["3", "4"] # Numbered by position, not 画面序号
+
+
+def test_failed_batches_stay_pending_until_a_usable_reply():
+    scenes = [{"scene_number": "1", "chinese_narration": "你好"}]
+    translation = LanguageTranslation("English", scenes, "元数据", plan_translation_requests(scenes, "元数据", "English"))
+    scene_request, metadata_request = translation.requests
+    assert not translation.add_response(scene_request, "oops")
+    assert not translation.add_response(metadata_request, None, error_message="timeout")
+    assert translation.pending() == [scene_request, metadata_request]
+    assert translation.add_response(scene_request, '{"translations": [{"scene_number": "1", "translation": "Hello"}]}')
+    assert translation.add_response(metadata_request, "Metadata")
+    assert translation.complete and translation.errors == {}
+
+
+def test_md_report_layout():
+    scenes = [{"scene_number": "1", "chinese_narration": "你好"}, {"scene_number": "2", "chinese_narration": "a|b"}]
+    report = build_md_report("Japanese", scenes, {0: "こんにちは", 1: "x\ny"}, "中文元数据", "メタデータ")
+    assert "| 1 | 你好 | こんにちは |" in report
+    assert "| 2 | a\\|b | x<br>y |" in report
+    assert "こんにちはx\ny" in report # Unspaced language: narration joined without spaces
+    assert report.index("### 中文元数据 (源语言)") < report.index("### 翻译后的元数据 (Japanese)")
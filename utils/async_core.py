@@ -0,0 +1,222 @@
+"""
+asyncio counterpart of `utils.core` for fan-out work.
+
+Requests run as coroutines on a single event loop instead of one OS thread each, so a
+batch can keep hundreds of requests in flight. An `AsyncLLMSession` owns the
+`AsyncOpenAI` clients and a shared semaphore per provider (base URL) that caps the
+requests in flight against it; both are bound to the event loop the session runs on.
+
+Synchronous callers (Streamlit pages) use `run_chat_completions`, which runs the
+requests on a private event loop and reports each result as it lands.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from openai import AsyncOpenAI, BadRequestError, DefaultAsyncHttpxClient
+
+from utils.client_pool import (
+    CLIENT_MAX_RETRIES, CONNECT_TIMEOUT_SECONDS, DEFAULT_REQUEST_TIMEOUT_SECONDS, KEEPALIVE_EXPIRY_SECONDS,
+    _key_fingerprint, _normalize_base_url, httpx
+)
+from utils.core import (
+    LLMResult, _rejects_response_format, _request_options, _supported_response_format, apply_completion_response,
+    classify_error, finish_result, prepare_request
+)
+from utils.rate_limiter import async_call_with_retries, estimate_request_tokens, get_rate_limiter_registry
+
+DEFAULT_PROVIDER_CONCURRENCY = 3 # Used when no limit is configured for a provider
+
+
+def _create_async_client(api_key: str, base_url: str, max_connections: int) -> AsyncOpenAI:
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections, # The provider semaphore is the real bound
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(DEFAULT_REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        max_retries=CLIENT_MAX_RETRIES,
+    )
+
+
+class AsyncLLMSession:
+    """
+    Async clients and per-provider concurrency limits for one event loop.
+
+    Args:
+        provider_limits (dict, optional): Maximum requests in flight per base URL.
+        default_concurrency (int): Limit for base URLs not listed in `provider_limits`.
+
+    Use as `async with AsyncLLMSession(...) as session:` so the clients' connection
+    pools are closed before the loop goes away.
+    """
+
+    def __init__(self, provider_limits: Optional[Dict[str, int]] = None, default_concurrency: int = DEFAULT_PROVIDER_CONCURRENCY):
+        self.provider_limits = {_normalize_base_url(url): max(1, int(limit)) for url, limit in (provider_limits or {}).items()}
+        self.default_concurrency = max(1, int(default_concurrency))
+        self._clients: Dict[Tuple[str, str], AsyncOpenAI] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def concurrency_limit(self, base_url: str) -> int:
+        return self.provider_limits.get(_normalize_base_url(base_url), self.default_concurrency)
+
+    def semaphore(self, base_url: str) -> asyncio.Semaphore:
+        """Returns the semaphore shared by every request to this provider."""
+        provider_key = _normalize_base_url(base_url)
+        if provider_key not in self._semaphores:
+            self._semaphores[provider_key] = asyncio.Semaphore(self.concurrency_limit(base_url))
+        return self._semaphores[provider_key]
+
+    def client(self, api_key: str, base_url: str) -> AsyncOpenAI:
+        client_key = (_normalize_base_url(base_url), _key_fingerprint(api_key))
+        if client_key not in self._clients:
+            self._clients[client_key] = _create_async_client(api_key, base_url, self.concurrency_limit(base_url))
+        return self._clients[client_key]
+
+    async def chat_completion(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str,
+        system_message: Optional[str],
+        user_message_text: Optional[str],
+        image_data_base64: Optional[str] = None,
+        image_media_type: str = "image/jpeg",
+        temperature: float = 1,
+        max_tokens: int = 5000,
+        timeout: Optional[float] = None,
+        cache_ttl_hours: Optional[float] = None,
+        task_name: Optional[str] = None,
+        response_format: Optional[Dict[str, Any]] = None
+    ) -> LLMResult:
+        """Async `utils.core.chat_completion`: same arguments, returns an LLMResult and never raises."""
+        result, messages, cache_key = prepare_request(
+            base_url, model, system_message, user_message_text, image_data_base64, image_media_type,
+            temperature, max_tokens, cache_ttl_hours, task_name, response_format
+        )
+        if messages is None:
+            finish_result(result, base_url, cache_key, cache_ttl_hours)
+            return result
+
+        limiter = get_rate_limiter_registry().limiter(base_url, model)
+        estimated_tokens = estimate_request_tokens(messages, max_tokens)
+        sent_at: List[float] = []
+
+        def send(request_format):
+            def create():
+                if not sent_at:
+                    sent_at.append(time.perf_counter()) # Latency excludes time spent queued for capacity or a slot
+                return client.chat.completions.create(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **_request_options(timeout, request_format)
+                )
+            # The provider semaphore is held only while a request is in flight, not while it waits for rate-limit capacity
+            return async_call_with_retries(
+                create, limiter, estimated_tokens, get_rate_limiter_registry().retry_policy(base_url), self.semaphore(base_url)
+            )
+
+        try:
+            client = self.client(api_key, base_url)
+            request_format = _supported_response_format(base_url, model, response_format)
+            try:
+                chat_completion_response, result.retries = await send(request_format)
+            except BadRequestError as e:
+                if not request_format or not _rejects_response_format(e, base_url, model):
+                    raise
+                chat_completion_response, result.retries = await send(None)
+            apply_completion_response(result, chat_completion_response)
+            limiter.settle(estimated_tokens, result.total_tokens)
+        except Exception as e:
+            result.error_kind, result.error_message = classify_error(e)
+        result.latency = time.perf_counter() - sent_at[0] if sent_at else 0.0
+        finish_result(result, base_url, cache_key, cache_ttl_hours)
+        return result
+
+    async def aclose(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.close()
+
+    async def __aenter__(self) -> "AsyncLLMSession":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+async def _keyed(key: Hashable, awaitable: Awaitable[Any]) -> Tuple[Hashable, Any]:
+    return key, await awaitable
+
+
+async def as_completed_by_key(awaitables: Dict[Hashable, Awaitable[Any]]):
+    """
+    Runs the awaitables concurrently and yields (key, result) pairs in completion order.
+
+    Tasks still pending when the consumer stops early are cancelled.
+    """
+    tasks = [asyncio.ensure_future(_keyed(key, awaitable)) for key, awaitable in awaitables.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def gather_or_cancel(*awaitables: Awaitable[Any]) -> List[Any]:
+    """
+    Like `asyncio.gather`, but if one awaitable raises (or the caller is cancelled), the
+    others are cancelled and awaited before the exception propagates.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _run_chat_completions(requests, max_concurrency, on_result):
+    results: Dict[Hashable, LLMResult] = {}
+    async with AsyncLLMSession(default_concurrency=max_concurrency) as session:
+        completions = {key: session.chat_completion(**request) for key, request in requests.items()}
+        async for key, result in as_completed_by_key(completions):
+            results[key] = result
+            if on_result:
+                on_result(key, result)
+    return results
+
+
+def run_chat_completions(
+    requests: Dict[Hashable, Dict[str, Any]],
+    max_concurrency: int = DEFAULT_PROVIDER_CONCURRENCY,
+    on_result: Optional[Callable[[Hashable, LLMResult], None]] = None
+) -> Dict[Hashable, LLMResult]:
+    """
+    Runs many chat completions concurrently from synchronous code.
+
+    Args:
+        requests (dict): Maps a caller-chosen key to the keyword arguments of `chat_completion`.
+        max_concurrency (int): Maximum requests in flight per provider.
+        on_result (callable, optional): Called as `on_result(key, result)` in the calling
+            thread as each request finishes, so Streamlit pages can render progress from it.
+            If it raises (e.g. a Streamlit rerun), the remaining requests are cancelled.
+
+    Returns:
+        dict: key -> LLMResult for every request that finished.
+    """
+    if not requests:
+        return {}
+    return asyncio.run(_run_chat_completions(requests, max_concurrency, on_result))
@@ -0,0 +1,117 @@
+"""
+Process-wide registry of reusable OpenAI clients.
+
+Creating a new `OpenAI` client per request throws away its HTTP connection pool,
+so every generation paid a fresh TCP+TLS handshake. Clients are now shared by
+every Streamlit session (and worker thread) in the process, keyed by base URL
+and a fingerprint of the API key, and closed again once they sit idle.
+"""
+import hashlib
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from openai import OpenAI, DefaultHttpxClient
+
+try:
+    import httpx
+except ImportError:  # Newer openai releases are built on the httpx2 fork
+    import httpx2 as httpx
+
+# --- Connection tuning shared by all pooled clients ---
+MAX_CONNECTIONS = 50  # Per client, i.e. per provider/key
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY_SECONDS = 120.0  # Keep sockets warm between button presses
+CONNECT_TIMEOUT_SECONDS = 10.0
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 600.0  # Overridable per task via `timeout` in prompts.yaml
+CLIENT_MAX_RETRIES = 0  # Retries/backoff are handled by utils.rate_limiter
+CLIENT_IDLE_TTL_SECONDS = 30 * 60  # Close clients nobody has used for 30 minutes
+
+
+def _key_fingerprint(api_key: str) -> str:
+    """Returns a short, non-reversible fingerprint so raw keys are never used as dict keys."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize_base_url(base_url: str) -> str:
+    return (base_url or "").strip().rstrip("/")
+
+
+def _create_client(api_key: str, base_url: str) -> OpenAI:
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(DEFAULT_REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+    )
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        max_retries=CLIENT_MAX_RETRIES,
+    )
+
+
+class ClientPool:
+    """Thread-safe cache of `OpenAI` clients with idle eviction."""
+
+    def __init__(self, idle_ttl_seconds: float = CLIENT_IDLE_TTL_SECONDS):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._clients: Dict[Tuple[str, str], Tuple[OpenAI, float]] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, api_key: str, base_url: str) -> OpenAI:
+        """Returns the pooled client for (base_url, api_key), creating it on first use."""
+        pool_key = (_normalize_base_url(base_url), _key_fingerprint(api_key))
+        now = time.monotonic()
+        with self._lock:
+            expired = self._pop_idle_clients(now)
+            entry = self._clients.get(pool_key)
+            client = entry[0] if entry else _create_client(api_key, base_url)
+            self._clients[pool_key] = (client, now)
+
+        # Close outside the lock; idle clients have no requests in flight
+        # (the TTL is well above the longest request timeout).
+        for idle_client in expired:
+            idle_client.close()
+        return client
+
+    def _pop_idle_clients(self, now: float):
+        expired_keys = [
+            key for key, (_, last_used) in self._clients.items()
+            if now - last_used > self.idle_ttl_seconds
+        ]
+        return [self._clients.pop(key)[0] for key in expired_keys]
+
+    def close_all(self):
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+# A plain module-level instance is process-wide: Streamlit re-executes page scripts on
+# every rerun but imports `utils` modules only once, so this behaves like st.cache_resource
+# while remaining usable from worker threads outside a script-run context.
+_POOL: Optional[ClientPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_client_pool() -> ClientPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ClientPool()
+    return _POOL
+
+
+def get_openai_client(api_key: str, base_url: str) -> OpenAI:
+    """Shortcut for `get_client_pool().get_client(...)`."""
+    return get_client_pool().get_client(api_key, base_url)
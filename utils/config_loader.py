@@ -1,21 +1,32 @@
-import yaml
 import streamlit as st
+from typing import Optional
+from utils.config_store import ConfigSnapshot, get_config_store
+from utils.core import ConfigError
+from utils.prompt_index import SEVERITY_ERROR, PromptIndex, format_issue
+from utils.rate_limiter import configure_rate_limits
 
-PROMPTS_FILE = "prompts.yaml"
+_rate_limits_version = None # Snapshot version the rate limiter was last configured from
 
-@st.cache_data # Cache the loaded YAML data
-def load_yaml_config():
-    """Loads the YAML configuration file."""
+def load_config_snapshot() -> Optional[ConfigSnapshot]:
+    """
+    Returns the current prompts.yaml snapshot, reloading it if the file changed on disk
+    (no server restart needed). Shows an error and returns None if it cannot be read.
+    """
+    global _rate_limits_version
     try:
-        with open(PROMPTS_FILE, "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-        return config
-    except FileNotFoundError:
-        st.error(f"错误：找不到 {PROMPTS_FILE} 文件。请确保该文件存在于项目根目录。")
-        return None
-    except yaml.YAMLError as e:
-        st.error(f"错误：解析 {PROMPTS_FILE} 文件时出错：{e}")
+        snapshot = get_config_store().get()
+    except ConfigError as e:
+        st.error(str(e))
         return None
+    if snapshot.version != _rate_limits_version:
+        configure_rate_limits(snapshot.config.get("available_model_providers"))
+        _rate_limits_version = snapshot.version
+    return snapshot
+
+def load_yaml_config():
+    """Returns the parsed YAML configuration, or None if it cannot be read."""
+    snapshot = load_config_snapshot()
+    return snapshot.config if snapshot else None
 
 def get_provider_configs():
     """Returns the list of available model provider configurations."""
@@ -24,9 +35,43 @@ def get_provider_configs():
         return config["available_model_providers"]
     return []
 
-def get_prompts():
-    """Returns the prompts configuration."""
+def get_prompts() -> PromptIndex:
+    """Returns the prompts configuration, compiled into a PromptIndex (recompiled only when prompts.yaml changes)."""
+    snapshot = load_config_snapshot()
+    if snapshot is None:
+        return PromptIndex()
+    reload_error = get_config_store().last_error
+    if reload_error:
+        st.warning(f"prompts.yaml 的最新修改未能加载，继续使用上一版本（版本 {snapshot.version}）。\n\n{reload_error}")
+    return snapshot.prompts
+
+def show_prompt_validation_report():
+    """Shows the problems `PromptIndex.validate` finds in prompts.yaml (errors prominently, warnings collapsed)."""
+    issues = get_prompts().validate()
+    errors = [issue for issue in issues if issue.severity == SEVERITY_ERROR]
+    warnings = [issue for issue in issues if issue.severity != SEVERITY_ERROR]
+    if errors:
+        st.error("prompts.yaml 校验失败，以下任务在调用时会出错：\n\n" + "\n".join(f"- {format_issue(issue)}" for issue in errors))
+    if warnings:
+        with st.expander(f"⚠️ prompts.yaml 校验提示（{len(warnings)}）", expanded=False):
+            st.markdown("\n".join(f"- {format_issue(issue)}" for issue in warnings))
+
+def get_provider_concurrency_limit(provider_name: str, default: int = 3) -> int:
+    """Returns `max_concurrent_requests` declared for the provider in prompts.yaml, or `default`."""
+    provider = next((p for p in get_provider_configs() if p.get("provider_name") == provider_name), None)
+    if provider and provider.get("max_concurrent_requests"):
+        return max(1, int(provider["max_concurrent_requests"]))
+    return default
+
+def provider_supports_structured_output(provider_name: str) -> bool:
+    """Returns whether the provider declares `structured_output: true` (JSON schema `response_format`) in prompts.yaml."""
+    provider = next((p for p in get_provider_configs() if p.get("provider_name") == provider_name), None)
+    return bool(provider and provider.get("structured_output"))
+
+
+def get_image_preprocessing_settings():
+    """Returns the `image_preprocessing` settings (max_dimension, output_format, quality)."""
     config = load_yaml_config()
-    if config and "prompts" in config:
-        return config["prompts"]
-    return {}
\ No newline at end of file
+    if config and "image_preprocessing" in config:
+        return config["image_preprocessing"] or {}
+    return {}
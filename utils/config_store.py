@@ -0,0 +1,189 @@
+"""
+Hot-reloadable prompts.yaml.
+
+`ConfigStore.get()` returns an immutable `ConfigSnapshot` (the parsed config plus its
+compiled `PromptIndex`). At most once per `CHECK_INTERVAL_SECONDS` it stats the source
+files; when their mtime/size change and the content hash differs, the files are parsed
+again and the new snapshot replaces the old one in a single assignment, so a page run
+always sees one consistent version while other sessions keep running. A file that no
+longer parses keeps the last good snapshot in service and is reported via `last_error`.
+
+Prompts may also be split into one file per task under `prompts/` (e.g.
+`prompts/storyboard_generation.yaml` holding that task's model keys); such a file
+replaces the task of the same name in prompts.yaml.
+
+Parsed configs are stored as JSON in `.cache/` keyed by the sources' hash, so a cold start
+with unchanged files skips YAML parsing entirely. (JSON rather than pickle: loading the
+cache file must never be able to run code.)
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.core import PROMPTS_FILE, ConfigError, parse_yaml_config
+from utils.prompt_index import PromptIndex
+
+PROMPTS_DIR = "prompts" # Optional per-task prompt files: prompts/<task>.yaml
+CONFIG_CACHE_PATH = os.path.join(".cache", "prompts_config.json")
+CHECK_INTERVAL_SECONDS = 1.0 # Source files are stat'ed at most this often
+_CACHE_FORMAT = 1
+
+_Fingerprint = Tuple[Tuple[str, int, int], ...]
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    config: Dict[str, Any]
+    prompts: PromptIndex
+    content_hash: str
+    version: int # Increases by one on every reload
+    loaded_at: float
+
+
+class ConfigStore:
+    """Process-wide holder of the current prompts.yaml snapshot; safe to use from any thread."""
+
+    def __init__(self, path: str = PROMPTS_FILE, prompts_dir: str = PROMPTS_DIR, cache_path: Optional[str] = CONFIG_CACHE_PATH):
+        self.path = path
+        self.prompts_dir = prompts_dir
+        self.cache_path = cache_path
+        self.last_error: Optional[str] = None # Set while the files on disk fail to parse
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._fingerprint: Optional[_Fingerprint] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _source_paths(self) -> List[str]:
+        paths = [self.path]
+        if self.prompts_dir and os.path.isdir(self.prompts_dir):
+            paths += sorted(glob.glob(os.path.join(self.prompts_dir, "*.yaml")) + glob.glob(os.path.join(self.prompts_dir, "*.yml")))
+        return paths
+
+    def _fingerprint_sources(self, paths: List[str]) -> _Fingerprint:
+        entries = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                entries.append((path, -1, -1))
+                continue
+            entries.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(entries)
+
+    def get(self, force: bool = False) -> ConfigSnapshot:
+        """
+        Returns the current snapshot, reloading it first if the files changed.
+
+        Raises ConfigError only if no version of the config could ever be loaded.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and not force and time.monotonic() - self._checked_at < CHECK_INTERVAL_SECONDS:
+            return snapshot
+        with self._lock:
+            self._checked_at = time.monotonic()
+            paths = self._source_paths()
+            fingerprint = self._fingerprint_sources(paths)
+            if self._snapshot is not None and fingerprint == self._fingerprint and not force:
+                return self._snapshot
+            try:
+                self._reload(paths)
+                self.last_error = None
+            except ConfigError as e:
+                self.last_error = str(e)
+                if self._snapshot is None:
+                    raise
+            self._fingerprint = fingerprint
+            return self._snapshot
+
+    def _reload(self, paths: List[str]):
+        sources = []
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    sources.append((path, f.read()))
+            except FileNotFoundError as e:
+                raise ConfigError(f"错误：找不到 {path} 文件。请确保该文件存在于项目根目录。") from e
+        digest = hashlib.sha256()
+        for path, data in sources:
+            digest.update(path.encode("utf-8") + b"\0" + data + b"\0")
+        content_hash = digest.hexdigest()
+        if self._snapshot is not None and self._snapshot.content_hash == content_hash:
+            return # Touched or re-saved without changes
+
+        config = self._read_cache(content_hash)
+        if config is None:
+            config = self._parse(sources)
+            self._write_cache(content_hash, config)
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        self._snapshot = ConfigSnapshot(
+            config=config,
+            prompts=PromptIndex(config.get("prompts") or {}),
+            content_hash=content_hash,
+            version=version,
+            loaded_at=time.time(),
+        )
+
+    def _parse(self, sources: List[Tuple[str, bytes]]) -> Dict[str, Any]:
+        (main_path, main_data), task_files = sources[0], sources[1:]
+        config = parse_yaml_config(main_data.decode("utf-8"), main_path)
+        if task_files:
+            prompts = dict(config.get("prompts") or {})
+            for path, data in task_files:
+                task_name = os.path.splitext(os.path.basename(path))[0]
+                task_prompts = parse_yaml_config(data.decode("utf-8"), path)
+                if task_prompts:
+                    prompts[task_name] = task_prompts
+            config["prompts"] = prompts
+        return config
+
+    def _read_cache(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_path:
+            return None
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (not isinstance(cached, dict) or cached.get("format") != _CACHE_FORMAT
+                or cached.get("content_hash") != content_hash or not isinstance(cached.get("config"), dict)):
+            return None # Another format, other sources or a foreign file: parse the YAML instead
+        return cached["config"]
+
+    def _write_cache(self, content_hash: str, config: Dict[str, Any]):
+        if not self.cache_path:
+            return
+        try:
+            data = json.dumps({"format": _CACHE_FORMAT, "content_hash": content_hash, "config": config}, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return # YAML values JSON cannot hold (e.g. dates)
+        if json.loads(data)["config"] != config:
+            return # e.g. non-string keys, which JSON would turn into strings
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass # The cache only speeds up cold starts
+
+
+_STORE: Optional[ConfigStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_config_store() -> ConfigStore:
+    """Returns the process-wide store for prompts.yaml."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = ConfigStore()
+    return _STORE
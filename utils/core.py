@@ -0,0 +1,525 @@
+"""
+UI-free core: configuration loading, prompt resolution and LLM calls.
+
+Nothing in this module imports Streamlit or renders anything. Every call returns a
+structured result (`PromptResult`, `LLMResult`) describing success or failure, so it
+can run in worker threads, process pools or the headless CLI. The Streamlit pages use
+the thin rendering wrappers in `utils.api_utils` / `utils.config_loader`.
+"""
+import sqlite3
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import yaml
+from openai import APIConnectionError, APITimeoutError, AuthenticationError, BadRequestError, RateLimitError, APIError
+
+from utils.client_pool import get_openai_client
+from utils.metrics import record_llm_call
+from utils.prompt_index import compile_prompts
+from utils.rate_limiter import call_with_retries, estimate_request_tokens, get_rate_limiter_registry, is_quota_exhausted
+from utils.response_cache import get_response_cache, make_cache_key
+
+PROMPTS_FILE = "prompts.yaml"
+
+# --- Error kinds reported in LLMResult.error_kind ---
+ERROR_AUTH = "auth"
+ERROR_TIMEOUT = "timeout"
+ERROR_CONNECTION = "connection"
+ERROR_RATE_LIMIT = "rate_limit"
+ERROR_API = "api_error"
+ERROR_EMPTY_REQUEST = "empty_request"
+ERROR_EMPTY_RESPONSE = "empty_response"
+ERROR_UNKNOWN = "unknown"
+
+
+class ConfigError(Exception):
+    """prompts.yaml is missing or cannot be parsed."""
+
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader) # libyaml's C loader when available
+
+
+def parse_yaml_config(text: str, path: str = PROMPTS_FILE) -> dict:
+    """Parses YAML text with the safe loader, raising ConfigError with a user-facing message."""
+    try:
+        return yaml.load(text, Loader=_YAML_LOADER) or {}
+    except yaml.YAMLError as e:
+        raise ConfigError(f"错误：解析 {path} 文件时出错：{e}") from e
+
+
+def read_yaml_config(path: str = PROMPTS_FILE) -> dict:
+    """Reads and parses the YAML configuration file, raising ConfigError with a user-facing message."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError as e:
+        raise ConfigError(f"错误：找不到 {path} 文件。请确保该文件存在于项目根目录。") from e
+    return parse_yaml_config(text, path)
+
+
+# ---------------------------------------------------------------------------
+# Prompt resolution
+# ---------------------------------------------------------------------------
+
+@dataclass
+class PromptResult:
+    """
+    A resolved prompt for (task, model).
+
+    `user_message_text` is None when the prompt could not be prepared; `error` then says why.
+    `notice` carries non-fatal information (e.g. a fallback prompt was used).
+    """
+    system_message: Optional[str] = None
+    user_message_text: Optional[str] = None
+    parameters: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    notice: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.user_message_text is not None
+
+
+def resolve_prompt(task_name: str, model_name: str, prompts_config, variable_dict: Optional[dict] = None) -> PromptResult:
+    """
+    Retrieves and formats system and user messages for a given task and model.
+
+    Falls back from the model-specific prompt to "default", then to the first prompt
+    defined for the task. `prompts_config` should be a `PromptIndex` (compiled once at
+    load); a plain prompts dict is compiled on the fly.
+    """
+    prompt, notice, error = compile_prompts(prompts_config).lookup(task_name, model_name)
+    if error:
+        return PromptResult(error=error)
+
+    system_message = prompt.system_message
+    parameters = prompt.parameters
+    formatted_user_message_text = prompt.user_message_template
+    if variable_dict:
+        if prompt.template_error:
+            return PromptResult(system_message, None, parameters,
+                                error=f"格式化用户消息时出错：模板格式无效 ({prompt.template_error})。请检查 prompts.yaml。", notice=notice)
+        if prompt.user_message_template.strip():
+            missing = prompt.fields.difference(variable_dict)
+            if missing:
+                return PromptResult(system_message, None, parameters,
+                                    error=f"格式化用户消息时出错：模板中缺少变量 {', '.join(sorted(missing))}。请检查 prompts.yaml 和代码。", notice=notice)
+            try:
+                formatted_user_message_text = prompt.user_message_template.format(**variable_dict)
+            except Exception as e: # e.g. a format spec that does not fit the value
+                return PromptResult(system_message, None, parameters,
+                                    error=f"格式化用户消息时发生未知错误: {e}", notice=notice)
+        else: # Template is empty but vars provided, it's odd
+            notice = f"提示：任务 '{task_name}' 的用户消息模板为空，但提供了变量。变量将不会被使用。"
+            formatted_user_message_text = ""
+
+    return PromptResult(system_message, formatted_user_message_text, parameters, notice=notice)
+
+
+# ---------------------------------------------------------------------------
+# LLM calls
+# ---------------------------------------------------------------------------
+
+@dataclass
+class LLMResult:
+    """Outcome of one chat completion. `error_kind` is None on success."""
+    content: Optional[str] = None
+    model: str = ""
+    task: Optional[str] = None # prompts.yaml task name, for metrics
+    finish_reason: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    latency: float = 0.0 # Seconds from request start to the full response
+    ttft: Optional[float] = None # Seconds to the first streamed token (streaming only)
+    stream_chunks: int = 0
+    cache_hit: bool = False
+    retries: int = 0 # Retries spent on 429s/transient errors
+    aborted: bool = False # Stream closed by the consumer before it finished
+    error_kind: Optional[str] = None
+    error_message: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error_kind is None
+
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason == "length"
+
+    @property
+    def usage(self) -> Dict[str, Optional[int]]:
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens, "total_tokens": self.total_tokens}
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Generation throughput after the first token (streaming) or over the whole call."""
+        # Without provider-reported usage, one streamed content chunk is a close proxy for one token
+        generated_tokens = self.completion_tokens or self.stream_chunks
+        generation_time = self.latency - (self.ttft or 0.0)
+        if not generated_tokens or generation_time <= 0:
+            return None
+        return generated_tokens / generation_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def classify_error(error: BaseException):
+    """Returns (error_kind, user-facing message) for an exception raised while calling the API."""
+    if isinstance(error, AuthenticationError):
+        return ERROR_AUTH, "API 认证失败：请检查您的 API Key 是否正确且有效。"
+    if isinstance(error, APITimeoutError):
+        return ERROR_TIMEOUT, "API 请求超时：模型响应时间过长。可在 prompts.yaml 中调大该任务的 timeout 参数后重试。"
+    if isinstance(error, APIConnectionError):
+        return ERROR_CONNECTION, "API 连接错误：无法连接到指定的 Base URL。请检查网络连接和 Base URL 是否正确。"
+    if is_quota_exhausted(error):
+        return ERROR_RATE_LIMIT, "API 账户额度已用尽：请检查您的账户余额或用量限制。"
+    if isinstance(error, RateLimitError):
+        return ERROR_RATE_LIMIT, "API 请求频率超限：多次重试后仍被限流。请稍后再试，或在 prompts.yaml 中调低该提供商的 rate_limits。"
+    if isinstance(error, APIError):
+        return ERROR_API, f"API 返回错误：{error}"
+    return ERROR_UNKNOWN, f"调用 API 时发生未知错误：{error}"
+
+
+def is_likely_multimodal(model: str) -> bool:
+    """Basic check for image input support, can be improved."""
+    return "gpt-4o" in model or "vision" in model or "gpt-4-turbo" in model
+
+
+def build_messages(
+    system_message: Optional[str],
+    user_message_text: Optional[str],
+    image_data_base64: Optional[str] = None,
+    image_media_type: str = "image/jpeg"
+) -> Optional[List[Dict[str, Any]]]:
+    """Builds the chat messages list (system + text/image user message), or None if the user message is empty."""
+    messages: List[Dict[str, Any]] = []
+    if system_message:
+        messages.append({"role": "system", "content": system_message})
+
+    # Construct user message content (text + optional image)
+    user_content_parts: List[Dict[str, Any]] = []
+    if user_message_text:
+        user_content_parts.append({"type": "text", "text": user_message_text})
+    if image_data_base64:
+        user_content_parts.append({
+            "type": "image_url",
+            "image_url": {"url": f"data:{image_media_type};base64,{image_data_base64}"}
+        })
+
+    if not user_content_parts: # If no text and no image
+        return None
+    messages.append({"role": "user", "content": user_content_parts})
+    return messages
+
+
+def _response_cache_key(cache_ttl_hours, base_url, model, system_message, user_message_text,
+                        image_data_base64, temperature, max_tokens, response_format=None) -> Optional[str]:
+    """Returns the response-cache key for a request, or None if caching is not enabled for it."""
+    if not cache_ttl_hours:
+        return None
+    params = {"temperature": temperature, "max_tokens": max_tokens}
+    if response_format: # Only added when set, so existing cache entries stay valid
+        params["response_format"] = response_format
+    return make_cache_key(base_url, model, system_message, user_message_text, image_data_base64, params)
+
+
+def _read_cached_response(cache_key: Optional[str]) -> Optional[str]:
+    if cache_key is None:
+        return None
+    try:
+        return get_response_cache().get(cache_key)
+    except (sqlite3.Error, OSError): # A broken cache must never block generation
+        return None
+
+
+def _store_cached_response(cache_key: Optional[str], response_content: Optional[str], cache_ttl_hours: Optional[float]):
+    if cache_key is None or not response_content:
+        return
+    try:
+        get_response_cache().set(cache_key, response_content, float(cache_ttl_hours) * 3600)
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def _request_options(timeout: Optional[float], response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # Passing timeout=None to the client would disable the timeout, so only pass it when set
+    options: Dict[str, Any] = {"timeout": timeout} if timeout is not None else {}
+    if response_format: # Providers without structured output may reject the parameter, so omit it by default
+        options["response_format"] = response_format
+    return options
+
+
+# Base URLs whose API rejected `stream_options`; their streams are opened without usage reporting
+_STREAM_USAGE_UNSUPPORTED: Set[str] = set()
+
+
+def _stream_options(base_url: str) -> Dict[str, Any]:
+    """Asks for a final usage chunk, so streamed calls report their token counts like non-streamed ones."""
+    return {} if base_url in _STREAM_USAGE_UNSUPPORTED else {"stream_options": {"include_usage": True}}
+
+
+def _rejects_stream_options(error: BaseException) -> bool:
+    return isinstance(error, BadRequestError) and "stream_options" in str(error)
+
+
+# (base URL, model) pairs whose API rejected `response_format` (e.g. older models on a provider
+# that supports JSON schemas); their requests are sent without it and answered in Markdown
+_RESPONSE_FORMAT_UNSUPPORTED: Set[Tuple[str, str]] = set()
+
+
+def _supported_response_format(base_url: str, model: str, response_format: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return None if (base_url, model) in _RESPONSE_FORMAT_UNSUPPORTED else response_format
+
+
+def _rejects_response_format(error: BaseException, base_url: str, model: str) -> bool:
+    """True (and remembered for the pair) if a 400 rejected the request's `response_format`."""
+    message = str(error)
+    if isinstance(error, BadRequestError) and ("response_format" in message or "json_schema" in message):
+        _RESPONSE_FORMAT_UNSUPPORTED.add((base_url, model))
+        return True
+    return False
+
+
+def prepare_request(base_url, model, system_message, user_message_text, image_data_base64,
+                    image_media_type, temperature, max_tokens, cache_ttl_hours, task_name=None, response_format=None):
+    """
+    Shared first step of every call path: returns (result, messages, cache_key).
+
+    `messages` is None when no request needs to be sent, i.e. the user message is empty
+    (result carries the error) or the response was served from the cache (result is final).
+    """
+    result = LLMResult(model=model, task=task_name)
+    messages = build_messages(system_message, user_message_text, image_data_base64, image_media_type)
+    if messages is None:
+        result.error_kind = ERROR_EMPTY_REQUEST
+        result.error_message = "错误：用户消息文本和图像数据均为空，无法构造用户消息。"
+        return result, None, None
+
+    cache_key = _response_cache_key(cache_ttl_hours, base_url, model, system_message, user_message_text,
+                                    image_data_base64, temperature, max_tokens, response_format)
+    cached_response = _read_cached_response(cache_key)
+    if cached_response is not None:
+        result.content = cached_response
+        result.cache_hit = True
+        return result, None, cache_key
+    return result, messages, cache_key
+
+
+def apply_completion_response(result: LLMResult, chat_completion_response):
+    """Copies content, finish_reason and usage from a (non-streaming) completion response."""
+    choice = chat_completion_response.choices[0]
+    result.content = choice.message.content
+    result.finish_reason = choice.finish_reason
+    if getattr(chat_completion_response, "usage", None):
+        result.prompt_tokens = chat_completion_response.usage.prompt_tokens
+        result.completion_tokens = chat_completion_response.usage.completion_tokens
+        result.total_tokens = chat_completion_response.usage.total_tokens
+
+
+def finish_result(result: LLMResult, base_url: str, cache_key: Optional[str], cache_ttl_hours: Optional[float]):
+    """Last step of every call path: flags empty responses, caches good ones and records metrics."""
+    if result.ok and not result.content and not result.aborted:
+        result.error_kind, result.error_message = ERROR_EMPTY_RESPONSE, "AI 未返回有效内容。"
+    # Never cache truncated output or a stream that was stopped part-way
+    if result.ok and not result.truncated and not result.aborted and not result.cache_hit:
+        _store_cached_response(cache_key, result.content, cache_ttl_hours)
+    record_llm_call(result, base_url)
+
+
+def chat_completion(
+    api_key: str,
+    base_url: str,
+    model: str,
+    system_message: Optional[str],
+    user_message_text: Optional[str],
+    image_data_base64: Optional[str] = None,
+    image_media_type: str = "image/jpeg",
+    temperature: float = 1,
+    max_tokens: int = 5000,
+    timeout: Optional[float] = None,
+    cache_ttl_hours: Optional[float] = None,
+    task_name: Optional[str] = None,
+    response_format: Optional[Dict[str, Any]] = None
+) -> LLMResult:
+    """
+    Calls an OpenAI-compatible chat completions API and returns an LLMResult. Never raises.
+
+    Args:
+        api_key (str): The API key.
+        base_url (str): The base URL for the API.
+        model (str): The model name to use (should be a multimodal model if image data is provided).
+        system_message (Optional[str]): The system message content.
+        user_message_text (Optional[str]): The text part of the user message.
+        image_data_base64 (Optional[str]): Base64 encoded image data.
+        image_media_type (str): The media type of the image (e.g., "image/jpeg").
+        temperature (float): Sampling temperature.
+        max_tokens (int): Maximum tokens to generate.
+        timeout (Optional[float]): Request timeout in seconds; the pooled client's default is used if None.
+        cache_ttl_hours (Optional[float]): If set, the local response cache is consulted first and
+            new (non-truncated) responses are cached for this many hours.
+        task_name (Optional[str]): The prompts.yaml task, used to label the call's metrics.
+        response_format (Optional[dict]): Sent as the `response_format` request parameter (e.g. a JSON
+            schema from `utils.structured_output`); only for providers that support it. If the
+            model rejects it (HTTP 400), the request is sent once more without it and the
+            (base URL, model) pair is remembered, so the reply may be plain text.
+    """
+    result, messages, cache_key = prepare_request(
+        base_url, model, system_message, user_message_text, image_data_base64, image_media_type,
+        temperature, max_tokens, cache_ttl_hours, task_name, response_format
+    )
+    if messages is None:
+        finish_result(result, base_url, cache_key, cache_ttl_hours)
+        return result
+
+    limiter = get_rate_limiter_registry().limiter(base_url, model)
+    estimated_tokens = estimate_request_tokens(messages, max_tokens)
+    started_at = time.perf_counter()
+
+    def send(request_format):
+        return call_with_retries(
+            lambda: client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **_request_options(timeout, request_format)
+            ),
+            limiter, estimated_tokens, get_rate_limiter_registry().retry_policy(base_url)
+        )
+
+    try:
+        client = get_openai_client(api_key, base_url) # Pooled, keep-alive client shared across sessions
+        request_format = _supported_response_format(base_url, model, response_format)
+        try:
+            chat_completion_response, result.retries = send(request_format)
+        except BadRequestError as e:
+            if not request_format or not _rejects_response_format(e, base_url, model):
+                raise
+            chat_completion_response, result.retries = send(None) # Retried once; callers fall back to Markdown parsing
+        apply_completion_response(result, chat_completion_response)
+        limiter.settle(estimated_tokens, result.total_tokens)
+    except Exception as e:
+        result.error_kind, result.error_message = classify_error(e)
+    result.latency = time.perf_counter() - started_at
+    finish_result(result, base_url, cache_key, cache_ttl_hours)
+    return result
+
+
+class ChatStream:
+    """
+    Streaming chat completion: iterate to receive content deltas as they arrive.
+
+    `result` (an LLMResult) is filled in while streaming and is complete once iteration
+    ends; `result.content` then holds the full text. Calling `close()` early (e.g. when
+    a Streamlit rerun interrupts the page) closes the HTTP stream so the provider stops
+    generating, and marks the result as aborted. Takes the same arguments as `chat_completion`.
+    """
+
+    def __init__(self, api_key: str, base_url: str, model: str, system_message: Optional[str],
+                 user_message_text: Optional[str], image_data_base64: Optional[str] = None,
+                 image_media_type: str = "image/jpeg", temperature: float = 1, max_tokens: int = 5000,
+                 timeout: Optional[float] = None, cache_ttl_hours: Optional[float] = None,
+                 task_name: Optional[str] = None):
+        self.result = LLMResult(model=model, task=task_name)
+        self._request = dict(
+            api_key=api_key, base_url=base_url, model=model, system_message=system_message,
+            user_message_text=user_message_text, image_data_base64=image_data_base64,
+            image_media_type=image_media_type, temperature=temperature, max_tokens=max_tokens,
+            timeout=timeout, cache_ttl_hours=cache_ttl_hours, task_name=task_name
+        )
+        self._generator = self._stream()
+
+    def __iter__(self) -> Iterator[str]:
+        return self._generator
+
+    def __next__(self) -> str:
+        return next(self._generator)
+
+    def close(self):
+        self._generator.close()
+
+    def _stream(self) -> Iterator[str]:
+        request = self._request
+        result, messages, cache_key = prepare_request(
+            request["base_url"], request["model"], request["system_message"], request["user_message_text"],
+            request["image_data_base64"], request["image_media_type"], request["temperature"],
+            request["max_tokens"], request["cache_ttl_hours"], request["task_name"]
+        )
+        self.result = result
+        if messages is None:
+            finish_result(result, request["base_url"], cache_key, request["cache_ttl_hours"])
+            if result.cache_hit:
+                result.ttft = 0.0
+                result.stream_chunks = 1
+                yield result.content
+            return
+
+        limiter = get_rate_limiter_registry().limiter(request["base_url"], request["model"])
+        estimated_tokens = estimate_request_tokens(messages, request["max_tokens"])
+        started_at = time.perf_counter()
+        response_stream = None
+        finished = False
+        streamed_parts: List[str] = []
+        try:
+            client = get_openai_client(request["api_key"], request["base_url"])
+
+            def open_stream():
+                # Only opening the stream is retried; an error after text has been shown is reported as is
+                return call_with_retries(
+                    lambda: client.chat.completions.create(
+                        messages=messages,
+                        model=request["model"],
+                        temperature=request["temperature"],
+                        max_tokens=request["max_tokens"],
+                        stream=True,
+                        **_request_options(request["timeout"]),
+                        **_stream_options(request["base_url"])
+                    ),
+                    limiter, estimated_tokens, get_rate_limiter_registry().retry_policy(request["base_url"])
+                )
+
+            try:
+                response_stream, result.retries = open_stream()
+            except BadRequestError as e:
+                if not _rejects_stream_options(e) or request["base_url"] in _STREAM_USAGE_UNSUPPORTED:
+                    raise
+                _STREAM_USAGE_UNSUPPORTED.add(request["base_url"]) # Remembered for the process; retried once without it
+                response_stream, result.retries = open_stream()
+            for chunk in response_stream:
+                if getattr(chunk, "usage", None): # The final chunk, requested via stream_options
+                    result.prompt_tokens = chunk.usage.prompt_tokens
+                    result.completion_tokens = chunk.usage.completion_tokens
+                    result.total_tokens = chunk.usage.total_tokens
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    result.finish_reason = choice.finish_reason
+                delta_text = choice.delta.content if choice.delta else None
+                if delta_text:
+                    if result.ttft is None:
+                        result.ttft = time.perf_counter() - started_at
+                    result.stream_chunks += 1
+                    streamed_parts.append(delta_text)
+                    yield delta_text
+            finished = True
+        except Exception as e:
+            finished = True
+            result.error_kind, result.error_message = classify_error(e)
+        finally:
+            result.aborted = not finished
+            if response_stream is not None:
+                response_stream.close()
+            result.latency = time.perf_counter() - started_at
+            result.content = "".join(streamed_parts)
+            if response_stream is not None:
+                limiter.settle(estimated_tokens, result.total_tokens)
+            # Also runs when the consumer closes the stream early, so stopped calls are recorded too
+            finish_result(result, request["base_url"], cache_key, request["cache_ttl_hours"])
@@ -0,0 +1,137 @@
+"""
+Image preprocessing for multimodal requests.
+
+Reference images (often 5-12 MB phone photos) are downsized to a configurable maximum
+dimension and re-encoded before being base64-encoded for the API. Results are memoized
+by upload id / content hash, so Streamlit reruns do not repeat the work.
+"""
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow missing: images are sent unmodified
+    Image = None
+    ImageOps = None
+
+DEFAULT_IMAGE_SETTINGS = {
+    "max_dimension": 1536, # Longest edge in pixels; vision models downscale larger images anyway
+    "output_format": "JPEG", # JPEG, WEBP or PNG
+    "quality": 85, # JPEG/WEBP quality
+}
+MAX_MEMOIZED_IMAGES = 128
+
+_MEDIA_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+_memo: "OrderedDict[Tuple, Tuple[str, str]]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _resolve_settings(settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    resolved = dict(DEFAULT_IMAGE_SETTINGS)
+    if settings:
+        resolved.update({k: v for k, v in settings.items() if v is not None})
+    resolved["output_format"] = str(resolved["output_format"]).upper().replace("JPG", "JPEG")
+    if resolved["output_format"] not in _MEDIA_TYPES:
+        resolved["output_format"] = DEFAULT_IMAGE_SETTINGS["output_format"]
+    return resolved
+
+
+def _memo_key(content_id: str, media_type: str, resolved_settings: Dict[str, Any]) -> Tuple:
+    return (content_id, media_type, tuple(sorted(resolved_settings.items())))
+
+
+def _memo_get(memo_key: Tuple) -> Optional[Tuple[str, str]]:
+    with _memo_lock:
+        if memo_key in _memo:
+            _memo.move_to_end(memo_key)
+            return _memo[memo_key]
+    return None
+
+
+def _downsize_and_encode(image_bytes: bytes, media_type: str, settings: Dict[str, Any]) -> Tuple[bytes, str]:
+    """Returns (image bytes, media type) after resizing/re-encoding; the original is kept when that is smaller."""
+    if Image is None:
+        return image_bytes, media_type
+
+    with Image.open(io.BytesIO(image_bytes)) as source_image:
+        source_format = source_image.format
+        image = ImageOps.exif_transpose(source_image) # Phone photos store their rotation in EXIF
+        max_dimension = int(settings["max_dimension"])
+        needs_resize = max(image.size) > max_dimension
+        output_format = settings["output_format"]
+
+        if not needs_resize and source_format == output_format:
+            return image_bytes, media_type
+
+        if needs_resize:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        if output_format == "JPEG" and image.mode != "RGB":
+            # JPEG has no alpha channel: flatten onto white
+            rgba_image = image.convert("RGBA")
+            background = Image.new("RGB", rgba_image.size, (255, 255, 255))
+            background.paste(rgba_image, mask=rgba_image.getchannel("A"))
+            image = background
+
+        buffer = io.BytesIO()
+        save_options = {"optimize": True}
+        if output_format in ("JPEG", "WEBP"):
+            save_options["quality"] = int(settings["quality"])
+        image.save(buffer, format=output_format, **save_options)
+
+    encoded_bytes = buffer.getvalue()
+    if not needs_resize and len(encoded_bytes) >= len(image_bytes):
+        return image_bytes, media_type
+    return encoded_bytes, _MEDIA_TYPES[output_format]
+
+
+def prepare_image_for_upload(
+    image_bytes: bytes,
+    media_type: str,
+    settings: Optional[Dict[str, Any]] = None,
+    cache_id: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Downsizes/re-encodes an image and returns (base64 data, media type) ready for the API.
+
+    Args:
+        image_bytes (bytes): The original image file content.
+        media_type (str): The original media type (e.g. "image/png").
+        settings (dict, optional): Overrides for `DEFAULT_IMAGE_SETTINGS`.
+        cache_id (str, optional): A cheap unique id for the content (e.g. a Streamlit upload's
+            file_id); if omitted the content hash is used as the memoization key.
+    """
+    resolved_settings = _resolve_settings(settings)
+    content_id = cache_id or hashlib.sha256(image_bytes).hexdigest()
+    memo_key = _memo_key(content_id, media_type, resolved_settings)
+    memoized = _memo_get(memo_key)
+    if memoized is not None:
+        return memoized
+
+    try:
+        processed_bytes, processed_media_type = _downsize_and_encode(image_bytes, media_type, resolved_settings)
+    except Exception: # Unreadable/unsupported by Pillow: let the provider decide
+        processed_bytes, processed_media_type = image_bytes, media_type
+    result = (base64.b64encode(processed_bytes).decode("utf-8"), processed_media_type)
+
+    with _memo_lock:
+        _memo[memo_key] = result
+        while len(_memo) > MAX_MEMOIZED_IMAGES:
+            _memo.popitem(last=False)
+    return result
+
+
+def prepare_uploaded_image(uploaded_file, settings: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+    """`prepare_image_for_upload` for a Streamlit `UploadedFile` (memoized by its upload id)."""
+    cache_id = getattr(uploaded_file, "file_id", None)
+    if cache_id is not None:
+        # Skip even copying the upload's bytes on reruns
+        memoized = _memo_get(_memo_key(cache_id, uploaded_file.type, _resolve_settings(settings)))
+        if memoized is not None:
+            return memoized
+    return prepare_image_for_upload(uploaded_file.getvalue(), uploaded_file.type, settings, cache_id=cache_id)
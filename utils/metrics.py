@@ -0,0 +1,267 @@
+"""
+Per-call LLM metrics: latency, time to first token, token usage, cache hits and errors.
+
+Every finished call (`utils.core`, `utils.async_core`) is appended to a local SQLite
+store, tagged with the prompts.yaml task, model and provider. The metrics page
+(pages/07) summarises it per task, and `render_prometheus` / `write_prometheus_textfile`
+export the same summary in the Prometheus text exposition format (e.g. for the
+node_exporter textfile collector).
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+METRICS_DB_PATH = os.path.join(".cache", "llm_metrics.sqlite3")
+PROMETHEUS_TEXTFILE_PATH = os.path.join(".cache", "llm_metrics.prom")
+MAX_METRIC_RECORDS = 50000 # Oldest calls are pruned beyond this
+_PRUNE_EVERY = 500
+UNKNOWN_TASK = "unknown"
+ABORTED_KIND = "aborted" # Recorded as the error kind of streams closed before they finished
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+@dataclass
+class CallRecord:
+    timestamp: float
+    task: str
+    model: str
+    provider: str
+    latency: float
+    ttft: Optional[float]
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    cache_hit: bool
+    error_kind: Optional[str]
+    retries: int = 0
+
+
+def provider_label(base_url: str) -> str:
+    """Short provider name for metrics: the base URL's host (e.g. "api.openai.com")."""
+    parsed = urlparse(base_url or "")
+    return parsed.netloc or (base_url or "").strip().rstrip("/") or "unknown"
+
+
+class MetricsStore:
+    """Thread-safe, append-mostly SQLite store of CallRecords."""
+
+    def __init__(self, db_path: str = METRICS_DB_PATH, max_records: int = MAX_METRIC_RECORDS):
+        self.db_path = db_path
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._inserts_since_prune = 0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp REAL NOT NULL,
+                task TEXT NOT NULL,
+                model TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                latency REAL NOT NULL,
+                ttft REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                cache_hit INTEGER NOT NULL,
+                error_kind TEXT,
+                retries INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_timestamp ON calls (timestamp)")
+
+    def record(self, call: CallRecord):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO calls (timestamp, task, model, provider, latency, ttft, prompt_tokens, completion_tokens, cache_hit, error_kind, retries)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (call.timestamp, call.task, call.model, call.provider, call.latency, call.ttft, call.prompt_tokens,
+                 call.completion_tokens, int(call.cache_hit), call.error_kind, call.retries)
+            )
+            self._inserts_since_prune += 1
+            if self._inserts_since_prune >= _PRUNE_EVERY:
+                self._inserts_since_prune = 0
+                self._conn.execute(
+                    "DELETE FROM calls WHERE id <= (SELECT MAX(id) FROM calls) - ?", (self.max_records,)
+                )
+
+    def records(self, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Returns the recorded calls (oldest first), optionally only those after the `since` timestamp."""
+        query = "SELECT timestamp, task, model, provider, latency, ttft, prompt_tokens, completion_tokens, cache_hit, error_kind, retries FROM calls"
+        params: tuple = ()
+        if since is not None:
+            query += " WHERE timestamp >= ?"
+            params = (since,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        fields = list(CallRecord.__dataclass_fields__)
+        records = [dict(zip(fields, row)) for row in rows]
+        for record in records:
+            record["cache_hit"] = bool(record["cache_hit"])
+        return records
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM calls")
+
+
+_STORE: Optional[MetricsStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_metrics_store() -> MetricsStore:
+    """Returns the process-wide metrics store, opening the database on first use."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = MetricsStore()
+    return _STORE
+
+
+def record_llm_call(result, base_url: str):
+    """Records a finished `utils.core.LLMResult`. Metrics must never break a generation, so errors are swallowed."""
+    try:
+        get_metrics_store().record(CallRecord(
+            timestamp=time.time(),
+            task=result.task or UNKNOWN_TASK,
+            model=result.model,
+            provider=provider_label(base_url),
+            latency=result.latency,
+            ttft=result.ttft,
+            prompt_tokens=result.prompt_tokens,
+            completion_tokens=result.completion_tokens,
+            cache_hit=result.cache_hit,
+            # A stopped stream's partial latency must not count as a completed call
+            error_kind=result.error_kind or (ABORTED_KIND if getattr(result, "aborted", False) else None),
+            retries=result.retries,
+        ))
+    except (sqlite3.Error, OSError):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Aggregation and export
+# ---------------------------------------------------------------------------
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile (q in [0, 1]) of the values, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower, upper = math.floor(position), math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(records: Iterable[Dict[str, Any]], group_by: str = "task") -> List[Dict[str, Any]]:
+    """
+    Aggregates call records per `group_by` value (task, model or provider).
+
+    Latency/TTFT percentiles only include calls that reached the API (cache hits and
+    failures are counted separately), so they describe real model performance.
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        groups.setdefault(record[group_by], []).append(record)
+
+    summaries = []
+    for key, group in sorted(groups.items()):
+        api_calls = [r for r in group if not r["cache_hit"] and not r["error_kind"]]
+        latencies = [r["latency"] for r in api_calls]
+        ttfts = [r["ttft"] for r in api_calls if r["ttft"] is not None]
+        summary = {
+            group_by: key,
+            "calls": len(group),
+            "errors": sum(1 for r in group if r["error_kind"]),
+            "cache_hits": sum(1 for r in group if r["cache_hit"]),
+            "retries": sum(r["retries"] or 0 for r in group),
+            "prompt_tokens": sum(r["prompt_tokens"] or 0 for r in group),
+            "completion_tokens": sum(r["completion_tokens"] or 0 for r in group),
+            "latency_sum": sum(latencies),
+        }
+        for q in PERCENTILES:
+            summary[f"latency_p{int(q * 100)}"] = percentile(latencies, q)
+            summary[f"ttft_p{int(q * 100)}"] = percentile(ttfts, q)
+        summaries.append(summary)
+    return summaries
+
+
+def _label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_prometheus(records: Iterable[Dict[str, Any]]) -> str:
+    """Renders per-(task, model, provider) counters and latency quantiles in the Prometheus text format."""
+    records = list(records)
+    series: Dict[tuple, List[Dict[str, Any]]] = {}
+    for record in records:
+        series.setdefault((record["task"], record["model"], record["provider"]), []).append(record)
+
+    metric_lines = {
+        "llm_requests_total": ("counter", "LLM calls, including cache hits and failures."),
+        "llm_request_errors_total": ("counter", "LLM calls that failed, by error kind."),
+        "llm_cache_hits_total": ("counter", "LLM calls answered from the local response cache."),
+        "llm_retries_total": ("counter", "Retries spent on rate limits and transient errors."),
+        "llm_prompt_tokens_total": ("counter", "Prompt tokens reported by the provider."),
+        "llm_completion_tokens_total": ("counter", "Completion tokens reported by the provider."),
+        "llm_request_latency_seconds": ("summary", "Latency of successful API calls."),
+        "llm_time_to_first_token_seconds": ("summary", "Time to first streamed token of successful API calls."),
+    }
+    samples: Dict[str, List[str]] = {name: [] for name in metric_lines}
+    for (task, model, provider), group in sorted(series.items()):
+        labels = f'task="{_label_value(task)}",model="{_label_value(model)}",provider="{_label_value(provider)}"'
+        summary = summarize(group)[0]
+        samples["llm_requests_total"].append(f"llm_requests_total{{{labels}}} {summary['calls']}")
+        error_kinds: Dict[str, int] = {}
+        for record in group:
+            if record["error_kind"]:
+                error_kinds[record["error_kind"]] = error_kinds.get(record["error_kind"], 0) + 1
+        for error_kind, count in sorted(error_kinds.items()):
+            samples["llm_request_errors_total"].append(
+                f'llm_request_errors_total{{{labels},error_kind="{_label_value(error_kind)}"}} {count}')
+        samples["llm_cache_hits_total"].append(f"llm_cache_hits_total{{{labels}}} {summary['cache_hits']}")
+        samples["llm_retries_total"].append(f"llm_retries_total{{{labels}}} {summary['retries']}")
+        samples["llm_prompt_tokens_total"].append(f"llm_prompt_tokens_total{{{labels}}} {summary['prompt_tokens']}")
+        samples["llm_completion_tokens_total"].append(f"llm_completion_tokens_total{{{labels}}} {summary['completion_tokens']}")
+
+        api_calls = [r for r in group if not r["cache_hit"] and not r["error_kind"]]
+        for metric_name, prefix, values in (
+            ("llm_request_latency_seconds", "latency", [r["latency"] for r in api_calls]),
+            ("llm_time_to_first_token_seconds", "ttft", [r["ttft"] for r in api_calls if r["ttft"] is not None]),
+        ):
+            for q in PERCENTILES:
+                value = summary[f"{prefix}_p{int(q * 100)}"]
+                if value is not None:
+                    samples[metric_name].append(f'{metric_name}{{{labels},quantile="{q}"}} {value:.6f}')
+            samples[metric_name].append(f"{metric_name}_sum{{{labels}}} {sum(values):.6f}")
+            samples[metric_name].append(f"{metric_name}_count{{{labels}}} {len(values)}")
+
+    lines = []
+    for name, (metric_type, help_text) in metric_lines.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(samples[name])
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path: str = PROMETHEUS_TEXTFILE_PATH, since: Optional[float] = None) -> str:
+    """Writes `render_prometheus` for the stored calls to `path` atomically and returns the path."""
+    text = render_prometheus(get_metrics_store().records(since=since))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path) # Scrapers must never read a half-written file
+    return path
@@ -1,73 +1,162 @@
+import re
+from typing import Dict, List, Optional
+
 import pandas as pd
-import io
-import streamlit as st # For potential error messages or logging
+
+# A header/body separator row such as "|---|:---:|" or "--- | ---"
+_SEPARATOR_LINE = re.compile(r"^\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?$")
+_UNESCAPED_PIPE = re.compile(r"(?<!\\)\|")
+
+
+def split_table_row(stripped_line: str) -> List[str]:
+    """
+    Splits one Markdown table row into stripped cells.
+
+    The outer pipes are optional and `\\|` inside a cell is an escaped pipe, returned as `|`.
+    """
+    if "\\|" not in stripped_line:
+        if stripped_line.startswith("|"):
+            stripped_line = stripped_line[1:]
+        if stripped_line.endswith("|"):
+            stripped_line = stripped_line[:-1]
+        return [cell.strip() for cell in stripped_line.split("|")]
+
+    if stripped_line.startswith("|"):
+        stripped_line = stripped_line[1:]
+    if stripped_line.endswith("|") and not stripped_line.endswith("\\|"):
+        stripped_line = stripped_line[:-1]
+    return [cell.strip().replace("\\|", "|") for cell in _UNESCAPED_PIPE.split(stripped_line)]
+
+
+def _unique_column_names(header: List[str]) -> List[str]:
+    """Keeps header names, suffixing duplicates (".1", ".2", ...) like pandas.read_csv does."""
+    seen: Dict[str, int] = {}
+    names = []
+    for name in header:
+        if name in seen:
+            seen[name] += 1
+            names.append(f"{name}.{seen[name]}")
+        else:
+            seen[name] = 0
+            names.append(name)
+    return names
+
+
+class IncrementalTableParser:
+    """
+    Parses the Markdown table in an LLM response, incrementally.
+
+    `feed` takes the text as it arrives (e.g. stream chunks) and returns the rows
+    completed by it: a row is complete as soon as its line ends. `close` flushes the
+    last, unterminated line. Parsing rules:
+    * Text before and after the table (explanations, code fences) is ignored. Rows that
+      repeat the header (a table continued after some text) are skipped.
+    * Outer pipes are optional (a line without them starts a table only if a separator
+      row follows); escaped pipes (`\\|`) stay inside their cell.
+    * Ragged rows are kept: missing cells are filled with "", surplus cells are joined
+      (with " | ") into the last column.
+    """
+
+    def __init__(self):
+        self.header: Optional[List[str]] = None
+        self.rows: List[List[str]] = []
+        self._buffer = "" # Unterminated last line
+        self._in_table = False
+        self._pending_line: Optional[str] = None # Line without outer pipes that may be a header (needs a separator next)
+
+    def feed(self, text: str) -> List[List[str]]:
+        if "\n" not in text:
+            self._buffer += text
+            return []
+        complete, _, self._buffer = (self._buffer + text).rpartition("\n")
+        return self._consume(complete.splitlines())
+
+    def close(self) -> List[List[str]]:
+        rest, self._buffer = self._buffer, ""
+        return self._consume(rest.splitlines())
+
+    def _consume(self, lines: List[str]) -> List[List[str]]:
+        """Single pass over complete lines; state lives in locals and is written back at the end."""
+        header = self.header
+        column_count = len(header) if header is not None else 0
+        in_table = self._in_table
+        pending_line = self._pending_line
+        new_rows: List[List[str]] = []
+        strip = str.strip
+        is_separator = _SEPARATOR_LINE.match # Bound once: called for every line
+
+        for line in lines:
+            stripped = line.strip()
+            if "|" not in stripped: # Blank line or prose: the table (if any) has ended
+                if header is not None and stripped.startswith("-") and is_separator(stripped): # Single-column separator ("---")
+                    in_table = True
+                else:
+                    in_table = False
+                    pending_line = None
+                continue
+            if is_separator(stripped):
+                if header is None and pending_line is not None:
+                    header = split_table_row(pending_line)
+                    column_count = len(header)
+                pending_line = None
+                in_table = header is not None
+                continue
+            if not in_table and not stripped.startswith("|"):
+                pending_line = stripped
+                continue
+            pending_line = None
+
+            if stripped[-1] == "|" and stripped[0] == "|" and "\\|" not in stripped and len(stripped) > 1:
+                cells = list(map(strip, stripped[1:-1].split("|"))) # Fast path for the usual row
+            else:
+                cells = split_table_row(stripped)
+            if header is None:
+                header = cells
+                column_count = len(header)
+                in_table = True
+                continue
+            in_table = True
+            if len(cells) != column_count:
+                if cells == header:
+                    continue
+                if len(cells) < column_count: # Ragged row: pad missing cells
+                    cells += [""] * (column_count - len(cells))
+                else: # Surplus cells (e.g. an unescaped pipe) belong to the last column
+                    cells[column_count - 1:] = [" | ".join(cells[column_count - 1:])]
+            elif cells == header:
+                continue # Header repeated, e.g. when the table continues after some text
+            new_rows.append(cells)
+
+        self.header = header
+        self._in_table = in_table
+        self._pending_line = pending_line
+        self.rows.extend(new_rows)
+        return new_rows
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """The rows so far as a DataFrame (all cells are strings); empty if no table was found."""
+        if self.header is None:
+            return pd.DataFrame()
+        names = _unique_column_names(self.header)
+        if not self.rows:
+            return pd.DataFrame(columns=names)
+        columns = list(zip(*self.rows)) # Transpose into one array per column
+        return pd.DataFrame({name: list(column) for name, column in zip(names, columns)}, columns=names)
+
 
 def parse_markdown_table_to_df(markdown_table_string: str):
     """
-    Parses a Markdown table string into a Pandas DataFrame.
-    Assumes the table has a header row and uses '|' delimiters.
-    Handles potential empty lines or lines that are not part of the table.
+    Parses the Markdown table in an LLM response into a DataFrame (all cells are strings).
+
+    See `IncrementalTableParser` for the rules. Returns an empty DataFrame if no table is
+    found, and one with only columns if the table has no rows.
     """
     if not markdown_table_string or not markdown_table_string.strip():
         return pd.DataFrame()
-
-    lines = markdown_table_string.strip().split('\n')
-    
-    # Filter out lines that are not part of a typical markdown table structure
-    # (e.g., separator lines like |---|---|)
-    # and lines that don't contain the pipe character.
-    table_lines = [line for line in lines if line.strip().startswith('|') and line.strip().endswith('|')]
-
-    if not table_lines:
-        # Fallback or attempt to read if it's a simple CSV-like structure within markdown
-        try:
-            # Try to read as if it's a CSV embedded in markdown, stripping pipes
-            csv_like_lines = []
-            for line in lines:
-                if '|' in line: # A bit more lenient
-                    cleaned_line = ",".join([cell.strip() for cell in line.strip().strip('|').split('|')])
-                    csv_like_lines.append(cleaned_line)
-            
-            if csv_like_lines:
-                # The first valid line is likely the header
-                df = pd.read_csv(io.StringIO("\n".join(csv_like_lines)))
-                # st.write("Debug: Parsed with CSV fallback", df) # For debugging
-                return df
-        except Exception as e:
-            # st.error(f"Markdown table parsing (CSV fallback) failed: {e}") # For debugging
-            pass # Fall through to simple split if CSV fails
-        return pd.DataFrame() # Return empty if all attempts fail or no valid lines
-
-    # Process lines that look like markdown table rows
-    header = []
-    data_rows = []
-
-    # First valid table line is header
-    header_line = table_lines.pop(0) # Remove header line
-    header = [h.strip() for h in header_line.strip('|').split('|')]
-    
-    # Skip the separator line if present (usually the second line in table_lines if not filtered out)
-    if table_lines and all(c in '-|: ' for c in table_lines[0]):
-        table_lines.pop(0)
-
-    for line in table_lines:
-        cells = [cell.strip() for cell in line.strip('|').split('|')]
-        if len(cells) == len(header): # Ensure row matches header length
-            data_rows.append(cells)
-        # else:
-            # st.warning(f"Skipping malformed table row: {line}") # For debugging
-
-    if not data_rows and not header: # If parsing failed to get any data
-        return pd.DataFrame()
-        
-    try:
-        df = pd.DataFrame(data_rows, columns=header)
-    except Exception as e:
-        # st.error(f"Error creating DataFrame from parsed table: {e}") # For debugging
-        # Attempt to create DataFrame even if header is empty, pandas might handle it
-        df = pd.DataFrame(data_rows) if data_rows else pd.DataFrame()
-        
-    return df
+    parser = IncrementalTableParser()
+    parser.feed(markdown_table_string)
+    parser.close()
+    return parser.to_dataframe()
 
 if __name__ == '__main__':
     # Example Usage for testing
@@ -96,7 +185,7 @@ if __name__ == '__main__':
     """
     df3 = parse_markdown_table_to_df(md_table3_no_separator)
     print("\nDF3 (no separator):\n", df3)
-    
+
     md_table4_malformed = """
     This is some text before the table.
     | Name  | Age |
@@ -106,12 +195,23 @@ if __name__ == '__main__':
     Another text after table.
     """
     df4 = parse_markdown_table_to_df(md_table4_malformed)
-    print("\nDF4 (malformed):\n", df4) # Should try to parse valid rows
+    print("\nDF4 (malformed):\n", df4) # Ragged rows are kept
 
     md_table5_empty = ""
     df5 = parse_markdown_table_to_df(md_table5_empty)
     print("\nDF5 (empty):\n", df5)
-    
+
     md_table6_only_header = "| H1 | H2 |\n|----|----|"
     df6 = parse_markdown_table_to_df(md_table6_only_header)
-    print("\nDF6 (only header and separator):\n", df6)
\ No newline at end of file
+    print("\nDF6 (only header and separator):\n", df6)
+
+    md_table7_escaped_pipes = """
+    以下是分镜脚本：
+    ```markdown
+    画面序号 | 中文口播文案 | 文生图提示词 (英文)
+    ---|---|---
+    1 | 首先，我们来看看数据，结果令人惊讶。 | a chart \\| glowing --ar 16:9
+    ```
+    """
+    df7 = parse_markdown_table_to_df(md_table7_escaped_pipes)
+    print("\nDF7 (no outer pipes, escaped pipe, preamble):\n", df7)
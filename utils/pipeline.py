@@ -0,0 +1,362 @@
+"""
+Headless outline → script → storyboard → metadata → translation pipeline.
+
+Runs the same prompts.yaml tasks as the Streamlit pages, without any UI, and writes the
+artifacts for each topic to its own directory. Used by `batch_pipeline.py`.
+
+Topics, stages and translations run as coroutines on one event loop, so a large batch
+keeps many requests in flight without a thread per request.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.async_core import DEFAULT_PROVIDER_CONCURRENCY, AsyncLLMSession, as_completed_by_key, gather_or_cancel
+from utils.core import resolve_prompt
+from utils.parsing_utils import parse_markdown_table_to_df
+from utils.prompt_index import compile_prompts
+from utils.storyboard_utils import (
+    DEFAULT_SEGMENT_MAX_CHARS, merge_storyboard_segments, split_script_into_segments, storyboard_to_markdown
+)
+from utils.structured_output import (
+    parse_storyboard_response, parse_video_metadata_response, response_format_for, supports_structured_output,
+    with_structured_output_instruction
+)
+from utils.translation_memory import get_translation_memory, plan_with_memory, prompt_version, remember_response
+from utils.translation_utils import (
+    DEFAULT_SCENE_BATCH_SIZE, METADATA_TASK, SCENE_BATCH_TASK, LanguageTranslation, build_scenes_json, describe_request,
+    parse_scenes_json
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORD_COUNT = 1000
+DEFAULT_REPORT_LANGUAGES = ["English", "French", "German", "Spanish", "Portuguese", "Japanese"]
+MD_REPORT_PROMPT_NAME = "translate_and_format_to_md_zh"
+
+# (temperature, max_tokens) fallbacks, matching the defaults used by the pages
+_TASK_DEFAULTS = {
+    "outline_generation": (0.7, 1500),
+    "outline_scoring": (0.5, 1000),
+    "script_generation": (0.7, 3000),
+    "script_scoring": (0.5, 1000),
+    "storyboard_generation": (0.6, 2500),
+    "video_metadata_generation": (0.7, 1500),
+    MD_REPORT_PROMPT_NAME: (0.4, 65536),
+    SCENE_BATCH_TASK: (0.3, 8192),
+    METADATA_TASK: (0.3, 8192),
+}
+
+
+class PipelineError(Exception):
+    """A stage could not produce its artifact."""
+
+
+@dataclass
+class ProviderSettings:
+    api_key: str
+    base_url: str
+    model: str
+    max_concurrent_requests: int = DEFAULT_PROVIDER_CONCURRENCY # Requests in flight across all topics
+    structured_output: bool = False # Request JSON schema output for the storyboard and metadata
+
+
+@dataclass
+class TopicJob:
+    topic_id: str
+    topic: str
+    word_count: int = DEFAULT_WORD_COUNT
+    languages: List[str] = field(default_factory=lambda: list(DEFAULT_REPORT_LANGUAGES))
+
+
+def slugify(text: str, max_length: int = 60) -> str:
+    """Makes a filesystem-safe directory name, keeping CJK characters."""
+    slug = re.sub(r"[^\w\-]+", "_", text.strip(), flags=re.UNICODE).strip("_")
+    return slug[:max_length] or "topic"
+
+
+def load_topic_jobs(jsonl_path: str) -> List[TopicJob]:
+    """
+    Reads one topic per JSONL line.
+
+    Recognised fields: `topic` (or `title`), `id` (or `request_id`), `word_count`, `languages`.
+    Blank lines are skipped; lines that are not a JSON object or lack a topic, or whose
+    id names the same output directory as an earlier line once slugified, raise ValueError.
+    """
+    jobs = []
+    line_numbers_by_id: Dict[str, int] = {} # Slugified id -> line that claimed it
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{jsonl_path}:{line_number}: 不是有效的 JSON：{e}") from e
+            if not isinstance(record, dict):
+                raise ValueError(f"{jsonl_path}:{line_number}: 每行应为一个 JSON 对象")
+            topic = record.get("topic") or record.get("title")
+            if not topic:
+                raise ValueError(f"{jsonl_path}:{line_number}: 缺少 'topic' 字段")
+            topic_id = slugify(str(record.get("id") or record.get("request_id") or f"{line_number:04d}_{slugify(topic, 30)}"))
+            if topic_id in line_numbers_by_id:
+                raise ValueError(
+                    f"{jsonl_path}:{line_number}: 主题 id '{topic_id}' 与第 {line_numbers_by_id[topic_id]} 行重复，"
+                    "输出目录会互相覆盖"
+                )
+            line_numbers_by_id[topic_id] = line_number
+            jobs.append(TopicJob(
+                topic_id=topic_id,
+                topic=topic,
+                word_count=int(record.get("word_count", DEFAULT_WORD_COUNT)),
+                languages=list(record.get("languages") or DEFAULT_REPORT_LANGUAGES),
+            ))
+    return jobs
+
+
+async def run_prompt_task(task_name: str, variables: Dict[str, Any], provider: ProviderSettings, prompts_config: dict,
+                          session: AsyncLLMSession, use_cache: bool = True) -> str:
+    """
+    Formats a prompts.yaml task and runs it; raises PipelineError on failure.
+
+    With `provider.structured_output`, tasks that have a JSON schema return its JSON object.
+    """
+    prompt = resolve_prompt(task_name, provider.model, prompts_config, variables)
+    if not prompt.ok:
+        raise PipelineError(prompt.error or f"未能准备任务 '{task_name}' 的提示词，请检查 prompts.yaml。")
+    params = prompt.parameters or {}
+    structured = provider.structured_output and supports_structured_output(task_name)
+    default_temperature, default_max_tokens = _TASK_DEFAULTS.get(task_name, (0.7, 2000))
+    result = await session.chat_completion(
+        api_key=provider.api_key,
+        base_url=provider.base_url,
+        model=provider.model,
+        system_message=with_structured_output_instruction(prompt.system_message, task_name) if structured else prompt.system_message,
+        user_message_text=prompt.user_message_text,
+        temperature=params.get("temperature", default_temperature),
+        max_tokens=params.get("max_tokens", default_max_tokens),
+        timeout=params.get("timeout"),
+        cache_ttl_hours=params.get("cache_ttl_hours") if use_cache else None,
+        task_name=task_name,
+        response_format=response_format_for(task_name) if structured else None
+    )
+    if not result.ok:
+        raise PipelineError(result.error_message)
+    if result.truncated:
+        logger.warning("任务 %s 的输出已达到 max_tokens 上限，内容可能被截断。", task_name)
+    return result.content
+
+
+class TopicPipeline:
+    """Runs every stage for one topic, writing artifacts to `output_dir` and recording a summary."""
+
+    def __init__(self, job: TopicJob, provider: ProviderSettings, prompts_config: dict, output_dir: str,
+                 session: AsyncLLMSession, language_workers: int = 3, with_scoring: bool = False, resume: bool = True,
+                 scene_batched_translation: bool = True, use_translation_memory: bool = True):
+        self.job = job
+        self.provider = provider
+        self.prompts_config = prompts_config
+        self.session = session
+        self.output_dir = output_dir
+        self.language_workers = language_workers
+        self.with_scoring = with_scoring
+        self.scene_batched_translation = scene_batched_translation
+        self.use_translation_memory = use_translation_memory
+        self.resume = resume
+        self.summary: Dict[str, Any] = {"id": job.topic_id, "topic": job.topic, "output_dir": output_dir, "stages": {}}
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.output_dir, filename)
+
+    def _write(self, filename: str, content: str):
+        path = self._path(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path) # Never leave a half-written artifact behind for --resume
+
+    def _task(self, task_name: str, variables: Dict[str, Any], use_cache: bool = True) -> Callable[[], Awaitable[str]]:
+        return lambda: run_prompt_task(task_name, variables, self.provider, self.prompts_config, self.session, use_cache)
+
+    async def _stage(self, stage_name: str, filename: str, producer: Callable[[], Awaitable[str]]) -> str:
+        """Returns the stage artifact, reusing it from disk when resuming, and records status/timing."""
+        path = self._path(filename)
+        if self.resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.summary["stages"][stage_name] = {"status": "reused", "seconds": 0.0}
+                return f.read()
+
+        started_at = time.perf_counter()
+        try:
+            content = await producer()
+        except Exception as e:
+            message = str(e) if isinstance(e, PipelineError) else f"{type(e).__name__}: {e}"
+            self.summary["stages"][stage_name] = {"status": "error", "seconds": time.perf_counter() - started_at, "error": message}
+            logger.error("[%s] %s 失败: %s", self.job.topic_id, stage_name, message)
+            raise PipelineError(message) from e
+        self._write(filename, content)
+        elapsed = time.perf_counter() - started_at
+        self.summary["stages"][stage_name] = {"status": "ok", "seconds": elapsed}
+        logger.info("[%s] %s 完成 (%.1fs)", self.job.topic_id, stage_name, elapsed)
+        return content
+
+    async def run(self) -> Dict[str, Any]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        started_at = time.perf_counter()
+        try:
+            await self._run_stages()
+            self.summary["status"] = "ok" if all(
+                stage["status"] != "error" for stage in self.summary["stages"].values()
+            ) else "partial"
+        except PipelineError:
+            self.summary["status"] = "error"
+        self.summary["seconds"] = time.perf_counter() - started_at
+        self._write("summary.json", json.dumps(self.summary, ensure_ascii=False, indent=2))
+        return self.summary
+
+    async def _run_stages(self):
+        job = self.job
+        outline = await self._stage("outline", "01_outline.md", self._task(
+            "outline_generation", {"topic": job.topic}))
+        if self.with_scoring:
+            await self._stage("outline_scoring", "01_outline_score.md", self._task(
+                "outline_scoring", {"outline_content": outline}))
+
+        script = await self._stage("script", "02_script.md", self._task(
+            "script_generation", {"outline": outline, "word_count": job.word_count}))
+        if self.with_scoring:
+            await self._stage("script_scoring", "02_script_score.md", self._task(
+                "script_scoring", {"script_content": script}))
+
+        storyboard_markdown = await self._stage("storyboard", "03_storyboard.md", lambda: self._generate_storyboard(script))
+        storyboard_df = parse_markdown_table_to_df(storyboard_markdown)
+        if storyboard_df.empty:
+            self.summary["stages"]["storyboard"] = {"status": "error", "seconds": 0.0, "error": "未能从 AI 返回内容中解析出分镜表格"}
+            raise PipelineError("未能从 AI 返回内容中解析出分镜表格")
+        self._write("03_storyboard.json", storyboard_df.to_json(orient="records", indent=4, force_ascii=False))
+
+        metadata = await self._stage("metadata", "04_metadata.md", lambda: self._generate_metadata(script))
+
+        await self._run_translations(build_scenes_json(storyboard_df), metadata)
+
+    async def _generate_storyboard(self, script: str) -> str:
+        """Generates the storyboard per paragraph-aligned script segment, concurrently, and merges the tables."""
+        prompt = resolve_prompt("storyboard_generation", self.provider.model, self.prompts_config)
+        max_chars = int((prompt.parameters or {}).get("segment_max_chars", DEFAULT_SEGMENT_MAX_CHARS))
+        segments = split_script_into_segments(script, max_chars)
+        if len(segments) <= 1:
+            output = await self._task("storyboard_generation", {"script_content": script})()
+            if not self.provider.structured_output:
+                return output
+            storyboard_df = parse_storyboard_response(output, structured=True)
+            # The artifact stays a Markdown table, so --resume and the later stages read it the same way
+            return storyboard_to_markdown(storyboard_df) if not storyboard_df.empty else output
+        logger.info("[%s] 口播稿拆分为 %d 段生成分镜", self.job.topic_id, len(segments))
+        # One failed segment fails the storyboard, so the other segments' requests are cancelled
+        outputs = await gather_or_cancel(*(
+            self._task("storyboard_generation", {"script_content": segment})() for segment in segments
+        ))
+        segment_dfs = [parse_storyboard_response(output, self.provider.structured_output) for output in outputs]
+        for segment_index, segment_df in enumerate(segment_dfs):
+            if segment_df.empty:
+                raise PipelineError(f"未能从第 {segment_index + 1} 段的 AI 返回内容中解析出分镜表格")
+        return storyboard_to_markdown(merge_storyboard_segments(segment_dfs))
+
+    async def _generate_metadata(self, script: str) -> str:
+        """Generates the metadata text; structured output is also kept as 04_metadata.json."""
+        output = await self._task("video_metadata_generation",
+                                  {"storyboard_summary_or_full_script": script})()
+        metadata_text, metadata_fields = parse_video_metadata_response(output, self.provider.structured_output)
+        if metadata_fields is not None:
+            self._write("04_metadata.json", json.dumps(metadata_fields, ensure_ascii=False, indent=2))
+        return metadata_text
+
+    async def _translate_scene_batched(self, language: str, scenes_json: str, metadata: str) -> str:
+        """Translates scene batches and the metadata concurrently, then assembles the MD report locally."""
+        prompts = compile_prompts(self.prompts_config)
+        prompt_versions = {task_name: prompt_version(prompts.lookup(task_name, self.provider.model)[0])
+                           for task_name in (SCENE_BATCH_TASK, METADATA_TASK)}
+        batch_prompt = resolve_prompt(SCENE_BATCH_TASK, self.provider.model, prompts)
+        batch_size = int((batch_prompt.parameters or {}).get("scene_batch_size", DEFAULT_SCENE_BATCH_SIZE))
+        memory = get_translation_memory() if self.use_translation_memory else None
+        translation = plan_with_memory(memory, language, parse_scenes_json(scenes_json), metadata, prompt_versions, batch_size)
+        # A part whose reply is unusable (e.g. invalid JSON) is sent once more, bypassing the response cache
+        for use_cache in (True, False):
+            requests = translation.pending()
+            contents = await gather_or_cancel(*(self._task(request.task_name, request.variables, use_cache)() for request in requests))
+            for request, content in zip(requests, contents):
+                if translation.add_response(request, content):
+                    remember_response(memory, translation, request, prompt_versions)
+            if translation.complete:
+                return translation.report()
+        request = translation.pending()[0]
+        raise PipelineError(f"{describe_request(request)}: {translation.errors[LanguageTranslation.request_key(request)]}")
+
+    async def _run_translations(self, scenes_json: str, metadata: str):
+        """Generates one MD report per language concurrently; failed languages do not affect the others."""
+        language_slots = asyncio.Semaphore(max(1, self.language_workers))
+
+        async def translate(language: str):
+            filename = os.path.join("reports", f"video_script_report_{language}.md")
+            if self.scene_batched_translation:
+                producer = lambda: self._translate_scene_batched(language, scenes_json, metadata)
+            else:
+                variables = {"target_language": language, "storyboard_scenes_json": scenes_json, "video_metadata_text": metadata}
+                producer = self._task(MD_REPORT_PROMPT_NAME, variables)
+            async with language_slots:
+                await self._stage(f"translation_{language}", filename, producer)
+
+        # Failures are recorded per language by _stage
+        await asyncio.gather(*(translate(language) for language in self.job.languages), return_exceptions=True)
+
+
+async def run_batch_async(jobs: List[TopicJob], provider: ProviderSettings, prompts_config: dict, output_dir: str,
+                          topic_workers: int = 2, language_workers: int = 3, with_scoring: bool = False,
+                          resume: bool = True, on_topic_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+                          scene_batched_translation: bool = True, use_translation_memory: bool = True) -> List[Dict[str, Any]]:
+    """
+    Runs the pipeline for many topics as coroutines on the current event loop and returns their summaries.
+
+    At most `topic_workers` topics run at once, and all of their requests share one
+    semaphore of `provider.max_concurrent_requests` slots.
+    """
+    prompts_config = compile_prompts(prompts_config) # Compile once for every topic
+    topic_slots = asyncio.Semaphore(max(1, topic_workers))
+    summaries = []
+    async with AsyncLLMSession({provider.base_url: provider.max_concurrent_requests}) as session:
+
+        async def run_topic(job: TopicJob) -> Dict[str, Any]:
+            pipeline = TopicPipeline(
+                job, provider, prompts_config, os.path.join(output_dir, job.topic_id), session,
+                language_workers=language_workers, with_scoring=with_scoring, resume=resume,
+                scene_batched_translation=scene_batched_translation, use_translation_memory=use_translation_memory
+            )
+            async with topic_slots:
+                try:
+                    return await pipeline.run()
+                except Exception as e: # One broken topic must not take down the others
+                    return {"id": job.topic_id, "status": "error", "error": f"{type(e).__name__}: {e}"}
+
+        async for _, summary in as_completed_by_key({job.topic_id: run_topic(job) for job in jobs}):
+            summaries.append(summary)
+            if on_topic_done:
+                on_topic_done(summary)
+    return summaries
+
+
+def run_batch(jobs: List[TopicJob], provider: ProviderSettings, prompts_config: dict, output_dir: str,
+              topic_workers: int = 2, language_workers: int = 3, with_scoring: bool = False,
+              resume: bool = True, on_topic_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+              scene_batched_translation: bool = True, use_translation_memory: bool = True) -> List[Dict[str, Any]]:
+    """Synchronous entry point for `run_batch_async`."""
+    return asyncio.run(run_batch_async(
+        jobs, provider, prompts_config, output_dir, topic_workers=topic_workers, language_workers=language_workers,
+        with_scoring=with_scoring, resume=resume, on_topic_done=on_topic_done,
+        scene_batched_translation=scene_batched_translation, use_translation_memory=use_translation_memory
+    ))
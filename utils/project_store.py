@@ -0,0 +1,272 @@
+"""
+Durable project storage: save and resume a project's work across restarts.
+
+A project is the set of session_state values the pages produce (outline, script,
+storyboard, metadata, image prompts, reports and the last request of each step),
+grouped into artifacts (PROJECT_ARTIFACTS). Each artifact is stored as zlib-compressed
+JSON in a local SQLite database next to a digest of its uncompressed form; the
+`projects` table is the manifest (name and timestamps) the project picker lists.
+
+Pages call `autosave_project` at the end of every run. It serializes the artifacts,
+compares their digests with what this session last saved and writes only the changed
+ones, in one transaction. The storyboard is treated as immutable (see
+storyboard_model), so it is re-serialized only when a new DataFrame is assigned.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, MutableMapping, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PROJECTS_DB_PATH = os.path.join(".cache", "projects.sqlite3")
+PROJECT_ID_KEY = "project_id"
+SAVED_DIGESTS_KEY = "_project_saved_digests" # {artifact: digest} this session last wrote
+SERIALIZED_FRAMES_KEY = "_project_serialized_frames" # {session key: (DataFrame, JSON form)}, reused while the frame is unchanged
+DEFAULT_PROJECT_NAME = "未命名项目"
+PROJECT_NAME_MAX_CHARS = 40
+
+# Artifact -> the session_state keys it persists. Derived state (storyboard model,
+# translation plans, widget-only keys) is rebuilt by the pages after a restore.
+PROJECT_ARTIFACTS = {
+    "outline": ["topic_input", "outline_content", "outline_score_feedback"],
+    "script": ["word_count_target", "script_content", "script_score_feedback"],
+    "storyboard": ["storyboard_data"],
+    "metadata": ["unified_metadata_text", "video_metadata_fields", "raw_ai_metadata_output_for_debug"],
+    "image_prompts": ["image_to_video_prompts", "uploaded_files_info"],
+    "reports": ["editable_storyboard_json", "editable_metadata_text", "generated_md_reports", "current_target_lang_for_preview"],
+    "request_logs": [
+        "last_outline_request", "last_score_request", "last_script_request", "last_script_score_request",
+        "last_storyboard_request", "last_metadata_request", "last_md_generation_request"
+    ],
+}
+# A project is created once one of these has content, not merely because a page initialized its defaults
+PROJECT_CONTENT_KEYS = ["topic_input", "outline_content", "script_content", "storyboard_data", "unified_metadata_text"]
+_DATAFRAME_MARKER = "__dataframe__"
+
+
+@dataclass
+class ProjectSummary:
+    """One manifest row, as listed by the project picker."""
+    project_id: str
+    name: str
+    created_at: float
+    updated_at: float
+    artifact_count: int
+    stored_bytes: int
+
+
+def _to_json_value(value: Any) -> Any:
+    if isinstance(value, pd.DataFrame):
+        # "split" stores the column names once instead of once per row
+        return {_DATAFRAME_MARKER: json.loads(value.to_json(orient="split", index=False, force_ascii=False))}
+    return value
+
+
+def _from_json_value(value: Any) -> Any:
+    if isinstance(value, dict) and _DATAFRAME_MARKER in value:
+        frame = value[_DATAFRAME_MARKER]
+        return pd.DataFrame(frame.get("data", []), columns=frame.get("columns", []))
+    return value
+
+
+def serialize_artifacts(session_state: MutableMapping) -> Dict[str, bytes]:
+    """Returns {artifact: JSON bytes} of the project values present in `session_state`."""
+    frames = session_state.setdefault(SERIALIZED_FRAMES_KEY, {})
+    artifacts = {}
+    for artifact, keys in PROJECT_ARTIFACTS.items():
+        values = {}
+        for key in keys:
+            if key not in session_state:
+                continue
+            value = session_state[key]
+            if isinstance(value, pd.DataFrame):
+                cached = frames.get(key)
+                if cached is None or cached[0] is not value:
+                    cached = frames[key] = (value, _to_json_value(value))
+                values[key] = cached[1]
+            else:
+                values[key] = value
+        if values:
+            artifacts[artifact] = json.dumps(values, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    return artifacts
+
+
+def has_project_content(session_state: MutableMapping) -> bool:
+    for key in PROJECT_CONTENT_KEYS:
+        value = session_state.get(key)
+        if (not value.empty) if isinstance(value, pd.DataFrame) else bool(str(value or "").strip()):
+            return True
+    return False
+
+
+def artifact_digest(payload: bytes) -> str:
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def project_name(session_state: MutableMapping) -> str:
+    """The first line of the video topic, or DEFAULT_PROJECT_NAME."""
+    topic = str(session_state.get("topic_input") or "").strip()
+    return topic.splitlines()[0][:PROJECT_NAME_MAX_CHARS] if topic else DEFAULT_PROJECT_NAME
+
+
+class ProjectStore:
+    """Thread-safe SQLite store of projects (manifest) and their compressed artifacts."""
+
+    def __init__(self, db_path: str = PROJECTS_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS projects (
+                project_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS artifacts (
+                project_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                data BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (project_id, name)
+            )"""
+        )
+
+    def create_project(self, name: str = DEFAULT_PROJECT_NAME) -> str:
+        project_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT INTO projects (project_id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                               (project_id, name, now, now))
+        return project_id
+
+    def save_artifacts(self, project_id: str, payloads: Dict[str, bytes], name: str = DEFAULT_PROJECT_NAME):
+        """Writes the given artifacts (JSON bytes) of a project in one transaction and updates its manifest row."""
+        now = time.time()
+        rows = [(project_id, artifact, artifact_digest(payload), zlib.compress(payload), now) for artifact, payload in payloads.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO artifacts (project_id, name, digest, data, updated_at) VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._conn.execute(
+                    "INSERT INTO projects (project_id, name, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(project_id) DO UPDATE SET updated_at = excluded.updated_at, name = excluded.name",
+                    (project_id, name, now, now)
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load_project(self, project_id: str) -> Dict[str, Dict[str, Any]]:
+        """Returns {artifact: {session key: value}} of a project ({} if it does not exist)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, data FROM artifacts WHERE project_id = ?", (project_id,)).fetchall()
+        return {
+            artifact: {key: _from_json_value(value) for key, value in json.loads(zlib.decompress(data)).items()}
+            for artifact, data in rows
+        }
+
+    def artifact_digests(self, project_id: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, digest FROM artifacts WHERE project_id = ?", (project_id,)).fetchall())
+
+    def list_projects(self) -> List[ProjectSummary]:
+        """All projects, most recently updated first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.project_id, p.name, p.created_at, p.updated_at, COUNT(a.name), COALESCE(SUM(LENGTH(a.data)), 0) "
+                "FROM projects p LEFT JOIN artifacts a ON a.project_id = p.project_id "
+                "GROUP BY p.project_id ORDER BY p.updated_at DESC"
+            ).fetchall()
+        return [ProjectSummary(*row) for row in rows]
+
+    def delete_project(self, project_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM artifacts WHERE project_id = ?", (project_id,))
+                self._conn.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+_STORE: Optional[ProjectStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_project_store() -> ProjectStore:
+    """Returns the process-wide project store, opening the database on first use."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = ProjectStore()
+    return _STORE
+
+
+def autosave_project(session_state: MutableMapping, store: Optional[ProjectStore] = None) -> List[str]:
+    """
+    Saves the session's project artifacts that changed since this session last saved them
+    and returns their names. The project is created on the first save; a failed write is
+    logged and retried on the next run.
+    """
+    if not session_state.get(PROJECT_ID_KEY) and not has_project_content(session_state):
+        return []
+    saved_digests = session_state.setdefault(SAVED_DIGESTS_KEY, {})
+    changed, digests = {}, {}
+    for artifact, payload in serialize_artifacts(session_state).items():
+        digests[artifact] = artifact_digest(payload)
+        if saved_digests.get(artifact) != digests[artifact]:
+            changed[artifact] = payload
+    if not changed:
+        return []
+    store = store or get_project_store()
+    try:
+        if not session_state.get(PROJECT_ID_KEY):
+            session_state[PROJECT_ID_KEY] = store.create_project(project_name(session_state))
+        store.save_artifacts(session_state[PROJECT_ID_KEY], changed, project_name(session_state))
+    except sqlite3.Error as e:
+        logger.warning("Autosave of project %s failed: %s", session_state.get(PROJECT_ID_KEY), e)
+        return []
+    saved_digests.update((artifact, digests[artifact]) for artifact in changed)
+    return list(changed)
+
+
+def restore_project(session_state: MutableMapping, project_id: str, store: Optional[ProjectStore] = None) -> bool:
+    """
+    Loads a project's artifacts into `session_state` (which the caller has cleared of the
+    previous project) and makes it the session's project. Returns False if it has no data.
+    """
+    store = store or get_project_store()
+    artifacts = store.load_project(project_id)
+    if not artifacts:
+        return False
+    for values in artifacts.values():
+        session_state.update(values)
+    session_state[PROJECT_ID_KEY] = project_id
+    session_state[SAVED_DIGESTS_KEY] = store.artifact_digests(project_id) # Restored values need no re-save
+    return True
@@ -0,0 +1,216 @@
+"""
+Prompts from prompts.yaml, compiled once at load time.
+
+`PromptIndex` resolves the model → "default" → first-prompt fallback for every task
+up front, pre-parses each `user_message_template` into its `{placeholder}` fields and
+memoizes (task, model) lookups, so formatting a prompt is a dict lookup plus
+`str.format`. `validate` checks every template against the variables the code passes
+for its task (`TASK_VARIABLES`), turning what used to be a `KeyError` at request time
+into a report at startup.
+"""
+import string
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+DEFAULT_PROMPT_KEY = "default"
+
+# Variables the app and the batch pipeline pass to each task's user_message_template.
+# Keep in sync with the get_prompt_content / resolve_prompt call sites.
+TASK_VARIABLES: Dict[str, FrozenSet[str]] = {
+    "outline_generation": frozenset({"topic"}),
+    "outline_scoring": frozenset({"outline_content"}),
+    "script_generation": frozenset({"outline", "word_count"}),
+    "script_scoring": frozenset({"script_content"}),
+    "storyboard_generation": frozenset({"script_content"}),
+    "storyboard_row_regeneration": frozenset({"context_before", "target_rows", "context_after", "revision_notes"}),
+    "video_metadata_generation": frozenset({"storyboard_summary_or_full_script"}),
+    "image_to_video_prompt_generation": frozenset({"scene_description"}),
+    "translate_and_format_to_md_zh": frozenset({"target_language", "storyboard_scenes_json", "video_metadata_text"}),
+    "translate_scene_batch": frozenset({"target_language", "scenes_json"}),
+    "translate_video_metadata": frozenset({"target_language", "video_metadata_text"}),
+}
+
+SEVERITY_ERROR = "error"
+SEVERITY_WARNING = "warning"
+
+
+def parse_template_fields(template: str) -> FrozenSet[str]:
+    """
+    Returns the top-level names of the `{placeholders}` in a str.format template.
+
+    Raises ValueError for a malformed template (e.g. an unmatched brace) or for
+    positional fields, which cannot be filled from a variable dict.
+    """
+    fields = set()
+    for _, field_name, format_spec, _ in string.Formatter().parse(template or ""):
+        if field_name is None:
+            continue
+        name = field_name.split(".", 1)[0].split("[", 1)[0]
+        if not name or name.isdigit():
+            raise ValueError(f"不支持位置占位符 '{{{field_name}}}'，请使用命名变量")
+        fields.add(name)
+        if format_spec and "{" in format_spec: # Nested fields, e.g. "{value:{width}}"
+            fields.update(parse_template_fields(format_spec))
+    return frozenset(fields)
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """One prompt of a task (a model key under the task in prompts.yaml), ready to format."""
+    task: str
+    model_key: str
+    system_message: str
+    user_message_template: str
+    parameters: Dict[str, Any]
+    fields: FrozenSet[str]
+    template_error: Optional[str] = None # Set if the template could not be parsed
+
+
+@dataclass(frozen=True)
+class PromptIssue:
+    task: str
+    model_key: Optional[str]
+    severity: str # SEVERITY_ERROR or SEVERITY_WARNING
+    message: str
+
+
+def _compile_prompt(task_name: str, model_key: str, prompt_details: Dict[str, Any]) -> CompiledPrompt:
+    template = prompt_details.get("user_message_template", "") or ""
+    try:
+        fields, template_error = parse_template_fields(template), None
+    except ValueError as e:
+        fields, template_error = frozenset(), str(e)
+    return CompiledPrompt(
+        task=task_name,
+        model_key=model_key,
+        system_message=prompt_details.get("system_message", ""),
+        user_message_template=template,
+        parameters=prompt_details.get("parameters", {}),
+        fields=fields,
+        template_error=template_error,
+    )
+
+
+class PromptIndex(Mapping):
+    """
+    Compiled view of the `prompts` section of prompts.yaml.
+
+    Also a read-only mapping of task name → raw task config, so it can be passed
+    wherever the plain prompts dict was used before.
+    """
+
+    def __init__(self, prompts_config: Optional[Dict[str, Any]] = None):
+        self._raw: Dict[str, Any] = dict(prompts_config or {})
+        self._prompts: Dict[str, Dict[str, CompiledPrompt]] = {}
+        self._task_errors: Dict[str, str] = {}
+        self._resolved: Dict[Tuple[str, str], Tuple[Optional[CompiledPrompt], Optional[str], Optional[str]]] = {}
+        self._default_issues: Optional[List[PromptIssue]] = None
+
+        for task_name, task_prompts in self._raw.items():
+            if not isinstance(task_prompts, dict) or not task_prompts:
+                self._task_errors[task_name] = f"错误：任务 '{task_name}' 配置为空或无效。"
+                continue
+            self._prompts[task_name] = {
+                model_key: _compile_prompt(task_name, model_key, prompt_details)
+                for model_key, prompt_details in task_prompts.items()
+                if isinstance(prompt_details, dict) and prompt_details
+            }
+            if not self._prompts[task_name]:
+                self._task_errors[task_name] = f"错误：任务 '{task_name}' 配置为空或无效。"
+
+    # Mapping interface over the raw config
+    def __getitem__(self, task_name: str) -> Any:
+        return self._raw[task_name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def prompts(self, task_name: str) -> Dict[str, CompiledPrompt]:
+        """Returns the compiled prompts of a task, keyed by model key."""
+        return dict(self._prompts.get(task_name, {}))
+
+    def lookup(self, task_name: str, model_name: str) -> Tuple[Optional[CompiledPrompt], Optional[str], Optional[str]]:
+        """
+        Returns (prompt, notice, error) for a task and model.
+
+        Falls back from the model-specific prompt to "default", then to the first prompt
+        defined for the task (with a notice). The result is memoized per (task, model).
+        """
+        key = (task_name, model_name)
+        if key not in self._resolved:
+            self._resolved[key] = self._lookup(task_name, model_name)
+        return self._resolved[key]
+
+    def _lookup(self, task_name: str, model_name: str):
+        if task_name not in self._raw:
+            return None, None, f"错误：在 prompts.yaml 中未找到任务 '{task_name}' 的提示词配置。"
+        if task_name in self._task_errors:
+            return None, None, self._task_errors[task_name]
+
+        task_prompts = self._prompts[task_name]
+        prompt = task_prompts.get(model_name) or task_prompts.get(DEFAULT_PROMPT_KEY)
+        if prompt:
+            return prompt, None, None
+        # Tasks like image_to_video_prompt_generation may only define prompts for specific
+        # capable models (e.g., gpt-4o)
+        first_available_model_key = next(iter(task_prompts))
+        notice = (f"提示：任务 '{task_name}' 未找到模型 '{model_name}' 或 'default' 的提示词。"
+                  f"将使用该任务下找到的第一个可用模型 '{first_available_model_key}' 的提示词。")
+        return task_prompts[first_available_model_key], notice, None
+
+    def validate(self, task_variables: Optional[Dict[str, FrozenSet[str]]] = None) -> List[PromptIssue]:
+        """
+        Checks every prompt against the variables its task is called with.
+
+        Missing variables (used by a template but never passed) and malformed templates
+        are errors; passed variables a template ignores are warnings. Tasks the code uses
+        but prompts.yaml lacks are errors too. The report for `TASK_VARIABLES` is memoized.
+        """
+        if task_variables is None:
+            if self._default_issues is None:
+                self._default_issues = self._validate(TASK_VARIABLES)
+            return list(self._default_issues)
+        return self._validate(task_variables)
+
+    def _validate(self, task_variables: Dict[str, FrozenSet[str]]) -> List[PromptIssue]:
+        issues: List[PromptIssue] = []
+        for task_name in task_variables:
+            if task_name not in self._raw:
+                issues.append(PromptIssue(task_name, None, SEVERITY_ERROR, "prompts.yaml 中缺少该任务"))
+        for task_name, message in self._task_errors.items():
+            issues.append(PromptIssue(task_name, None, SEVERITY_ERROR, message))
+
+        for task_name, task_prompts in self._prompts.items():
+            expected = task_variables.get(task_name)
+            for model_key, prompt in task_prompts.items():
+                if prompt.template_error:
+                    issues.append(PromptIssue(task_name, model_key, SEVERITY_ERROR,
+                                              f"user_message_template 格式无效：{prompt.template_error}"))
+                    continue
+                if expected is None:
+                    continue
+                missing = sorted(prompt.fields - expected)
+                if missing:
+                    issues.append(PromptIssue(task_name, model_key, SEVERITY_ERROR,
+                                              "模板使用了代码未提供的变量：" + ", ".join(missing)))
+                extra = sorted(expected - prompt.fields)
+                if extra and prompt.user_message_template.strip():
+                    issues.append(PromptIssue(task_name, model_key, SEVERITY_WARNING,
+                                              "代码提供的变量未在模板中使用：" + ", ".join(extra)))
+        return issues
+
+
+def compile_prompts(prompts_config: Optional[Dict[str, Any]]) -> PromptIndex:
+    """Returns `prompts_config` as a PromptIndex, compiling it unless it already is one."""
+    if isinstance(prompts_config, PromptIndex):
+        return prompts_config
+    return PromptIndex(prompts_config)
+
+
+def format_issue(issue: PromptIssue) -> str:
+    location = issue.task if issue.model_key is None else f"{issue.task} / {issue.model_key}"
+    return f"[{location}] {issue.message}"
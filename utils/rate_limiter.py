@@ -0,0 +1,355 @@
+"""
+Provider-aware rate limiting and retries for LLM requests.
+
+Each (provider base URL, model) pair gets a token-bucket limiter built from the
+`rate_limits` declared for the provider in `available_model_providers` in prompts.yaml
+(requests and tokens per minute, optionally overridden per model); providers without
+limits are not throttled. A request waits until both buckets hold its share and takes it
+only then, re-checking whenever capacity is given back, so concurrent work saturates the
+quota instead of exceeding it. The token share is an estimate (prompt plus a capped
+completion size) that is settled against the reported usage afterwards.
+
+Failed requests are classified as retryable (429, timeouts, connection errors, 5xx)
+or fatal (auth, bad request, exhausted quota, ...). Retryable ones are repeated with
+exponential backoff and full jitter, honouring the provider's Retry-After header; a
+429 also pauses every other request to that provider/model for the same period.
+"""
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional, Tuple
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_DELAY_SECONDS = 1.0
+DEFAULT_MAX_DELAY_SECONDS = 60.0
+MAX_RETRY_AFTER_SECONDS = 300.0 # Never sleep longer than this, whatever the provider asks for
+IMAGE_TOKEN_ESTIMATE = 1000 # Rough prompt-token cost of one image part
+COMPLETION_TOKEN_ESTIMATE_CAP = 4096 # Completion tokens counted up front per request, whatever max_tokens allows
+WAIT_RECHECK_SECONDS = 0.5 # Waiting requests re-check capacity at least this often
+
+_RETRYABLE_STATUS_CODES = {408, 409, 429}
+_FATAL_ERROR_CODES = {"insufficient_quota", "billing_hard_limit_reached"} # 429s that waiting will not fix
+
+
+def _normalize_base_url(base_url: str) -> str:
+    return (base_url or "").strip().rstrip("/")
+
+
+# ---------------------------------------------------------------------------
+# Token buckets
+# ---------------------------------------------------------------------------
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute / 60` units per second.
+
+    Not locked on its own: `ModelRateLimiter` checks and takes from its buckets under one lock.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self._level = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self._level = min(self.capacity, self._level + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` (capped at the capacity, so an oversized request can still run) is available."""
+        self._refill(now)
+        return max(0.0, (min(float(amount), self.capacity) - self._level) / self.refill_per_second)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self._level -= min(float(amount), self.capacity)
+
+    def refund(self, amount: float, now: float):
+        """Gives back `amount`; a negative amount charges usage beyond what was taken."""
+        self._refill(now)
+        self._level = min(self.capacity, self._level + amount)
+
+
+@dataclass(frozen=True)
+class RateLimits:
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+
+
+class ModelRateLimiter:
+    """Request and token buckets for one provider/model, plus a shared 429 cool-down."""
+
+    def __init__(self, limits: RateLimits):
+        self.limits = limits
+        self.requests = TokenBucket(limits.requests_per_minute) if limits.requests_per_minute else None
+        self.tokens = TokenBucket(limits.tokens_per_minute) if limits.tokens_per_minute else None
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+
+    def _wait_time(self, estimated_tokens: int, now: float) -> float:
+        wait = self._blocked_until - now
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(estimated_tokens, now))
+        return wait
+
+    def _take(self, estimated_tokens: int, now: float):
+        if self.requests:
+            self.requests.take(1, now)
+        if self.tokens:
+            self.tokens.take(estimated_tokens, now)
+
+    def try_acquire(self, estimated_tokens: int) -> float:
+        """
+        Takes one request and `estimated_tokens` if both are available now and returns 0;
+        otherwise takes nothing and returns the seconds until they should be.
+        """
+        with self._condition:
+            now = time.monotonic()
+            wait = self._wait_time(estimated_tokens, now)
+            if wait <= 0:
+                self._take(estimated_tokens, now)
+            return max(wait, 0.0)
+
+    def acquire(self, estimated_tokens: int):
+        """Blocks until one request and `estimated_tokens` are available, then takes them."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(estimated_tokens, now)
+                if wait <= 0:
+                    self._take(estimated_tokens, now)
+                    return
+                self._condition.wait(min(wait, WAIT_RECHECK_SECONDS)) # Woken early by refunds
+
+    async def acquire_async(self, estimated_tokens: int):
+        """`acquire` for coroutines: waits without blocking the event loop."""
+        while True:
+            wait = self.try_acquire(estimated_tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, WAIT_RECHECK_SECONDS))
+
+    def release_tokens(self, amount: float):
+        """Gives back token capacity that was taken but not used (a negative amount charges extra usage)."""
+        if self.tokens and amount:
+            with self._condition:
+                self.tokens.refund(amount, time.monotonic())
+                self._condition.notify_all()
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Corrects the estimate once the provider has reported the real usage."""
+        if actual_tokens is not None:
+            self.release_tokens(estimated_tokens - actual_tokens)
+
+    def block_for(self, seconds: float):
+        """Pauses every request to this provider/model (after a 429) for `seconds`."""
+        with self._condition:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+# ---------------------------------------------------------------------------
+# Retry policy and registry (configured from prompts.yaml)
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_retries: int = DEFAULT_MAX_RETRIES
+    base_delay: float = DEFAULT_BASE_DELAY_SECONDS
+    max_delay: float = DEFAULT_MAX_DELAY_SECONDS
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+        return random.uniform(0.0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def _limits_from_config(config: Optional[Dict[str, Any]]) -> RateLimits:
+    config = config or {}
+    return RateLimits(
+        requests_per_minute=config.get("requests_per_minute") or None,
+        tokens_per_minute=config.get("tokens_per_minute") or None,
+    )
+
+
+class RateLimiterRegistry:
+    """Process-wide map of base URL → rate-limit settings, and (base URL, model) → limiter."""
+
+    def __init__(self):
+        self._provider_settings: Dict[str, Dict[str, Any]] = {}
+        self._limiters: Dict[Tuple[str, str], ModelRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def register_provider(self, base_url: str, provider_config: Dict[str, Any]):
+        """Applies a provider's `rate_limits` to requests sent to `base_url`. Unchanged settings keep their buckets."""
+        provider_key = _normalize_base_url(base_url)
+        if not provider_key:
+            return
+        settings = dict(provider_config.get("rate_limits") or {})
+        with self._lock:
+            if self._provider_settings.get(provider_key) == settings:
+                return
+            self._provider_settings[provider_key] = settings
+            for limiter_key in [key for key in self._limiters if key[0] == provider_key]:
+                del self._limiters[limiter_key]
+
+    def configure(self, provider_configs: List[Dict[str, Any]]):
+        """Registers every provider under its `base_url_template`."""
+        for provider_config in provider_configs or []:
+            self.register_provider(provider_config.get("base_url_template", ""), provider_config)
+
+    def limiter(self, base_url: str, model: str) -> ModelRateLimiter:
+        provider_key = _normalize_base_url(base_url)
+        with self._lock:
+            limiter = self._limiters.get((provider_key, model))
+            if limiter is None:
+                settings = self._provider_settings.get(provider_key, {})
+                model_settings = (settings.get("models") or {}).get(model)
+                limiter = ModelRateLimiter(_limits_from_config(model_settings or settings))
+                self._limiters[(provider_key, model)] = limiter
+            return limiter
+
+    def retry_policy(self, base_url: str) -> RetryPolicy:
+        settings = self._provider_settings.get(_normalize_base_url(base_url), {})
+        return RetryPolicy(
+            max_retries=int(settings.get("max_retries", DEFAULT_MAX_RETRIES)),
+            max_delay=float(settings.get("max_backoff_seconds", DEFAULT_MAX_DELAY_SECONDS)),
+        )
+
+
+_REGISTRY = RateLimiterRegistry()
+
+
+def get_rate_limiter_registry() -> RateLimiterRegistry:
+    return _REGISTRY
+
+
+def configure_rate_limits(provider_configs: List[Dict[str, Any]]):
+    """Shortcut for `get_rate_limiter_registry().configure(...)`."""
+    _REGISTRY.configure(provider_configs)
+
+
+def register_provider_rate_limits(base_url: str, provider_config: Dict[str, Any]):
+    """Shortcut for `get_rate_limiter_registry().register_provider(...)` (e.g. for a user-edited base URL)."""
+    _REGISTRY.register_provider(base_url, provider_config)
+
+
+# ---------------------------------------------------------------------------
+# Error classification and retries
+# ---------------------------------------------------------------------------
+
+def is_quota_exhausted(error: BaseException) -> bool:
+    return isinstance(error, RateLimitError) and getattr(error, "code", None) in _FATAL_ERROR_CODES
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for transient failures worth retrying; False for errors a retry cannot fix."""
+    if is_quota_exhausted(error):
+        return False
+    if isinstance(error, (APITimeoutError, APIConnectionError)): # APITimeoutError subclasses APIConnectionError
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in _RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Returns the delay requested by the provider's Retry-After(-ms) header, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError: # HTTP-date form
+            return parsedate_to_datetime(retry_after).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """
+    Rough token cost of a request for TPM accounting: the prompt estimate plus the
+    completion size, capped at COMPLETION_TOKEN_ESTIMATE_CAP because `max_tokens` is only an
+    upper bound (often 65535 here) and counting it in full would serialize requests.
+    """
+    prompt_tokens = 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                prompt_tokens += IMAGE_TOKEN_ESTIMATE
+                continue
+            text = part.get("text") or ""
+            cjk_chars = sum(1 for char in text if "\u3000" <= char <= "\u9fff" or "\uac00" <= char <= "\ud7af")
+            prompt_tokens += cjk_chars + (len(text) - cjk_chars) // 4 # ~1 token per CJK char, ~4 chars per token otherwise
+    return prompt_tokens + min(int(max_tokens or 0), COMPLETION_TOKEN_ESTIMATE_CAP)
+
+
+def _retry_delay(error: BaseException, attempt: int, limiter: ModelRateLimiter, policy: RetryPolicy) -> float:
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        delay = min(max(retry_after, 0.0), MAX_RETRY_AFTER_SECONDS)
+    else:
+        delay = policy.backoff_delay(attempt)
+    if isinstance(error, RateLimitError):
+        limiter.block_for(delay) # Everyone else sending to this model backs off too
+    return delay
+
+
+def call_with_retries(send: Callable[[], Any], limiter: ModelRateLimiter, estimated_tokens: int,
+                      policy: RetryPolicy) -> Tuple[Any, int]:
+    """
+    Calls `send()` under the rate limiter, retrying retryable errors.
+
+    Returns (response, retries); re-raises the last error once retries are exhausted or
+    the error is fatal.
+    """
+    attempt = 0
+    while True:
+        limiter.acquire(estimated_tokens)
+        try:
+            return send(), attempt
+        except Exception as e:
+            limiter.release_tokens(estimated_tokens) # A failed request did not consume its tokens
+            if attempt >= policy.max_retries or not is_retryable(e):
+                raise
+            time.sleep(_retry_delay(e, attempt, limiter, policy))
+            attempt += 1
+
+
+async def async_call_with_retries(send: Callable[[], Any], limiter: ModelRateLimiter, estimated_tokens: int,
+                                  policy: RetryPolicy, slot: Optional[AsyncContextManager] = None) -> Tuple[Any, int]:
+    """
+    `call_with_retries` for coroutines: `send()` returns an awaitable and waits do not block the loop.
+
+    `slot` (e.g. the provider's semaphore) is held only while a request is in flight, not
+    while waiting for rate-limit capacity or backing off.
+    """
+    attempt = 0
+    while True:
+        await limiter.acquire_async(estimated_tokens)
+        try:
+            if slot is None:
+                return await send(), attempt
+            async with slot:
+                return await send(), attempt
+        except Exception as e:
+            limiter.release_tokens(estimated_tokens)
+            if attempt >= policy.max_retries or not is_retryable(e):
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt, limiter, policy))
+            attempt += 1
@@ -0,0 +1,181 @@
+"""
+Persistent, content-addressed cache of LLM responses.
+
+Responses are stored in a local SQLite database keyed by a hash of everything that
+determines the output (base URL, model, system message, formatted user text, image
+hash and sampling parameters). Entries expire after a per-task TTL and the store is
+kept under a size bound by evicting the least recently used entries.
+
+Lookups stay read-only in the common case: the hit/miss counters are kept in memory and
+written at most once per COUNTER_FLUSH_SECONDS (and with every store), and an entry's
+`last_access` is only rewritten when it is older than LAST_ACCESS_RESOLUTION_SECONDS,
+which is all the precision LRU eviction needs.
+
+Caching is opt-in per task via `cache_ttl_hours` in the task's `parameters` in prompts.yaml.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import atexit
+import time
+from typing import Any, Dict, Optional
+
+CACHE_DB_PATH = os.path.join(".cache", "llm_responses.sqlite3")
+MAX_CACHE_ENTRIES = 5000
+MAX_CACHE_BYTES = 200 * 1024 * 1024  # 200 MB of response text
+COUNTER_FLUSH_SECONDS = 30.0 # In-memory hit/miss/eviction counts are written at most this often
+LAST_ACCESS_RESOLUTION_SECONDS = 300.0 # A hit rewrites last_access only if it is older than this
+
+
+def make_cache_key(
+    base_url: str,
+    model: str,
+    system_message: Optional[str],
+    user_message_text: Optional[str],
+    image_data_base64: Optional[str] = None,
+    parameters: Optional[Dict[str, Any]] = None
+) -> str:
+    """Returns a stable hash identifying a request. Images are represented by their content hash."""
+    image_hash = hashlib.sha256(image_data_base64.encode("ascii")).hexdigest() if image_data_base64 else None
+    key_material = {
+        "base_url": (base_url or "").strip().rstrip("/"),
+        "model": model,
+        "system_message": system_message or "",
+        "user_message_text": user_message_text or "",
+        "image_sha256": image_hash,
+        "parameters": parameters or {},
+    }
+    serialized = json.dumps(key_material, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe SQLite response store with TTL expiry and LRU size bounding."""
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, max_entries: int = MAX_CACHE_ENTRIES, max_bytes: int = MAX_CACHE_BYTES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pending_counters: Dict[str, int] = {} # Not yet written to the counters table
+        self._counters_flushed_at = time.monotonic()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response for `key`, or None on a miss (expired entries count as misses)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, expires_at, last_access FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            self._increment_counter("misses" if row is None else "hits")
+            if row is not None and now - row[2] >= LAST_ACCESS_RESOLUTION_SECONDS:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            if time.monotonic() - self._counters_flushed_at >= COUNTER_FLUSH_SECONDS:
+                self._flush_counters()
+            return row[0] if row is not None else None
+
+    def set(self, key: str, response: str, ttl_seconds: float):
+        if not response:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, size, now, now, now + ttl_seconds)
+            )
+            self._evict(now)
+            self._flush_counters() # Already writing, so the counters go along
+
+    def _evict(self, now: float):
+        """Drops expired entries, then least recently used ones until within the entry/byte bounds."""
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        entry_count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if entry_count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        keys_to_delete = []
+        for key, size in rows:
+            if entry_count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            keys_to_delete.append((key,))
+            entry_count -= 1
+            total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", keys_to_delete)
+        self._increment_counter("evictions", len(keys_to_delete))
+
+    def _increment_counter(self, name: str, amount: int = 1):
+        if amount:
+            self._pending_counters[name] = self._pending_counters.get(name, 0) + amount
+
+    def _flush_counters(self):
+        if self._pending_counters:
+            self._conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(self._pending_counters.items())
+            )
+            self._pending_counters.clear()
+        self._counters_flushed_at = time.monotonic()
+
+    def flush(self):
+        """Writes the in-memory counters to the database (done periodically and at exit)."""
+        with self._lock:
+            self._flush_counters()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns entry count, stored bytes and the persistent hit/miss/eviction counters (including unflushed counts)."""
+        with self._lock:
+            entry_count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            for name, amount in self._pending_counters.items():
+                counters[name] = counters.get(name, 0) + amount
+        return {
+            "entries": entry_count,
+            "bytes": total_bytes,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.execute("DELETE FROM counters")
+            self._pending_counters.clear()
+
+
+_CACHE: Optional[ResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache, opening the database on first use."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ResponseCache()
+                atexit.register(_CACHE.flush)
+    return _CACHE
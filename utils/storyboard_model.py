@@ -0,0 +1,123 @@
+"""
+Versioned storyboard model (UI-free).
+
+`st.session_state.storyboard_data` stays the source of truth and is treated as
+immutable: pages replace it with a new DataFrame, never edit it in place. The model
+tracks which DataFrame it last saw, a content hash per row and a version counter that
+is bumped only when the content actually changes, so:
+
+- a rerun that did not touch the storyboard costs one identity check;
+- an edit whose rows are known (the data editor reports them) rehashes only those rows;
+- derived views (editor frame, scene lists, exports) are built once per version and
+  reused by every rerun until the next change.
+"""
+from typing import Any, Callable, Dict, Iterable, List, MutableMapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.storyboard_utils import SCENE_NUMBER_COLUMN
+
+MODEL_STATE_KEY = "storyboard_model"
+DATA_STATE_KEY = "storyboard_data"
+NARRATION_COLUMN = '中文口播文案'
+DESCRIPTION_COLUMN = '画面描述'
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Content hash of each row (vectorized; the index is ignored so renumbered copies compare equal)."""
+    if df.empty:
+        return np.empty(0, dtype=np.uint64)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class StoryboardModel:
+    """Per-row hashes, a version counter and version-memoized derived views of one storyboard."""
+
+    def __init__(self):
+        self._df: Optional[pd.DataFrame] = None
+        self._columns: tuple = ()
+        self._row_hashes = np.empty(0, dtype=np.uint64)
+        self._views: Dict[str, Any] = {}
+        self.version = 0
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """The storyboard as of the current version (an empty frame before the first sync)."""
+        return self._df if self._df is not None else pd.DataFrame()
+
+    def sync(self, df: pd.DataFrame, positions: Optional[Iterable[int]] = None) -> List[int]:
+        """
+        Makes `df` the current storyboard and returns the positions of its new or changed rows.
+
+        `positions` are the only rows that may differ from the current storyboard (same
+        columns and row count, e.g. cell edits); just those are rehashed. The version is
+        bumped whenever the content changed, including pure row deletions, which return [].
+        """
+        if df is self._df:
+            return []
+        columns = tuple(df.columns)
+        same_shape = self._df is not None and columns == self._columns and len(df) == len(self._row_hashes)
+        if positions is not None and same_shape:
+            positions = sorted({position for position in positions if 0 <= position < len(df)})
+            hashes = self._row_hashes.copy()
+            if positions:
+                hashes[positions] = row_hashes(df.iloc[positions])
+        else:
+            hashes = row_hashes(df)
+
+        if same_shape:
+            changed = np.flatnonzero(hashes != self._row_hashes).tolist()
+            content_changed = bool(changed)
+        else:
+            # Rows were added or removed: report rows whose content did not exist before
+            changed = np.flatnonzero(~np.isin(hashes, self._row_hashes)).tolist()
+            content_changed = True
+        self._df, self._columns, self._row_hashes = df, columns, hashes
+        if content_changed:
+            self.version += 1
+            self._views.clear()
+        return changed
+
+    def view(self, name: str, builder: Callable[[pd.DataFrame], Any]) -> Any:
+        """Returns `builder(df)` for the current version, building it at most once per version."""
+        if name not in self._views:
+            self._views[name] = builder(self.df)
+        return self._views[name]
+
+
+def session_storyboard_model(session_state: MutableMapping) -> StoryboardModel:
+    """Returns the session's storyboard model, synced with `storyboard_data` (created on first use)."""
+    model = session_state.get(MODEL_STATE_KEY)
+    if model is None:
+        model = session_state[MODEL_STATE_KEY] = StoryboardModel()
+    storyboard_df = session_state.get(DATA_STATE_KEY)
+    if isinstance(storyboard_df, pd.DataFrame):
+        model.sync(storyboard_df)
+    return model
+
+
+def storyboard_to_json(df: pd.DataFrame) -> str:
+    """The storyboard download: one JSON object per row."""
+    return df.to_json(orient="records", indent=4, force_ascii=False)
+
+
+def scene_rows(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Per-scene fields used by the image-to-video page, built column-wise.
+
+    Each entry has `scene_id` (`画面序号` as str, like `str(row[...])`), `description` and
+    `narration`; a missing description or narration column falls back to the page's placeholder.
+    """
+    row_count = len(df)
+
+    def column(name: str, default: str) -> list:
+        return df[name].tolist() if name in df.columns else [default] * row_count
+
+    scene_ids = [str(value) for value in column(SCENE_NUMBER_COLUMN, "")]
+    return [
+        {"scene_id": scene_id, "description": description, "narration": narration}
+        for scene_id, description, narration in zip(
+            scene_ids, column(DESCRIPTION_COLUMN, '无画面描述'), column(NARRATION_COLUMN, '无口播文案')
+        )
+    ]
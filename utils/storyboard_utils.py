@@ -0,0 +1,160 @@
+"""
+Chunked storyboard generation helpers (UI-free).
+
+A long script is split into paragraph-aligned segments that are sent as separate
+`storyboard_generation` requests, so each response stays well inside `max_tokens` and
+the segments can run concurrently. The per-segment tables are then merged in script
+order and `画面序号` is renumbered across the whole video.
+
+Selected rows of an existing storyboard can also be regenerated on their own
+(`storyboard_row_regeneration`): consecutive rows are grouped, each group is sent with
+a few neighbouring rows as context, and only the prompt and description columns of the
+replies are merged back in place.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import pandas as pd
+
+STORYBOARD_COLUMNS = ['画面序号', '中文口播文案', '文生图提示词 (英文)', '画面描述']
+SCENE_NUMBER_COLUMN = '画面序号'
+REGENERATED_COLUMNS = ['文生图提示词 (英文)', '画面描述'] # Narration must stay verbatim, so only these are replaced
+DEFAULT_SEGMENT_MAX_CHARS = 2500 # prompts.yaml `segment_max_chars` of storyboard_generation overrides this
+DEFAULT_CONTEXT_ROWS = 2 # prompts.yaml `context_rows` of storyboard_row_regeneration overrides this
+DEFAULT_MAX_ROWS_PER_REQUEST = 5 # prompts.yaml `max_rows_per_request` of storyboard_row_regeneration overrides this
+NO_CONTEXT = "（无）"
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# A sentence with its closing punctuation/quotes and trailing whitespace, so pieces re-join losslessly
+_SENTENCE = re.compile(r".+?(?:[。！？!?；;…]+[”」』\"'）)]*\s*|\.\s+|\n+|$)", re.S)
+
+
+def _pack(pieces: List[str], max_chars: int, separator: str) -> List[str]:
+    """Greedily joins consecutive pieces into chunks of at most `max_chars` (a single longer piece stays whole)."""
+    chunks, current = [], ""
+    for piece in pieces:
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if current and len(candidate) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_script_into_segments(script: str, max_chars: int = DEFAULT_SEGMENT_MAX_CHARS) -> List[str]:
+    """
+    Splits a script into segments of roughly `max_chars`, cutting only between paragraphs.
+
+    A paragraph longer than `max_chars` is split between sentences instead; a single
+    sentence is never cut. Returns [] for an empty script and [script] if it fits.
+    """
+    script = (script or "").strip()
+    if not script:
+        return []
+    if max_chars <= 0 or len(script) <= max_chars:
+        return [script]
+
+    pieces: List[str] = []
+    for paragraph in _PARAGRAPH_BREAK.split(script):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+        else:
+            sentences = [s for s in _SENTENCE.findall(paragraph) if s]
+            pieces.extend(chunk.strip() for chunk in _pack(sentences, max_chars, ""))
+    return _pack(pieces, max_chars, "\n\n")
+
+
+def merge_storyboard_segments(segment_dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates per-segment storyboard tables in order and renumbers `画面序号` from 1."""
+    frames = [df for df in segment_dfs if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=STORYBOARD_COLUMNS)
+    merged = pd.concat(frames, ignore_index=True, sort=False)
+    if SCENE_NUMBER_COLUMN in merged.columns:
+        merged[SCENE_NUMBER_COLUMN] = [str(number) for number in range(1, len(merged) + 1)]
+    return merged
+
+
+def storyboard_to_markdown(df: pd.DataFrame) -> str:
+    """Renders a storyboard DataFrame back into a Markdown table (the format the model returns)."""
+    def cell(value) -> str:
+        return "" if pd.isna(value) else str(value).replace("\n", " ").replace("|", "\\|")
+
+    columns = list(df.columns)
+    lines = ["| " + " | ".join(columns) + " |", "|" + "|".join("---" for _ in columns) + "|"]
+    for row in df.itertuples(index=False):
+        lines.append("| " + " | ".join(cell(value) for value in row) + " |")
+    return "\n".join(lines)
+
+
+@dataclass
+class RowRegenerationGroup:
+    """Consecutive rows regenerated by one request, with the neighbouring rows sent as context (row positions)."""
+    positions: List[int]
+    context_before: List[int]
+    context_after: List[int]
+
+
+def plan_row_regeneration(row_count: int, positions: Sequence[int], context_rows: int = DEFAULT_CONTEXT_ROWS,
+                          max_rows_per_request: int = DEFAULT_MAX_ROWS_PER_REQUEST) -> List[RowRegenerationGroup]:
+    """Groups the selected row positions into runs of consecutive rows (at most `max_rows_per_request` each)."""
+    selected = sorted({position for position in positions if 0 <= position < row_count})
+    max_rows_per_request = max(1, int(max_rows_per_request))
+    context_rows = max(0, int(context_rows))
+    runs: List[List[int]] = []
+    for position in selected:
+        if runs and position == runs[-1][-1] + 1 and len(runs[-1]) < max_rows_per_request:
+            runs[-1].append(position)
+        else:
+            runs.append([position])
+    return [
+        RowRegenerationGroup(
+            positions=run,
+            context_before=list(range(max(0, run[0] - context_rows), run[0])),
+            context_after=list(range(run[-1] + 1, min(row_count, run[-1] + 1 + context_rows))),
+        )
+        for run in runs
+    ]
+
+
+def rows_to_markdown(df: pd.DataFrame, positions: Sequence[int]) -> str:
+    """Renders the rows at `positions` as a Markdown table, or NO_CONTEXT if there are none."""
+    return storyboard_to_markdown(df.iloc[list(positions)]) if positions else NO_CONTEXT
+
+
+def merge_regenerated_rows(df: pd.DataFrame, positions: Sequence[int], regenerated_df: pd.DataFrame) -> Tuple[pd.DataFrame, List[int]]:
+    """
+    Copies the regenerated prompt/description of each row at `positions` into a copy of `df`.
+
+    Rows are matched by `画面序号`; if the reply lacks that column but has exactly one row
+    per target, they are matched in order. Returns (updated copy, positions the reply did
+    not cover).
+    """
+    updated = df.copy()
+    columns = [column for column in REGENERATED_COLUMNS if column in updated.columns and column in regenerated_df.columns]
+    if regenerated_df.empty or not columns:
+        return updated, list(positions)
+
+    if SCENE_NUMBER_COLUMN in regenerated_df.columns and SCENE_NUMBER_COLUMN in updated.columns:
+        replies = {str(row[SCENE_NUMBER_COLUMN]).strip(): row for _, row in regenerated_df.iterrows()}
+        matches = [(position, replies.get(str(updated.iloc[position][SCENE_NUMBER_COLUMN]).strip())) for position in positions]
+    elif len(regenerated_df) == len(positions):
+        matches = list(zip(positions, (row for _, row in regenerated_df.iterrows())))
+    else:
+        return updated, list(positions)
+
+    missing = []
+    for position, reply in matches:
+        if reply is None or not any(str(reply[column]).strip() for column in columns):
+            missing.append(position)
+            continue
+        for column in columns:
+            updated.iat[position, updated.columns.get_loc(column)] = str(reply[column]).strip()
+    return updated, missing
@@ -0,0 +1,207 @@
+"""
+Structured (JSON schema) output for storyboard and video metadata generation (UI-free).
+
+Providers that declare `structured_output: true` in prompts.yaml are asked for a JSON
+object through `response_format` (OpenAI `json_schema`, strict) instead of a Markdown
+table / free-form text, and the reply is validated locally. The prompts themselves stay
+unchanged: an instruction appended to the system message overrides their Markdown
+output format.
+
+A reply that is not valid JSON for the schema (a provider that ignores
+`response_format`, or a model that still answers in Markdown) falls back to the usual
+Markdown parsing, so the structured mode never fails where the Markdown mode would work.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.parsing_utils import parse_markdown_table_to_df
+from utils.storyboard_utils import STORYBOARD_COLUMNS
+from utils.translation_utils import strip_code_fence
+
+STORYBOARD_TASK = "storyboard_generation"
+VIDEO_METADATA_TASK = "video_metadata_generation"
+
+_STRING = {"type": "string"}
+_STRING_LIST = {"type": "array", "items": _STRING}
+
+STORYBOARD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "scenes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "scene_number": {"type": "integer"},
+                    "chinese_narration": _STRING,
+                    "image_prompt": _STRING,
+                    "scene_description": _STRING,
+                },
+                "required": ["scene_number", "chinese_narration", "image_prompt", "scene_description"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["scenes"],
+    "additionalProperties": False,
+}
+
+VIDEO_METADATA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "titles": _STRING_LIST,
+        "description": _STRING,
+        "tags": _STRING_LIST,
+        "thumbnail_prompts": _STRING_LIST,
+        "thumbnail_texts": _STRING_LIST,
+    },
+    "required": ["titles", "description", "tags", "thumbnail_prompts", "thumbnail_texts"],
+    "additionalProperties": False,
+}
+
+# JSON field of a storyboard scene -> storyboard_data column
+_SCENE_FIELD_COLUMNS = dict(zip(("scene_number", "chinese_narration", "image_prompt", "scene_description"), STORYBOARD_COLUMNS))
+
+# Markdown section heading of each metadata field in the text shown on the pages (and translated by page 06)
+METADATA_FIELD_HEADINGS = {
+    "titles": "视频标题",
+    "description": "视频描述",
+    "tags": "标签",
+    "thumbnail_prompts": "缩略图提示词",
+    "thumbnail_texts": "缩略图文字",
+}
+
+_SCHEMAS = {
+    STORYBOARD_TASK: ("storyboard", STORYBOARD_SCHEMA),
+    VIDEO_METADATA_TASK: ("video_metadata", VIDEO_METADATA_SCHEMA),
+}
+
+_OUTPUT_INSTRUCTIONS = {
+    STORYBOARD_TASK: (
+        "每个画面为 scenes 中的一项：scene_number 对应`画面序号`，chinese_narration 对应`中文口播文案`，"
+        "image_prompt 对应`文生图提示词 (英文)`，scene_description 对应`画面描述`。"
+    ),
+    VIDEO_METADATA_TASK: (
+        "titles 为标题备选，description 为完整的视频描述（含时间戳与引导语），tags 为标签（以 # 开头），"
+        "thumbnail_prompts 为缩略图提示词，thumbnail_texts 为缩略图文字备选。"
+    ),
+}
+
+
+class StructuredOutputError(Exception):
+    """A reply is not valid JSON for the task's schema."""
+
+
+def supports_structured_output(task_name: str) -> bool:
+    return task_name in _SCHEMAS
+
+
+def response_format_for(task_name: str) -> Optional[Dict[str, Any]]:
+    """The `response_format` request parameter for a task, or None if it has no schema."""
+    if task_name not in _SCHEMAS:
+        return None
+    name, schema = _SCHEMAS[task_name]
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def with_structured_output_instruction(system_message: Optional[str], task_name: str) -> Optional[str]:
+    """Appends the instruction that replaces the prompt's Markdown output format with the task's JSON object."""
+    if task_name not in _SCHEMAS:
+        return system_message
+    instruction = (
+        "【输出格式（优先于以上所有格式要求）】不要输出 Markdown 或任何解释文字，只输出一个符合给定 JSON Schema 的 JSON 对象。"
+        + _OUTPUT_INSTRUCTIONS[task_name]
+    )
+    return f"{system_message.rstrip()}\n\n{instruction}" if system_message else instruction
+
+
+def _load_object(content: str) -> Dict[str, Any]:
+    try:
+        data = json.loads(strip_code_fence(content))
+    except (json.JSONDecodeError, TypeError) as e:
+        raise StructuredOutputError(f"返回内容不是有效的 JSON：{e}") from e
+    if not isinstance(data, dict):
+        raise StructuredOutputError("返回的 JSON 不是对象。")
+    return data
+
+
+def parse_storyboard_json(content: str) -> pd.DataFrame:
+    """Validates a structured storyboard reply and returns it as storyboard_data (all cells strings)."""
+    scenes = _load_object(content).get("scenes")
+    if not isinstance(scenes, list) or not scenes:
+        raise StructuredOutputError("返回的 JSON 中缺少 scenes 列表或列表为空。")
+    rows = []
+    for index, scene in enumerate(scenes):
+        if not isinstance(scene, dict):
+            raise StructuredOutputError(f"第 {index + 1} 个画面不是对象。")
+        missing = [field for field in _SCENE_FIELD_COLUMNS if scene.get(field) in (None, "")]
+        if missing:
+            raise StructuredOutputError(f"第 {index + 1} 个画面缺少字段：{', '.join(missing)}")
+        rows.append([str(scene[field]).strip() for field in _SCENE_FIELD_COLUMNS])
+    return pd.DataFrame(rows, columns=list(_SCENE_FIELD_COLUMNS.values()))
+
+
+def parse_video_metadata_json(content: str) -> Dict[str, Any]:
+    """Validates a structured metadata reply; returns the fields with lists of strings and a string description."""
+    data = _load_object(content)
+    metadata: Dict[str, Any] = {}
+    for field in METADATA_FIELD_HEADINGS:
+        value = data.get(field)
+        if field == "description":
+            if not isinstance(value, str) or not value.strip():
+                raise StructuredOutputError("返回的 JSON 中缺少 description。")
+            metadata[field] = value.strip()
+        else:
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise StructuredOutputError(f"返回的 JSON 中 {field} 不是字符串列表。")
+            metadata[field] = [item.strip() for item in value if item.strip()]
+    if not metadata["titles"]:
+        raise StructuredOutputError("返回的 JSON 中 titles 为空。")
+    return metadata
+
+
+def format_video_metadata(metadata: Dict[str, Any]) -> str:
+    """Renders structured metadata as the Markdown text the metadata page shows and page 06 translates."""
+    sections: List[str] = []
+    for field, heading in METADATA_FIELD_HEADINGS.items():
+        value = metadata.get(field)
+        if not value:
+            continue
+        if isinstance(value, str):
+            body = value
+        elif field == "tags":
+            body = " ".join(value)
+        else:
+            body = "\n".join(f"{index}. {item}" for index, item in enumerate(value, start=1))
+        sections.append(f"## {heading}\n\n{body}")
+    return "\n\n".join(sections)
+
+
+def parse_storyboard_response(content: str, structured: bool) -> pd.DataFrame:
+    """
+    Returns the storyboard in a reply: the validated JSON when `structured`, otherwise (or
+    if the JSON is unusable) the parsed Markdown table. Empty if neither is found.
+    """
+    if structured:
+        try:
+            return parse_storyboard_json(content)
+        except StructuredOutputError:
+            pass
+    return parse_markdown_table_to_df(content)
+
+
+def parse_video_metadata_response(content: str, structured: bool) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Returns (metadata text, fields): the fields are the validated JSON when `structured`
+    and the text is rendered from them; otherwise (or if the JSON is unusable) the reply
+    is used as the text as-is and the fields are None.
+    """
+    if structured:
+        try:
+            metadata = parse_video_metadata_json(content)
+            return format_video_metadata(metadata), metadata
+        except StructuredOutputError:
+            pass
+    return content, None
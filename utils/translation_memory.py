@@ -0,0 +1,164 @@
+"""
+Translation memory for the scene-batched MD report translation.
+
+Every translated narration (and metadata text) is stored in a local SQLite database
+keyed by (hash of the source text, target language, prompt version). When a report is
+translated again after an edit, scenes whose narration is unchanged are filled from the
+memory and only new or changed scenes (and the metadata, if it changed) are sent to the
+API. The prompt version is a hash of the task's system message and template, so editing
+the translation prompt in prompts.yaml invalidates the memory for that task.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.prompt_index import CompiledPrompt
+from utils.translation_utils import (
+    DEFAULT_SCENE_BATCH_SIZE, METADATA_TASK, PART_SCENES, SCENE_BATCH_TASK, LanguageTranslation, TranslationRequest,
+    plan_translation_requests
+)
+
+TRANSLATION_MEMORY_DB_PATH = os.path.join(".cache", "translation_memory.sqlite3")
+
+
+def source_hash(text: str) -> str:
+    return hashlib.sha256((text or "").strip().encode("utf-8")).hexdigest()
+
+
+def prompt_version(prompt: Optional[CompiledPrompt]) -> str:
+    """Short hash of the prompt text a translation was produced with."""
+    if prompt is None:
+        return ""
+    material = "\0".join((prompt.task, prompt.system_message or "", prompt.user_message_template or ""))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+class TranslationMemory:
+    """Thread-safe SQLite store of source text → translation per (language, prompt version)."""
+
+    def __init__(self, db_path: str = TRANSLATION_MEMORY_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                source_hash TEXT NOT NULL,
+                target_language TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                source_text TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (source_hash, target_language, prompt_version)
+            )"""
+        )
+
+    def get_many(self, source_texts: Iterable[str], target_language: str, version: str) -> Dict[str, str]:
+        """Returns {source_hash: translation} for the texts found in the memory."""
+        hashes = list({source_hash(text) for text in source_texts})
+        found: Dict[str, str] = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500): # Stay below SQLite's host parameter limit
+                chunk = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT source_hash, translation FROM translations WHERE target_language = ? AND prompt_version = ? "
+                    f"AND source_hash IN ({', '.join('?' for _ in chunk)})",
+                    (target_language, version, *chunk)
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, str]], target_language: str, version: str):
+        """Stores (source_text, translation) pairs, replacing older translations of the same text."""
+        now = time.time()
+        rows = [
+            (source_hash(source), target_language, version, source, translation, now)
+            for source, translation in entries if (source or "").strip() and translation
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (source_hash, target_language, prompt_version, source_text, translation, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM translations")
+
+
+def plan_with_memory(memory: Optional[TranslationMemory], target_language: str, scenes: List[Dict[str, str]],
+                     video_metadata_text: str, prompt_versions: Dict[str, str],
+                     batch_size: int = DEFAULT_SCENE_BATCH_SIZE) -> LanguageTranslation:
+    """
+    Plans a language's scene-batched translation, filling scenes (and the metadata) the
+    memory already knows, so only the remaining ones become requests. Pass `memory=None`
+    to translate everything.
+
+    `prompt_versions` maps SCENE_BATCH_TASK / METADATA_TASK to their `prompt_version`.
+    """
+    # Keyed by scene position; scenes without narration have nothing to translate
+    reused: Dict[int, str] = {position: "" for position, scene in enumerate(scenes) if not scene["chinese_narration"].strip()}
+    translated_metadata = None
+    if memory is not None:
+        known = memory.get_many((scene["chinese_narration"] for scene in scenes), target_language,
+                                prompt_versions.get(SCENE_BATCH_TASK, ""))
+        for position, scene in enumerate(scenes):
+            translation = known.get(source_hash(scene["chinese_narration"]))
+            if translation and position not in reused:
+                reused[position] = translation
+        translated_metadata = memory.get_many([video_metadata_text], target_language,
+                                              prompt_versions.get(METADATA_TASK, "")).get(source_hash(video_metadata_text))
+
+    missing_positions = [position for position in range(len(scenes)) if position not in reused]
+    return LanguageTranslation(
+        target_language=target_language,
+        scenes=scenes,
+        video_metadata_text=video_metadata_text,
+        requests=plan_translation_requests(scenes, video_metadata_text, target_language, batch_size, missing_positions),
+        translated_metadata=translated_metadata,
+        reused_translations=reused,
+        metadata_reused=translated_metadata is not None,
+    )
+
+
+def remember_response(memory: Optional[TranslationMemory], translation: LanguageTranslation,
+                      request: TranslationRequest, prompt_versions: Dict[str, str]):
+    """Stores the result of a request that `translation.add_response` accepted."""
+    if memory is None:
+        return
+    version = prompt_versions.get(request.task_name, "")
+    if request.part == PART_SCENES:
+        batch = translation.scene_translations.get(request.batch_index, {})
+        memory.put_many(((translation.scenes[position]["chinese_narration"], text) for position, text in batch.items()),
+                        translation.target_language, version)
+    elif translation.translated_metadata:
+        memory.put_many([(translation.video_metadata_text, translation.translated_metadata)], translation.target_language, version)
+
+
+_MEMORY: Optional[TranslationMemory] = None
+_MEMORY_LOCK = threading.Lock()
+
+
+def get_translation_memory() -> TranslationMemory:
+    """Returns the process-wide translation memory, opening the database on first use."""
+    global _MEMORY
+    if _MEMORY is None:
+        with _MEMORY_LOCK:
+            if _MEMORY is None:
+                _MEMORY = TranslationMemory()
+    return _MEMORY
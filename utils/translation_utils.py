@@ -0,0 +1,276 @@
+"""
+Scene-batched translation of the MD report (UI-free).
+
+Instead of one `translate_and_format_to_md_zh` request per language that returns the
+whole report, the narration is translated in batches of scenes (`translate_scene_batch`,
+JSON in and out) and the metadata on its own (`translate_video_metadata`). The requests
+are small, run concurrently and can be retried one by one; `build_md_report` then
+assembles the same report layout locally, so the formatting is always exact.
+
+Translations are keyed by the scene's position in the scene list, not by `画面序号`,
+which the user may have left blank or repeated; the batch sent to the model numbers its
+scenes by position (`scene_key`) for the same reason.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+SCENE_BATCH_TASK = "translate_scene_batch"
+METADATA_TASK = "translate_video_metadata"
+DEFAULT_SCENE_BATCH_SIZE = 15 # prompts.yaml `scene_batch_size` of translate_scene_batch overrides this
+
+PART_SCENES = "scenes"
+PART_METADATA = "metadata"
+
+# Languages written without spaces between sentences
+_UNSPACED_LANGUAGES = {"Japanese", "Simplified Chinese", "Traditional Chinese"}
+
+_CODE_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*\n(.*?)\n?\s*```\s*$", re.S)
+
+
+class TranslationError(Exception):
+    """A translation response could not be used (invalid JSON, missing scenes, ...)."""
+
+
+@dataclass
+class TranslationRequest:
+    """One request of a scene-batched translation: a batch of scenes or the metadata."""
+    part: str # PART_SCENES or PART_METADATA
+    batch_index: int
+    task_name: str
+    variables: Dict[str, Any]
+    scene_positions: List[int] = field(default_factory=list) # Positions in the scene list, in batch order
+
+
+def build_scenes(storyboard_df) -> List[Dict[str, str]]:
+    """The {scene_number, chinese_narration} scenes of a storyboard DataFrame, built column-wise (no per-row Series)."""
+    if storyboard_df.empty or "中文口播文案" not in storyboard_df.columns:
+        return []
+    if "画面序号" in storyboard_df.columns:
+        scene_numbers = storyboard_df["画面序号"].tolist()
+    else:
+        scene_numbers = [label + 1 for label in storyboard_df.index]
+    return [
+        {"scene_number": str(scene_number), "chinese_narration": str(narration)}
+        for scene_number, narration in zip(scene_numbers, storyboard_df["中文口播文案"].tolist())
+    ]
+
+
+def scenes_to_json(scenes: List[Dict[str, str]]) -> str:
+    """Serializes scenes as the `{"scenes": [...]}` JSON the MD report prompt expects."""
+    return json.dumps({"scenes": scenes}, ensure_ascii=False, indent=2)
+
+
+def build_scenes_json(storyboard_df) -> str:
+    """Builds the scenes JSON of a storyboard (what page 06 shows for editing and the pipeline translates)."""
+    return scenes_to_json(build_scenes(storyboard_df))
+
+
+def normalize_scenes(scenes: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Returns parsed scenes as {scene_number, chinese_narration} dicts of strings."""
+    return [
+        {"scene_number": str(scene.get("scene_number", index + 1)), "chinese_narration": str(scene.get("chinese_narration", ""))}
+        for index, scene in enumerate(scenes)
+    ]
+
+
+def parse_scenes_json(storyboard_scenes_json: str) -> List[Dict[str, str]]:
+    """Returns the `scenes` of the page 06 / pipeline scenes JSON as {scene_number, chinese_narration} dicts."""
+    return normalize_scenes(json.loads(storyboard_scenes_json).get("scenes") or [])
+
+
+def scene_key(position: int) -> str:
+    """The `scene_number` a scene is sent (and must be returned) under: its 1-based position, unique by construction."""
+    return str(position + 1)
+
+
+def plan_translation_requests(scenes: List[Dict[str, str]], video_metadata_text: str, target_language: str,
+                              batch_size: int = DEFAULT_SCENE_BATCH_SIZE,
+                              positions: Optional[List[int]] = None) -> List[TranslationRequest]:
+    """
+    Splits one language's translation into scene-batch requests plus one metadata request.
+
+    `positions` selects the scenes to translate (all of them by default).
+    """
+    batch_size = max(1, int(batch_size))
+    positions = list(range(len(scenes))) if positions is None else positions
+    requests = []
+    for batch_index, start in enumerate(range(0, len(positions), batch_size)):
+        batch_positions = positions[start:start + batch_size]
+        batch = [
+            {"scene_number": scene_key(position), "chinese_narration": scenes[position]["chinese_narration"]}
+            for position in batch_positions
+        ]
+        requests.append(TranslationRequest(
+            part=PART_SCENES,
+            batch_index=batch_index,
+            task_name=SCENE_BATCH_TASK,
+            variables={"target_language": target_language, "scenes_json": json.dumps(batch, ensure_ascii=False, indent=2)},
+            scene_positions=batch_positions,
+        ))
+    requests.append(TranslationRequest(
+        part=PART_METADATA,
+        batch_index=0,
+        task_name=METADATA_TASK,
+        variables={"target_language": target_language, "video_metadata_text": video_metadata_text},
+    ))
+    return requests
+
+
+def strip_code_fence(content: str) -> str:
+    """Removes a Markdown code fence wrapped around the whole response, which models add despite instructions."""
+    match = _CODE_FENCE.match(content or "")
+    return match.group(1) if match else (content or "").strip()
+
+
+def parse_scene_batch_translation(content: str, scene_numbers: List[str]) -> Dict[str, str]:
+    """
+    Parses a `translate_scene_batch` response into {scene_number: translation} for the
+    (unique) `scene_numbers` the batch was sent with.
+
+    Raises TranslationError if the JSON is invalid or any scene of the batch is missing.
+    """
+    text = strip_code_fence(content)
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}") # Tolerate stray text around the object
+        try:
+            payload = json.loads(text[start:end + 1]) if start != -1 and end > start else None
+        except json.JSONDecodeError:
+            payload = None
+    if not isinstance(payload, dict) or not isinstance(payload.get("translations"), list):
+        raise TranslationError("翻译结果不是有效的 JSON（缺少 translations 列表）")
+
+    translations = {}
+    for item in payload["translations"]:
+        if isinstance(item, dict) and item.get("scene_number") is not None:
+            translations[str(item["scene_number"]).strip()] = str(item.get("translation") or "").strip()
+    missing = [number for number in scene_numbers if not translations.get(number)]
+    if missing:
+        raise TranslationError("翻译结果缺少场景：" + ", ".join(missing))
+    return {number: translations[number] for number in scene_numbers}
+
+
+def parse_translation_response(request: TranslationRequest, content: str):
+    """Returns the usable result of a request: {scene position: translation} or the translated metadata text."""
+    if request.part == PART_SCENES:
+        translations = parse_scene_batch_translation(content, [scene_key(position) for position in request.scene_positions])
+        return {position: translations[scene_key(position)] for position in request.scene_positions}
+    metadata = strip_code_fence(content)
+    if not metadata:
+        raise TranslationError("元数据翻译结果为空")
+    return metadata
+
+
+def _table_cell(text: str) -> str:
+    return str(text).strip().replace("|", "\\|").replace("\r\n", "\n").replace("\n", "<br>")
+
+
+def build_md_report(target_language: str, scenes: List[Dict[str, str]], translations: Dict[int, str],
+                    video_metadata_text: str, translated_metadata: str) -> str:
+    """
+    Assembles the MD report (same layout `translate_and_format_to_md_zh` asks the model for)
+    from {scene position: translation}.
+    """
+    lines = [
+        f"# 视频脚本内容 ({target_language})",
+        "",
+        "## 1. 分镜口播对照表",
+        "",
+        f"| 画面序号 | 源中文口播文案 | 翻译后的口播文案 ({target_language}) |",
+        "|---|---|---|",
+    ]
+    for position, scene in enumerate(scenes):
+        lines.append(
+            f"| {_table_cell(scene['scene_number'])} | {_table_cell(scene['chinese_narration'])} | {_table_cell(translations.get(position, ''))} |"
+        )
+
+    separator = "" if target_language in _UNSPACED_LANGUAGES else " "
+    translated_narration = separator.join(translations.get(position, "").strip() for position in range(len(scenes)))
+    lines += [
+        "",
+        f"## 2. 汇总的翻译后口播文案 ({target_language})",
+        "",
+        translated_narration,
+        "",
+        "## 3. 视频元数据",
+        "",
+        "### 中文元数据 (源语言)",
+        "",
+        video_metadata_text.strip(),
+        "",
+        f"### 翻译后的元数据 ({target_language})",
+        "",
+        translated_metadata.strip(),
+        "",
+    ]
+    return "\n".join(lines)
+
+
+@dataclass
+class LanguageTranslation:
+    """
+    Collected results of one language's scene-batched translation.
+
+    Results are kept per request, so after a partial failure only the missing requests
+    need to be sent again (`pending`).
+    """
+    target_language: str
+    scenes: List[Dict[str, str]]
+    video_metadata_text: str
+    requests: List[TranslationRequest]
+    scene_translations: Dict[int, Dict[int, str]] = field(default_factory=dict) # batch index -> {scene position: translation}
+    translated_metadata: Optional[str] = None
+    errors: Dict[str, str] = field(default_factory=dict) # request key -> last error
+    reused_translations: Dict[int, str] = field(default_factory=dict) # scene position -> translation from the translation memory
+    metadata_reused: bool = False
+
+    @staticmethod
+    def request_key(request: TranslationRequest) -> str:
+        return f"{request.part}:{request.batch_index}"
+
+    def pending(self) -> List[TranslationRequest]:
+        return [
+            request for request in self.requests
+            if (request.part == PART_SCENES and request.batch_index not in self.scene_translations)
+            or (request.part == PART_METADATA and self.translated_metadata is None)
+        ]
+
+    def add_response(self, request: TranslationRequest, content: Optional[str], error_message: Optional[str] = None) -> bool:
+        """Stores a response (or records its error); returns True if it was usable."""
+        key = self.request_key(request)
+        if error_message is None:
+            try:
+                parsed = parse_translation_response(request, content)
+            except TranslationError as e:
+                error_message = str(e)
+        if error_message is not None:
+            self.errors[key] = error_message
+            return False
+        self.errors.pop(key, None)
+        if request.part == PART_SCENES:
+            self.scene_translations[request.batch_index] = parsed
+        else:
+            self.translated_metadata = parsed
+        return True
+
+    @property
+    def complete(self) -> bool:
+        return not self.pending()
+
+    def report(self) -> str:
+        translations: Dict[int, str] = dict(self.reused_translations)
+        for batch in self.scene_translations.values():
+            translations.update(batch)
+        return build_md_report(self.target_language, self.scenes, translations, self.video_metadata_text,
+                               self.translated_metadata or "")
+
+
+def describe_request(request: TranslationRequest) -> str:
+    if request.part == PART_METADATA:
+        return "元数据"
+    if not request.scene_positions:
+        return f"场景批次 {request.batch_index + 1}"
+    return f"第 {request.scene_positions[0] + 1}-{request.scene_positions[-1] + 1} 个场景"